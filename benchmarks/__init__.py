@@ -0,0 +1,3 @@
+"""
+解析処理のベンチマーク（リポジトリのルートで python -m benchmarks.<名前> として実行する）。
+"""
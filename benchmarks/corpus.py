@@ -0,0 +1,126 @@
+"""
+ベンチマーク用の合成 HTML（Moodle のカレンダー・ダッシュボード・課題一覧ページに似せたもの）。
+乱数の種を固定しているため、同じ引数なら毎回同じページになる。
+"""
+import random
+
+BASE = "https://moodle.example.ac.jp"
+
+_COURSES = ["線形代数", "英語コミュニケーション", "プログラミング演習", "物理学実験", "統計学", "情報倫理"]
+
+
+def _course_select(n_courses: int) -> str:
+    options = "".join(
+        f'<option value="{100 + i}">{_COURSES[i % len(_COURSES)]} {i:02d}</option>' for i in range(n_courses)
+    )
+    return f'<select class="cal_courses_flt custom-select"><option value="1">すべての授業科目</option>{options}</select>'
+
+
+def _page(body: str, theme: str = "boost") -> str:
+    return (
+        '<!DOCTYPE html><html lang="ja"><head><meta charset="utf-8"><title>Moodle</title>'
+        f'<link rel="stylesheet" href="{BASE}/theme/styles.php/{theme}/1700000000_1/all">'
+        f'</head><body class="theme_{theme} pagelayout-mydashboard">{body}</body></html>'
+    )
+
+
+def calendar_page(n_events: int, n_courses: int = 12, seed: int = 0) -> str:
+    """「今後の予定」ページ（.event 要素が n_events 個）。"""
+    rnd = random.Random(seed)
+    events = []
+    for i in range(n_events):
+        cid = 100 + rnd.randrange(n_courses)
+        mod = "assign" if i % 4 else "quiz"
+        events.append(
+            f'<div data-courseid="{cid}"><div class="event mt-3" data-type="event" data-event-id="{5000 + i}">'
+            f'<div class="card"><div class="card-header"><h3 class="name d-inline-block">'
+            f'<a href="{BASE}/mod/{mod}/view.php?id={9000 + i}">第{i + 1}回 レポート</a></h3></div>'
+            f'<div class="card-body"><div class="row"><div class="col-1"><i class="icon fa fa-clock-o"></i></div>'
+            f'<div class="col-11"><span class="date">2030年 {1 + i % 12}月 {1 + i % 28}日(月曜日) {i % 24}:{i % 60:02d}</span>'
+            f'</div></div><div class="description">説明文 {"テキスト " * rnd.randrange(3, 12)}</div></div></div></div></div>'
+        )
+    return _page(_course_select(n_courses) + '<div class="calendarwrapper">' + "".join(events) + "</div>")
+
+
+def dashboard_page(n_links: int, depth: int = 4, n_courses: int = 12, noise_links: int = 0, seed: int = 0) -> str:
+    """
+    ダッシュボード（/my/）。課題リンクが n_links 個、それぞれ depth 段入れ子の div の中にある。
+    noise_links は課題以外のリンク数（リンクの多いページで parent.parents の探索が重くなる）。
+    """
+    rnd = random.Random(seed)
+    blocks = []
+    for i in range(n_links):
+        cid = 100 + rnd.randrange(n_courses)
+        inner = (
+            f'<li class="event-item"><a href="{BASE}/mod/assign/view.php?id={9000 + i}" title="課題 {i}">課題 {i}</a>'
+            f' <span class="date">2030-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:00</span></li>'
+        )
+        for d in range(depth):
+            inner = f'<div class="nest-{d}">{inner}</div>'
+        blocks.append(f'<div class="block" data-courseid="{cid}">{inner}</div>')
+    noise = "".join(
+        f'<a href="{BASE}/course/view.php?id={100 + j % n_courses}">{_COURSES[j % len(_COURSES)]}</a>'
+        f'<a href="{BASE}/calendar/view.php?course={100 + j % n_courses}">予定</a>'
+        for j in range(noise_links)
+    )
+    return _page(_course_select(n_courses) + f'<nav>{noise}</nav><section id="region-main">{"".join(blocks)}</section>')
+
+
+def assign_index_page(n_rows: int, seed: int = 0) -> str:
+    """授業の課題一覧ページ（mod/assign/index.php）。"""
+    rnd = random.Random(seed)
+    rows = "".join(
+        f'<tr><td class="cell c0">{1 + i // 3}</td><td class="cell c1"><a href="view.php?id={9000 + i}">課題 {i}</a></td>'
+        f'<td class="cell c2">2030年 {1 + i % 12}月 {1 + i % 28}日({"月火水木金"[rnd.randrange(5)]}曜日) 23:59</td>'
+        f'<td class="cell c3">{rnd.randrange(40)}</td></tr>'
+        for i in range(n_rows)
+    )
+    return _page(
+        '<table class="generaltable"><thead><tr><th class="header c0">トピック</th><th class="header c1">課題</th>'
+        f'<th class="header c2">終了日時</th><th class="header c3">提出</th></tr></thead><tbody>{rows}</tbody></table>'
+    )
+
+
+def _filler(n: int) -> str:
+    """判定対象ではない要素（リンク・フォームを含むブロック）を n 個。"""
+    return "".join(
+        f'<div class="block"><a href="{BASE}/course/view.php?id={100 + i}">授業 {i}</a>'
+        f'<form action="{BASE}/search/index.php" method="get"><input name="q" type="text"></form></div>'
+        for i in range(n)
+    )
+
+
+def portal_page(n_links: int) -> str:
+    """リンクの多いポータルページ。ログインリンクは末尾のフッターにだけある（_find_login_link の最悪ケース）。"""
+    links = "".join(f'<li><a href="{BASE}/info/{i}.html" class="item">お知らせ {i}</a></li>' for i in range(n_links))
+    return _page(
+        f'<header><a href="{BASE}/">トップ</a><a href="{BASE}/help">ヘルプ</a></header>'
+        f'<main><ul>{links}</ul></main><footer><a href="{BASE}/login/index.php">ログイン</a></footer>'
+    )
+
+
+def sso_gateway_page(n_filler: int = 0) -> str:
+    """hidden のみのフォームで認証サーバーへ POST する SSO ゲートウェイ。"""
+    return _page(
+        _filler(n_filler)
+        + '<form method="post" action="https://idp.example.ac.jp/AuthServer/MultiAuth">'
+        '<input type="hidden" name="relay" value="xyz"><input type="hidden" name="ticket" value="abc"></form>'
+    )
+
+
+def reauth_page(n_filler: int = 0) -> str:
+    """2FA 再認証（SM_UID + SM_PWD）のページ。"""
+    return _page(
+        _filler(n_filler)
+        + '<form method="post" action="https://idp.example.ac.jp/SMAuthenticator/login">'
+        '<input type="text" name="SM_UID"><input type="password" name="SM_PWD"><input type="text" name="otp"></form>'
+    )
+
+
+def saml_redirect_page(n_filler: int = 0) -> str:
+    """認証完了後に GET で Moodle へ戻る SAML リダイレクトページ。"""
+    return _page(
+        _filler(n_filler)
+        + f'<form method="get" action="{BASE}/Shibboleth.sso/SAML2/AuthnRequestReceiver">'
+        '<input type="hidden" name="SAMLRequest" value="PHNhbWw+"><input type="hidden" name="RelayState" value="ss:1"></form>'
+    )
@@ -0,0 +1,254 @@
+"""
+解析処理（CPU のみ）のマイクロベンチマーク。保存したベースラインと比べ、しきい値を超えて遅くなったら失敗する。
+
+対象: _parse_date / _find_login_link / _is_sso_gateway_page / _is_2fa_reauth_page / _is_saml_redirect_page /
+      _parse_calendar_html / _parse_my_html / format_reminder_message
+コーパス: benchmarks/corpus.py の合成ページ（--sizes の件数ごと。入れ子の深いダッシュボード、
+          リンクの多いダッシュボードを含む）と、--recorded で指定した記録済みページ（main.py --record）
+
+使い方（リポジトリのルートで）:
+  python -m benchmarks.micro --save-baseline              # 変更前にベースラインを保存
+  python -m benchmarks.micro                              # 変更後に比較（遅くなっていたら・ベースラインがなければ終了コード 1）
+  python -m benchmarks.micro --filter _parse_my_html --sizes 10,100,1000,3000
+  python -m benchmarks.micro --recorded recorded/2025-02-15 --json result.json
+
+ベースラインはマシンに依存するため、比較は同じマシンで行う。
+関数ごとのしきい値はベースラインファイルの "thresholds" で上書きできる（例: {"_parse_my_html": 0.4}）。
+"""
+import argparse
+import json
+import math
+import platform
+import sys
+import tempfile
+import timeit
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+import config
+
+# レイアウトキャッシュ等を本番の STATE_DIR に書かないよう、moodle_scraper 等を読み込む前に一時ディレクトリへ向ける
+# （環境変数 STATE_DIR は .env で上書きされるため、読み込んだ設定を直接変える）
+_cfg = config.settings()
+_cfg.STATE_DIR = _cfg.BASE_STATE_DIR = Path(tempfile.mkdtemp(prefix="micro-bench-"))
+
+import moodle_scraper as ms  # noqa: E402
+import recorded_pages  # noqa: E402
+from benchmarks import corpus  # noqa: E402
+from line_sender import format_reminder_message  # noqa: E402
+from models import Assignment  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_SIZES = (10, 100, 1000)
+
+_DATE_SAMPLES = {
+    "iso": "2030-01-15 23:59",
+    "ja": "2030年1月15日 23:59",
+    "ja-weekday": "2030年 1月 15日(火曜日) 23:59",
+    "en-weekday": "Tuesday, 15 January 2030, 11:59 PM",
+    "invalid": "締切なし",
+}
+
+
+@dataclass
+class Case:
+    func: str
+    variant: str
+    size: int
+    run: Callable[[], object]
+
+    @property
+    def id(self) -> str:
+        return f"{self.func}[{self.variant}:{self.size}]"
+
+
+@dataclass
+class Result:
+    case: Case
+    ops_per_sec: float
+
+    @property
+    def us_per_op(self) -> float:
+        return 1e6 / self.ops_per_sec
+
+
+def _synthetic_cases(sizes: list[int]) -> list[Case]:
+    cases = [
+        Case("_parse_date", name, 1, lambda t=text: ms._parse_date(t)) for name, text in _DATE_SAMPLES.items()
+    ]
+    for n in sizes:
+        portal = ms._soup(corpus.portal_page(n))
+        dashboard = ms._soup(corpus.dashboard_page(n, depth=4))
+        cases.append(Case("_find_login_link", "portal", n, lambda s=portal: ms._find_login_link(s, corpus.BASE + "/")))
+        for func, page in (
+            (ms._is_sso_gateway_page, corpus.sso_gateway_page),
+            (ms._is_2fa_reauth_page, corpus.reauth_page),
+            (ms._is_saml_redirect_page, corpus.saml_redirect_page),
+        ):
+            soup = ms._soup(page(n))
+            cases.append(Case(func.__name__, "match", n, lambda f=func, s=soup: f(s)))
+            cases.append(Case(func.__name__, "dashboard", n, lambda f=func, s=dashboard: f(s)))
+
+        calendar = corpus.calendar_page(n)
+        cases.append(Case("_parse_calendar_html", "events", n, lambda h=calendar: ms._parse_calendar_html(h, corpus.BASE, {})))
+        for variant, html in (
+            ("flat", corpus.dashboard_page(n, depth=1)),
+            ("nested", corpus.dashboard_page(n, depth=16)),
+            ("link-heavy", corpus.dashboard_page(n, depth=4, noise_links=n * 4)),
+        ):
+            cases.append(Case("_parse_my_html", variant, n, lambda h=html: ms._parse_my_html(h, corpus.BASE, {})))
+
+        now = datetime(2030, 1, 1)
+        assignments = [
+            Assignment(f"第{i + 1}回 レポート", now + timedelta(hours=i), f"授業 {i % 12}",
+                       f"{corpus.BASE}/mod/assign/view.php?id={9000 + i}", "説明文")
+            for i in range(n)
+        ]
+        cases.append(Case("format_reminder_message", "assignments", n, lambda a=assignments: format_reminder_message(a, 7)))
+    return cases
+
+
+def _recorded_cases(directory: Path) -> list[Case]:
+    """記録済みページ。URL からページの種類を判定し、該当する抽出関数と全判定関数を計測する。"""
+    cases: list[Case] = []
+    for entry, html in recorded_pages.iter_recorded(directory):
+        if entry["method"] != "GET" or not html.strip():
+            continue
+        label = f"recorded:{directory.name}/{entry['body']}"
+        size = len(html.encode("utf-8"))
+        soup = ms._soup(html)
+        parts = urlsplit(entry["url"])
+        base = f"{parts.scheme}://{parts.netloc}"
+        if "/calendar/" in entry["url"]:
+            cases.append(Case("_parse_calendar_html", label, size, lambda h=html, b=base: ms._parse_calendar_html(h, b, {})))
+        elif "/my/" in entry["url"]:
+            cases.append(Case("_parse_my_html", label, size, lambda h=html, b=base: ms._parse_my_html(h, b, {})))
+        cases.append(Case("_find_login_link", label, size, lambda s=soup, u=entry["url"]: ms._find_login_link(s, u)))
+        for func in (ms._is_sso_gateway_page, ms._is_2fa_reauth_page, ms._is_saml_redirect_page):
+            cases.append(Case(func.__name__, label, size, lambda f=func, s=soup: f(s)))
+    return cases
+
+
+def measure(case: Case, min_time: float, repeat: int) -> Result:
+    """min_time 秒以上かかる回数を求め、それを repeat 回測った最短から ops/s を出す。"""
+    timer = timeit.Timer(case.run)
+    number, _ = timer.autorange()
+    number = max(1, math.ceil(number * min_time / 0.2))
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return Result(case, number / best)
+
+
+def _scaling_exponent(points: list[tuple[int, float]]) -> Optional[float]:
+    """サイズと 1 回あたりの時間の両対数の傾き（1 で線形、2 で 2 乗）。"""
+    points = [(n, t) for n, t in points if n > 0 and t > 0]
+    if len(points) < 2:
+        return None
+    xs = [math.log(n) for n, _ in points]
+    ys = [math.log(t) for _, t in points]
+    mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+    var = sum((x - mx) ** 2 for x in xs)
+    return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / var if var else None
+
+
+def _load_baseline(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="解析処理のマイクロベンチマーク（ベースラインとの比較）")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="合成ページの件数（カンマ区切り）")
+    parser.add_argument("--recorded", type=Path, action="append", default=[], help="記録済みページのディレクトリ（複数可）")
+    parser.add_argument("--filter", help="この文字列を含むケースだけを実行")
+    parser.add_argument("--min-time", type=float, default=0.2, help="1 回の計測の最短時間（秒）")
+    parser.add_argument("--repeat", type=int, default=5, help="計測回数（最短を採用）")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="今回の結果をベースラインとして保存する")
+    parser.add_argument("--threshold", type=float, help=f"許容する低下率（デフォルトはベースラインの値か {DEFAULT_THRESHOLD}）")
+    parser.add_argument("--json", type=Path, help="結果（スケーリング曲線を含む）を JSON で保存する")
+    args = parser.parse_args(argv)
+
+    cases = _synthetic_cases([int(s) for s in args.sizes.split(",") if s.strip()])
+    for directory in args.recorded:
+        cases.extend(_recorded_cases(directory))
+    if args.filter:
+        cases = [c for c in cases if args.filter in c.id]
+    if not cases:
+        print("実行するケースがありません", file=sys.stderr)
+        return 2
+
+    baseline = _load_baseline(args.baseline)
+    base_results = baseline.get("results", {})
+    default_threshold = args.threshold if args.threshold is not None else baseline.get("default_threshold", DEFAULT_THRESHOLD)
+    thresholds = baseline.get("thresholds", {})
+
+    print(f"python {platform.python_version()} / {platform.machine()} / baseline: "
+          f"{args.baseline if base_results else 'なし'}")
+    print(f"{'case':<58} {'ops/s':>11} {'us/op':>10} {'baseline':>11} {'change':>8}")
+    results: list[Result] = []
+    regressions: list[str] = []
+    for case in cases:
+        r = measure(case, args.min_time, args.repeat)
+        results.append(r)
+        base = base_results.get(case.id, {}).get("ops_per_sec")
+        change = ""
+        if base:
+            ratio = r.ops_per_sec / base
+            limit = thresholds.get(case.func, default_threshold)
+            change = f"{(ratio - 1) * 100:+.1f}%"
+            if ratio < 1 - limit:
+                change += " !"
+                regressions.append(f"{case.id}: {base:.1f} -> {r.ops_per_sec:.1f} ops/s（許容 -{limit * 100:.0f}%）")
+        print(f"{case.id:<58} {r.ops_per_sec:11.1f} {r.us_per_op:10.1f} {base or 0:11.1f} {change:>8}")
+
+    # スケーリング曲線（関数・種類ごとの サイズ -> 1 回あたりの時間）
+    curves: dict[str, list[tuple[int, float]]] = {}
+    for r in results:
+        if not r.case.variant.startswith("recorded:") and r.case.size > 1:
+            curves.setdefault(f"{r.case.func}[{r.case.variant}]", []).append((r.case.size, r.us_per_op))
+    if curves:
+        print("\nscaling（サイズに対する時間の伸び。1.0 で線形）")
+        for name, points in curves.items():
+            exp = _scaling_exponent(points)
+            curve = "  ".join(f"{n}:{t:.0f}us" for n, t in points)
+            print(f"  {name:<44} {'-' if exp is None else f'{exp:.2f}':>5}   {curve}")
+
+    data = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} {platform.processor()}".strip(),
+        "results": {r.case.id: {"ops_per_sec": round(r.ops_per_sec, 3), "size": r.case.size} for r in results},
+        "scaling": {name: {"points": points, "exponent": _scaling_exponent(points)} for name, points in curves.items()},
+    }
+    if args.json:
+        args.json.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        # しきい値の設定は残し、結果だけ置き換える（--filter 時は対象外のケースも残す）
+        saved = dict(baseline)
+        saved.update({k: data[k] for k in ("created_at", "python", "machine")})
+        saved["results"] = {**base_results, **data["results"]} if args.filter else data["results"]
+        saved.setdefault("default_threshold", DEFAULT_THRESHOLD)
+        saved.setdefault("thresholds", {})
+        args.baseline.write_text(json.dumps(saved, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"\nベースラインを保存しました: {args.baseline}")
+        return 0
+
+    if not base_results:
+        print(f"\nベースライン {args.baseline} がないため比較できません（--save-baseline で保存してください）", file=sys.stderr)
+        return 1
+    if regressions:
+        print(f"\n{len(regressions)} 件のケースがベースラインより遅くなっています:", file=sys.stderr)
+        for line in regressions:
+            print(f"  {line}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
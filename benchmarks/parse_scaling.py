@@ -0,0 +1,84 @@
+"""
+解析プロセスプール（parse_pool）のスケーリング計測。
+複数アカウントの実行を模して、--threads 本のスレッドから合成ページの解析を同時に依頼し、
+その場での解析（workers=0）とワーカー数 1, 2, 4, ...（使えるコア数まで）の処理量を比べる。
+
+使い方（リポジトリのルートで）:
+  python -m benchmarks.parse_scaling
+  python -m benchmarks.parse_scaling --pages 64 --links 400 --threads 8 --workers 0,1,2,4
+"""
+import argparse
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import config
+
+# レイアウトキャッシュ等を本番の STATE_DIR に書かないよう、parse_pool 等を読み込む前に一時ディレクトリへ向ける
+# （環境変数 STATE_DIR は .env で上書きされるため、読み込んだ設定を直接変える。ワーカーには parse_pool が渡す）
+_cfg = config.settings()
+_cfg.STATE_DIR = _cfg.BASE_STATE_DIR = Path(tempfile.mkdtemp(prefix="parse-bench-"))
+
+import parse_pool  # noqa: E402
+from benchmarks import corpus  # noqa: E402
+
+
+def _default_workers() -> list[int]:
+    cores = parse_pool.available_cores()
+    counts, n = [0], 1
+    while n < cores:
+        counts.append(n)
+        n *= 2
+    counts.append(cores)
+    return counts
+
+
+def _run(workers: int, pages: list[tuple[str, str]], threads: int) -> float:
+    """全ページを解析し終えるまでの秒数（ワーカー起動時間は含めない）。"""
+    pool = parse_pool.ParsePool(workers)
+    pool.warm_up()
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as ex:
+            results = list(ex.map(lambda p: pool.parse(p[0], p[1], corpus.BASE, courses={}), pages))
+        elapsed = time.perf_counter() - started
+    finally:
+        pool.shutdown()
+    if any(not r for r in results):
+        raise RuntimeError("課題を抽出できなかったページがあります")
+    return elapsed
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="解析プロセスプールのスケーリング計測")
+    parser.add_argument("--pages", type=int, default=32, help="解析するページ数（カレンダーとダッシュボードを半分ずつ）")
+    parser.add_argument("--links", type=int, default=300, help="1 ページあたりの課題数")
+    parser.add_argument("--threads", type=int, default=8, help="解析を依頼するスレッド数（アカウント数に相当）")
+    parser.add_argument("--workers", help="比べるワーカー数（カンマ区切り。省略時は 0 と 1, 2, 4, ... コア数）")
+    parser.add_argument("--repeat", type=int, default=3, help="各設定の計測回数（最短を採用）")
+    args = parser.parse_args(argv)
+
+    workers_list = [int(w) for w in args.workers.split(",")] if args.workers else _default_workers()
+    pages = [
+        ("calendar", corpus.calendar_page(args.links, seed=i)) if i % 2 == 0
+        else ("my", corpus.dashboard_page(args.links, noise_links=args.links // 4, seed=i))
+        for i in range(args.pages)
+    ]
+    total_mb = sum(len(html.encode("utf-8")) for _, html in pages) / 1e6
+
+    print(f"cores={parse_pool.available_cores()} pages={args.pages} links/page={args.links} "
+          f"threads={args.threads} corpus={total_mb:.1f} MB")
+    print(f"{'workers':>8} {'seconds':>9} {'pages/s':>9} {'MB/s':>7} {'speedup':>8}")
+    baseline = None
+    for workers in workers_list:
+        best = min(_run(workers, pages, args.threads) for _ in range(args.repeat))
+        baseline = baseline or best
+        label = "inline" if workers == 0 else str(workers)
+        print(f"{label:>8} {best:9.3f} {args.pages / best:9.1f} {total_mb / best:7.2f} {baseline / best:7.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
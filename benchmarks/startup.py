@@ -0,0 +1,185 @@
+"""
+起動時間（cron から起動されるたびにかかる時間）の計測。python -X importtime の出力から、
+各シナリオで読み込まれたモジュールとその時間を集計し、保存したベースラインと比べる。
+
+シナリオ:
+  import-main   import main（main.py を読み込むだけ）
+  if-due-skip   python main.py --if-due（次回チェック時刻前で、何もせず終了する実行）
+  fetch-path    import moodle_scraper, line_sender（実際に取得・送信する実行で読み込むモジュール）
+
+import-main / if-due-skip で requests・bs4・pyotp など（HEAVY_MODULES）が読み込まれたら失敗する。
+
+使い方（リポジトリのルートで）:
+  python -m benchmarks.startup --save-baseline   # 変更前にベースラインを保存
+  python -m benchmarks.startup                   # 変更後に比較（遅くなっていたら終了コード 1）
+  python -m benchmarks.startup --runs 20 --top 25
+
+時間はマシンに依存するため、ベースラインとの比較は同じマシンで行う。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "startup_baseline.json"
+DEFAULT_THRESHOLD = 0.25
+# 取得・送信しない実行では読み込まないモジュール（読み込んだら失敗）
+HEAVY_MODULES = ("requests", "urllib3", "bs4", "soupsieve", "pyotp", "sqlite3", "cProfile", "concurrent.futures.process")
+
+# シナリオ名 -> (python の引数, 重いモジュールを禁止するか)
+SCENARIOS = {
+    "import-main": (["-c", "import main"], True),
+    "if-due-skip": ([str(ROOT / "main.py"), "--if-due"], True),
+    "fetch-path": (["-c", "import moodle_scraper, line_sender"], False),
+}
+
+
+@dataclass
+class Sample:
+    wall_ms: float
+    import_ms: float
+    # モジュール名 -> (自身の時間, 子を含む時間)（マイクロ秒）
+    modules: dict[str, tuple[int, int]] = field(default_factory=dict)
+
+
+def parse_importtime(stderr: str) -> tuple[float, dict[str, tuple[int, int]]]:
+    """
+    -X importtime の出力から、インタプリタ起動（site）後に読み込んだモジュールとその合計時間（ms）を返す。
+    行の形式: "import time: <自身 us> | <子を含む us> | <字下げ><モジュール名>"
+    """
+    modules: dict[str, tuple[int, int]] = {}
+    total_us = 0
+    after_site = False
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        self_us, cumulative_us = int(parts[0]), int(parts[1])
+        name = parts[2][1:].rstrip()  # "|" の後の空白 1 つを除くと、残りの字下げが入れ子の深さ
+        top_level = not name.startswith(" ")
+        name = name.strip()
+        if not after_site:
+            after_site = top_level and name == "site"
+            continue
+        modules[name] = (self_us, cumulative_us)
+        if top_level:
+            total_us += cumulative_us
+    return total_us / 1000, modules
+
+
+def run_scenario(args: list[str], env: dict[str, str]) -> Sample:
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=str(ROOT), env=env, capture_output=True, text=True, encoding="utf-8", errors="replace",
+    )
+    wall = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} が終了コード {proc.returncode} で終わりました:\n{proc.stderr[-2000:]}")
+    import_ms, modules = parse_importtime(proc.stderr)
+    return Sample(wall, import_ms, modules)
+
+
+def _scenario_env(state_dir: Path) -> dict[str, str]:
+    """本番の状態を使わず、次回チェック時刻が 1 日後の一時 STATE_DIR で実行する。"""
+    (state_dir / "next_run.json").write_text(
+        json.dumps({"next_run": (datetime.now() + timedelta(days=1)).isoformat(timespec="seconds")}),
+        encoding="utf-8",
+    )
+    env = dict(os.environ)
+    env.pop("ENV_FILE", None)
+    env.update({"STATE_DIR": str(state_dir), "PYTHONIOENCODING": "utf-8", "PROFILE_SAMPLE_RATE": "0"})
+    return env
+
+
+def _load_baseline(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="起動時間（-X importtime）の計測とベースラインとの比較")
+    parser.add_argument("--runs", type=int, default=10, help="シナリオごとの実行回数（中央値を採用）")
+    parser.add_argument("--top", type=int, default=15, help="表示する遅いモジュールの数")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="実行するシナリオ（複数可）")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="今回の結果をベースラインとして保存する")
+    parser.add_argument("--threshold", type=float, help=f"許容する増加率（デフォルトはベースラインの値か {DEFAULT_THRESHOLD}）")
+    args = parser.parse_args(argv)
+
+    baseline = _load_baseline(args.baseline)
+    base_results = baseline.get("results", {})
+    threshold = args.threshold if args.threshold is not None else baseline.get("default_threshold", DEFAULT_THRESHOLD)
+    env = _scenario_env(Path(tempfile.mkdtemp(prefix="startup-bench-")))
+
+    print(f"python {platform.python_version()} / {platform.machine()} / baseline: "
+          f"{args.baseline if base_results else 'なし'}")
+    print(f"{'scenario':<14} {'wall(ms)':>9} {'import(ms)':>11} {'modules':>8} {'baseline':>9} {'change':>8}")
+    results: dict[str, dict] = {}
+    failures: list[str] = []
+    slowest: dict[str, list] = {}
+    for name in args.scenario or list(SCENARIOS):
+        scenario_args, forbid_heavy = SCENARIOS[name]
+        run_scenario(scenario_args, env)  # 1 回目は .pyc の作成を含むため捨てる
+        samples = [run_scenario(scenario_args, env) for _ in range(max(1, args.runs))]
+        wall = statistics.median(s.wall_ms for s in samples)
+        import_ms = statistics.median(s.import_ms for s in samples)
+        modules = samples[-1].modules
+        results[name] = {"wall_ms": round(wall, 2), "import_ms": round(import_ms, 2), "modules": len(modules)}
+        slowest[name] = sorted(modules.items(), key=lambda kv: kv[1][0], reverse=True)[:args.top]
+
+        base = base_results.get(name, {}).get("import_ms")
+        change = ""
+        if base:
+            ratio = import_ms / base
+            change = f"{(ratio - 1) * 100:+.1f}%"
+            if ratio > 1 + threshold:
+                change += " !"
+                failures.append(f"{name}: import {base:.1f} -> {import_ms:.1f} ms（許容 +{threshold * 100:.0f}%）")
+        print(f"{name:<14} {wall:9.1f} {import_ms:11.1f} {len(modules):8d} {base or 0:9.1f} {change:>8}")
+        if forbid_heavy:
+            heavy = [m for m in HEAVY_MODULES if m in modules]
+            if heavy:
+                failures.append(f"{name}: 起動時に読み込まないモジュールが読み込まれています: {', '.join(heavy)}")
+
+    for name, mods in slowest.items():
+        print(f"\n{name}: 自身の時間が長いモジュール")
+        for mod, (self_us, cumulative_us) in mods:
+            print(f"  {mod:<40} {self_us / 1000:7.2f} ms  (子を含む {cumulative_us / 1000:.2f} ms)")
+
+    if args.save_baseline:
+        saved = dict(baseline)
+        saved.update({
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": f"{platform.system()} {platform.machine()} {platform.processor()}".strip(),
+            "results": {**base_results, **results},
+        })
+        saved.setdefault("default_threshold", DEFAULT_THRESHOLD)
+        args.baseline.write_text(json.dumps(saved, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"\nベースラインを保存しました: {args.baseline}")
+        return 0
+
+    if failures:
+        print(f"\n{len(failures)} 件の問題があります:", file=sys.stderr)
+        for line in failures:
+            print(f"  {line}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,161 @@
+"""
+ホストごとのサーキットブレーカー（Moodle・SSO 認証サーバーの障害時に即座に諦める）。
+
+- closed: 通常。接続エラー・タイムアウト・5xx が CIRCUIT_FAILURE_THRESHOLD 回続くと open に
+- open: リクエストを送らずに CircuitOpenError を送出する。CIRCUIT_COOLDOWN_SECONDS 経過後は half_open に
+- half_open: 1 リクエストだけ試す。成功すれば closed、失敗すれば再び open
+
+状態は state_dir/circuit_breaker.json に保存し、次回以降の実行にも引き継ぐ。
+複数アカウントの同時実行（worker.py）でも 1 つのファイルを共有するため、書き込みはファイルロックで直列化し、
+変更したホストの分だけを最新の内容に反映する（他のプロセスが記録した別ホストの状態を上書きしない）。
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = "circuit_breaker.json"
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """ブレーカーが open のため送信しなかった（既存の RequestException の処理で扱える）。"""
+
+
+class CircuitBreaker:
+    """ホストごとの状態を持つサーキットブレーカー。"""
+
+    def __init__(self, state_dir: Optional[Path], failure_threshold: int, cooldown_seconds: float) -> None:
+        self.path = Path(state_dir) / STATE_FILE if state_dir else None
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._hosts: dict[str, dict] = self._load()
+        self._probing: set[str] = set()
+
+    def _load(self) -> dict[str, dict]:
+        if self.path is None:
+            return {}
+        try:
+            with self.path.open(encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    @contextmanager
+    def _file_lock(self):
+        """プロセス間で状態ファイルの読み込み〜書き込みを直列化する（self._lock を持った状態で呼ぶ）。"""
+        assert self.path is not None
+        with open(self.path.with_name(f"{self.path.name}.lock"), "a+b") as f:
+            if os.name == "nt":
+                import msvcrt
+
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _save(self, host: str) -> None:
+        """host の状態をファイルに反映する。他のホストは他のプロセスが書いた最新の内容を取り込む。"""
+        if self.path is None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._file_lock():
+                hosts = self._load()
+                if host in self._hosts:
+                    hosts[host] = self._hosts[host]
+                else:
+                    hosts.pop(host, None)
+                tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+                tmp.write_text(json.dumps(hosts, indent=2), encoding="utf-8")
+                os.replace(tmp, self.path)
+            self._hosts = hosts
+        except OSError as e:
+            logger.warning("サーキットブレーカーの状態を保存できませんでした: %s", e)
+
+    def state(self, host: str) -> str:
+        """host の現在の状態（closed / open / half_open）。"""
+        with self._lock:
+            return self._hosts.get(host, {}).get("state", CLOSED)
+
+    def states(self) -> dict[str, str]:
+        """closed 以外のホストとその状態。"""
+        with self._lock:
+            return {h: e.get("state", CLOSED) for h, e in self._hosts.items() if e.get("state", CLOSED) != CLOSED}
+
+    def before_request(self, host: str) -> bool:
+        """
+        リクエスト前に呼ぶ。open（または half_open で試行中）なら CircuitOpenError。
+        half_open の試行枠を取ったら True（結果を記録しないで終わる場合は release_probe で返す）。
+        """
+        with self._lock:
+            entry = self._hosts.get(host)
+            if not entry or entry.get("state") == CLOSED:
+                return False
+            if entry["state"] == OPEN:
+                remaining = entry.get("opened_at", 0) + self.cooldown_seconds - time.time()
+                if remaining > 0:
+                    raise CircuitOpenError(f"{host} は障害中のため送信しません（あと {remaining:.0f} 秒）")
+                entry["state"] = HALF_OPEN
+                logger.info("[ブレーカー] %s: half_open（1 リクエストで復旧を確認します）", host)
+                self._save(host)
+            if host in self._probing:
+                raise CircuitOpenError(f"{host} は復旧確認中のため送信しません")
+            self._probing.add(host)
+            return True
+
+    def release_probe(self, host: str) -> None:
+        """half_open の試行枠を返す（成功・失敗のどちらとも数えない例外で終わった場合。記録済みなら何もしない）。"""
+        with self._lock:
+            self._probing.discard(host)
+
+    def record_success(self, host: str) -> None:
+        with self._lock:
+            self._probing.discard(host)
+            entry = self._hosts.get(host)
+            if not entry:
+                return
+            if entry.get("state") != CLOSED:
+                logger.info("[ブレーカー] %s: closed（復旧しました）", host)
+            del self._hosts[host]
+            self._save(host)
+
+    def record_failure(self, host: str, reason: str) -> None:
+        with self._lock:
+            self._probing.discard(host)
+            entry = self._hosts.setdefault(host, {"state": CLOSED, "failures": 0})
+            entry["failures"] = entry.get("failures", 0) + 1
+            entry["last_failure"] = reason[:200]
+            if entry["state"] == HALF_OPEN or entry["failures"] >= self.failure_threshold:
+                if entry["state"] != OPEN:
+                    logger.warning(
+                        "[ブレーカー] %s: open（%d 回連続失敗: %s）。%d 秒間は送信しません",
+                        host, entry["failures"], entry["last_failure"], self.cooldown_seconds,
+                    )
+                entry["state"] = OPEN
+                entry["opened_at"] = time.time()
+            self._save(host)
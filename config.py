@@ -1,22 +1,38 @@
 """
 設定の読み込み。環境変数または .env から取得する。
+
+設定は最初に参照したときに 1 回だけ読み込む（settings()）。起動直後に終了する実行（main.py --if-due 等）で
+不要な読み込みをしないため。従来どおり `from config import MOODLE_URL` の形でも参照できる。
 """
 import os
 import sys
 from pathlib import Path
-
-from dotenv import load_dotenv
+from typing import Optional
 
 # プロジェクトルート（config.py があるディレクトリ = 絶対パス）
 PROJECT_ROOT = Path(__file__).resolve().parent
 
-# .env の読み込み（絶対パスで複数候補を試す）
-# 読み込んだ .env のパス（動作確認用・ログで使用）
-_ENV_LOADED_FROM: str | None = None
 
+def _load_env() -> Optional[str]:
+    """.env を環境変数に読み込み、読み込み元（動作確認用・ログで使用）を返す。"""
+    from dotenv import load_dotenv
+
+    # ENV_FILE: アカウントごとの設定ファイル（worker.py が指定）。共通の .env を読んだあとで上書きする
+    env_file = os.environ.get("ENV_FILE", "").strip()
+    loaded_from = _load_default_env()
+    if env_file:
+        path = Path(env_file).expanduser().resolve()
+        if not path.is_file():
+            raise FileNotFoundError(f"ENV_FILE が見つかりません: {path}")
+        load_dotenv(path, override=True)
+        loaded_from = f"{loaded_from} + {path}" if loaded_from else str(path)
+    return loaded_from
+
+
+def _load_default_env() -> Optional[str]:
+    """.env の読み込み（絶対パスで複数候補を試す）"""
+    from dotenv import load_dotenv
 
-def _load_env() -> None:
-    global _ENV_LOADED_FROM
     candidates: list[Path] = [
         PROJECT_ROOT / ".env",   # 1) プロジェクトルート（最優先・絶対パス）
         Path.cwd().resolve() / ".env",  # 2) カレントディレクトリ（タスクスケジューラ等）
@@ -26,13 +42,8 @@ def _load_env() -> None:
     for p in candidates:
         if p.is_file():
             load_dotenv(p, override=True)  # .env を優先（既存の環境変数を上書き）
-            _ENV_LOADED_FROM = str(p)
-            break
-    else:
-        load_dotenv(PROJECT_ROOT / ".env", override=True)
-        _ENV_LOADED_FROM = str(PROJECT_ROOT / ".env") if (PROJECT_ROOT / ".env").is_file() else None
-
-_load_env()
+            return str(p)
+    return None
 
 
 def get(key: str, default: str = "") -> str:
@@ -46,22 +57,134 @@ def get_int(key: str, default: int = 0) -> int:
         return default
 
 
-# 設定項目
-MOODLE_URL = get("MOODLE_URL").rstrip("/") or "https://moodle.example.ac.jp"
-MOODLE_USER = get("MOODLE_USER")
-MOODLE_PASSWORD = get("MOODLE_PASSWORD")
-
-# 2FA（Moodle 直接ログインで 2段階認証が必要な場合）
-# Base32 の秘密キーは通常 16 または 32 文字。誤って 2 回貼り付けた場合は先頭 32 文字を使用
-_raw_totp = get("TOTP_SECRET")
-TOTP_SECRET = _raw_totp[:32] if len(_raw_totp) > 32 else _raw_totp
-
-LINE_CHANNEL_ACCESS_TOKEN = get("LINE_CHANNEL_ACCESS_TOKEN")
-LINE_USER_IDS = [uid.strip() for uid in get("LINE_USER_ID").split(",") if uid.strip()]
-REMINDER_DAYS = max(0, get_int("REMINDER_DAYS", 1))
+def get_float(key: str, default: float = 0.0) -> float:
+    try:
+        return float(os.environ.get(key, str(default)))
+    except ValueError:
+        return default
 
-# Moodle へのアクセス間隔（秒）。学校サーバーへの負荷軽減・バグ時の連打防止用
-ACCESS_INTERVAL = max(0, get_int("ACCESS_INTERVAL", 2))
 
-# HTTP リクエストのタイムアウト（秒）。ネットワークが遅い場合は 60 以上に
-REQUEST_TIMEOUT = max(60, get_int("REQUEST_TIMEOUT", 60))
+class Settings:
+    """.env と環境変数から読み込んだ設定項目。"""
+
+    def __init__(self) -> None:
+        # 読み込んだ .env のパス
+        self.ENV_LOADED_FROM = _load_env()
+
+        # 設定項目
+        self.MOODLE_URL = get("MOODLE_URL").rstrip("/") or "https://moodle.example.ac.jp"
+        self.MOODLE_USER = get("MOODLE_USER")
+        self.MOODLE_PASSWORD = get("MOODLE_PASSWORD")
+
+        # 2FA（Moodle 直接ログインで 2段階認証が必要な場合）
+        # Base32 の秘密キーは通常 16 または 32 文字。誤って 2 回貼り付けた場合は先頭 32 文字を使用
+        raw_totp = get("TOTP_SECRET")
+        self.TOTP_SECRET = raw_totp[:32] if len(raw_totp) > 32 else raw_totp
+
+        self.LINE_CHANNEL_ACCESS_TOKEN = get("LINE_CHANNEL_ACCESS_TOKEN")
+        self.LINE_USER_IDS = [uid.strip() for uid in get("LINE_USER_ID").split(",") if uid.strip()]
+        # LINE Messaging API のベース URL（負荷試験で line_stub_server.py に向ける場合のみ変更）
+        self.LINE_API_BASE = (get("LINE_API_BASE") or "https://api.line.me").rstrip("/")
+        # 送信先が複数のとき、ユーザー ID をマルチキャスト（最大 500 人/リクエスト）でまとめて送る
+        self.LINE_USE_MULTICAST = get("LINE_USE_MULTICAST").lower() in ("1", "true", "yes")
+        self.REMINDER_DAYS = max(0, get_int("REMINDER_DAYS", 1))
+
+        # Moodle へのアクセス間隔（秒）。学校サーバーへの負荷軽減・バグ時の連打防止用
+        self.ACCESS_INTERVAL = max(0, get_int("ACCESS_INTERVAL", 2))
+
+        # HTTP リクエストのタイムアウト（秒）。接続（サーバー停止時はここで早く諦める）と読み込みを別々に設定
+        # 読み込みは従来の REQUEST_TIMEOUT も引き続き使える。ネットワークが遅い場合は大きめに
+        self.REQUEST_CONNECT_TIMEOUT = max(1, get_int("REQUEST_CONNECT_TIMEOUT", 10))
+        self.REQUEST_READ_TIMEOUT = max(1, get_int("REQUEST_READ_TIMEOUT", get_int("REQUEST_TIMEOUT", 60)))
+        self.REQUEST_TIMEOUT = (self.REQUEST_CONNECT_TIMEOUT, self.REQUEST_READ_TIMEOUT)
+
+        # 1 回の実行全体の時間予算（秒）。0 で無制限。cron 等の実行時間の上限より短くする
+        # 予算を使い切ったら取得を打ち切り、取得できた分を「一部のみ」と注記して送信する（送信用に RESERVE 秒を残す）
+        self.RUN_BUDGET_SECONDS = max(0, get_int("RUN_BUDGET_SECONDS", 0))
+        self.RUN_BUDGET_SEND_RESERVE_SECONDS = max(0, get_int("RUN_BUDGET_SEND_RESERVE_SECONDS", 30))
+
+        # 授業ごとの課題一覧（mod/assign/index.php）からの一括取得。カレンダー・ダッシュボードに出ない課題も拾う
+        self.HARVEST_COURSES = get("HARVEST_COURSES").lower() in ("1", "true", "yes")
+        self.HARVEST_CONCURRENCY = max(1, get_int("HARVEST_CONCURRENCY", 2))
+        self.HARVEST_MAX_COURSES = max(1, get_int("HARVEST_MAX_COURSES", 60))
+
+        # ページ解析のプロセスプール（parse_pool.py）: 0 で使わない、auto で使えるコア数、N で N プロセス
+        self.PARSE_WORKERS = get("PARSE_WORKERS", "0")
+        # これより小さいページはプロセスプールに渡さずその場で解析する（バイト）
+        self.PARSE_POOL_MIN_BYTES = max(0, get_int("PARSE_POOL_MIN_BYTES", 32768))
+
+        # サーキットブレーカー: ホストごとに連続 N 回失敗したら、一定時間（秒）そのホストへのアクセスを止める
+        self.CIRCUIT_FAILURE_THRESHOLD = max(1, get_int("CIRCUIT_FAILURE_THRESHOLD", 3))
+        self.CIRCUIT_COOLDOWN_SECONDS = max(0, get_int("CIRCUIT_COOLDOWN_SECONDS", 300))
+
+        # ログ（LOG_FORMAT: text / json、LOG_ROTATE: size（LOG_MAX_BYTES ごと）/ time（毎日 0 時））
+        self.LOG_LEVEL = get("LOG_LEVEL") or "INFO"
+        self.LOG_FORMAT = "json" if get("LOG_FORMAT").lower() == "json" else "text"
+        self.LOG_ROTATE = "time" if get("LOG_ROTATE").lower() == "time" else "size"
+        self.LOG_MAX_BYTES = max(1024, get_int("LOG_MAX_BYTES", 5 * 1024 * 1024))
+        self.LOG_BACKUP_COUNT = max(0, get_int("LOG_BACKUP_COUNT", 7))
+        # ログの出力先。複数アカウント運用（worker.py）では同時に動く実行が同じファイルを書き込み・ローテーションしないよう、
+        # アカウントごとに logs/accounts/<ACCOUNT_NAME> を使う
+        log_dir = Path(get("LOG_DIR") or PROJECT_ROOT / "logs")
+        self.LOG_DIR = log_dir / "accounts" / get("ACCOUNT_NAME") if get("ACCOUNT_NAME") else log_dir
+
+        # 実行状態（次回チェック時刻など）の保存先
+        base_state_dir = Path(get("STATE_DIR") or PROJECT_ROOT / "state")
+        # 全アカウントで共有する状態（サーキットブレーカーなど）の保存先
+        self.BASE_STATE_DIR = base_state_dir
+        # 複数アカウント運用（worker.py）ではアカウントごとに state/accounts/<ACCOUNT_NAME> を使う
+        self.ACCOUNT_NAME = get("ACCOUNT_NAME")
+        self.STATE_DIR = base_state_dir / "accounts" / self.ACCOUNT_NAME if self.ACCOUNT_NAME else base_state_dir
+
+        # ジョブキュー（job_queue.py / worker.py）: SQLite ファイルのパス（共有ストレージ可）または queue_server.py の URL
+        self.JOB_QUEUE = get("JOB_QUEUE") or str(base_state_dir / "jobs.sqlite3")
+        self.QUEUE_TOKEN = get("QUEUE_TOKEN")
+        self.JOB_LEASE_SECONDS = max(30, get_int("JOB_LEASE_SECONDS", 300))
+        self.JOB_MAX_ATTEMPTS = max(1, get_int("JOB_MAX_ATTEMPTS", 3))
+        self.JOB_RETRY_DELAY_SECONDS = max(0, get_int("JOB_RETRY_DELAY_SECONDS", 300))
+        # 全ノード合計での 1 ホストあたりのリクエスト数/分（ジョブキューで調整）。0 で無効
+        self.HOST_RATE_BUDGET_PER_MINUTE = max(0.0, get_float("HOST_RATE_BUDGET_PER_MINUTE", 0.0))
+
+        # 締切アーカイブ（deadline_archive.py）: 取得した課題一覧を学期ごとに圧縮して追記する
+        self.ARCHIVE_ENABLED = get("ARCHIVE_ENABLED", "1").lower() in ("1", "true", "yes")
+        self.ARCHIVE_DIR = Path(get("ARCHIVE_DIR") or base_state_dir / "archive")
+
+        # 同時実行の防止: ロックのリース（秒）、他の実行の終了を待つ最大時間（秒）
+        self.RUN_LOCK_LEASE_SECONDS = max(30, get_int("RUN_LOCK_LEASE_SECONDS", 900))
+        self.RUN_LOCK_WAIT_SECONDS = max(0, get_int("RUN_LOCK_WAIT_SECONDS", 900))
+        # 同じ内容のリマインドをこの時間（分）以内に再送しない。0 で無効
+        self.SEND_DEDUP_MINUTES = max(0, get_int("SEND_DEDUP_MINUTES", 30))
+
+        # スナップショット API（snapshot_server.py）の待ち受けポート
+        self.SNAPSHOT_API_PORT = get_int("SNAPSHOT_API_PORT", 8765)
+
+        # 適応ポーリング（main.py --if-due）: 次回チェックまでの最短／最長間隔
+        self.POLL_MIN_INTERVAL_MINUTES = max(1, get_int("POLL_MIN_INTERVAL_MINUTES", 30))
+        self.POLL_MAX_INTERVAL_HOURS = max(1, get_int("POLL_MAX_INTERVAL_HOURS", 24))
+        # 締切がリマインド対象に入る日にチェック（送信）する時刻（時）。毎日 17 時に実行していたときと同じ時刻に送る
+        self.POLL_WINDOW_ENTRY_HOUR = min(23, max(0, get_int("POLL_WINDOW_ENTRY_HOUR", 17)))
+
+        # プロファイル（main.py --profile、または PROFILE_SAMPLE_RATE の確率で本番実行を記録）
+        self.PROFILE_DIR = Path(get("PROFILE_DIR") or PROJECT_ROOT / "logs" / "profile")
+        self.PROFILE_SAMPLE_RATE = min(1.0, max(0.0, get_float("PROFILE_SAMPLE_RATE", 0.0)))
+        self.PROFILE_TOP_N = max(1, get_int("PROFILE_TOP_N", 25))
+
+
+_settings: Optional[Settings] = None
+
+
+def settings() -> Settings:
+    """設定（初回の呼び出しで .env を読み込んで作り、以降は同じものを返す）。"""
+    global _settings
+    if _settings is None:
+        _settings = Settings()
+    return _settings
+
+
+def __getattr__(name: str):
+    # `from config import MOODLE_URL` 等の従来の参照。初回の参照で設定を読み込む
+    if name == "_ENV_LOADED_FROM":
+        return settings().ENV_LOADED_FROM
+    if name.isupper() and hasattr(settings(), name):
+        return getattr(settings(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
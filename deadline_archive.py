@@ -0,0 +1,465 @@
+"""
+取得した課題一覧を学期ごとに追記していく締切アーカイブ（授業・週ごとの締切の集中度、締切変更の頻度の集計用）。
+
+学期（4〜9 月: YYYY-1、10〜3 月: YYYY-2。取得日で決める）ごとに 3 ファイル:
+  <学期>.str  文字列表（課題キー・授業名・タイトル・アカウント）。1 行 1 文字列（JSON）、行番号が ID
+  <学期>.dat  実行 1 回分の課題を列ごとに並べて zlib 圧縮したブロックを追記
+  <学期>.idx  ブロックごとの固定長レコード（位置・件数・取得時刻・締切の最小/最大・授業のブルームフィルタ等）
+
+- 前回（同じアカウント）と内容が同じ実行は .dat に書かず、同じブロックを指す索引レコードだけを追加する
+- 検索は .idx を mmap して時刻範囲・授業で対象ブロックを絞り、該当ブロックだけを展開する
+- 追記の順は .str → .dat → .idx。.idx への追加が完了したものだけが読まれる（途中で落ちても壊れない）
+保存先: ARCHIVE_DIR（デフォルト STATE_DIR/archive）
+
+使い方:
+  python deadline_archive.py terms
+  python deadline_archive.py query --from 2025-04-01 --to 2025-08-01 --course 線形代数
+  python deadline_archive.py stats --term 2025-1
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from models import Assignment
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"DLA1"
+# offset, length, nrows, observed_at, min_due, max_due, account_id, crc32, course_bloom
+_INDEX_RECORD = struct.Struct("<QIIqqqIIQ")
+NO_DUE = 0  # 締切なし
+_ROW_COLUMNS = (("I", "key"), ("I", "course"), ("I", "title"), ("q", "due"))
+
+_lock = threading.Lock()
+
+
+@dataclass
+class ArchiveRow:
+    """アーカイブ内の課題 1 件（ある実行で観測した内容）。"""
+
+    observed_at: datetime
+    account: str
+    key: str
+    course_name: str
+    title: str
+    due_date: Optional[datetime]
+
+
+@dataclass
+class _IndexEntry:
+    offset: int
+    length: int
+    nrows: int
+    observed_at: int
+    min_due: int
+    max_due: int
+    account_id: int
+    crc: int
+    course_bloom: int
+
+
+def term_of(when: datetime) -> str:
+    """日付の属する学期（4〜9 月: YYYY-1、10〜3 月: YYYY-2。1〜3 月は前年度）。"""
+    if 4 <= when.month <= 9:
+        return f"{when.year}-1"
+    return f"{when.year if when.month >= 10 else when.year - 1}-2"
+
+
+def _bloom_bit(string_id: int) -> int:
+    return 1 << ((string_id * 0x9E3779B1) >> 7 & 63)
+
+
+def _epoch(dt: Optional[datetime]) -> int:
+    return int(dt.timestamp()) if dt else NO_DUE
+
+
+def _from_epoch(ts: int) -> Optional[datetime]:
+    return datetime.fromtimestamp(ts) if ts != NO_DUE else None
+
+
+def _to_le(a: array) -> bytes:
+    if sys.byteorder != "little":
+        a = array(a.typecode, a)
+        a.byteswap()
+    return a.tobytes()
+
+
+def _from_le(typecode: str, data: bytes) -> array:
+    a = array(typecode)
+    a.frombytes(data)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """プロセス間で追記を直列化する（複数アカウントの同時実行向け）。"""
+    with _lock, open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class TermArchive:
+    """1 学期分のアーカイブファイル。"""
+
+    def __init__(self, directory: Path, term: str) -> None:
+        self.directory = Path(directory)
+        self.term = term
+        self.str_path = self.directory / f"{term}.str"
+        self.dat_path = self.directory / f"{term}.dat"
+        self.idx_path = self.directory / f"{term}.idx"
+
+    # --- 読み込み ---
+
+    def load_strings(self) -> list[str]:
+        try:
+            with self.str_path.open(encoding="utf-8") as f:
+                lines = f.read().split("\n")
+        except OSError:
+            return []
+        if lines and lines[-1] == "":
+            lines.pop()
+        out = []
+        for line in lines:
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                out.append("")  # 書きかけで落ちた行（ID を保つため残す）
+        return out
+
+    def index(self) -> list[_IndexEntry]:
+        """完全に書き込まれた索引レコード（.idx を mmap して読む）。"""
+        try:
+            with self.idx_path.open("rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                usable = size - size % _INDEX_RECORD.size
+                if usable <= 0:
+                    return []
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return [_IndexEntry(*r) for r in _INDEX_RECORD.iter_unpack(mm[:usable])]
+        except (OSError, ValueError):
+            return []
+
+    @staticmethod
+    def _decode_block(payload: bytes, nrows: int) -> dict[str, array]:
+        raw = zlib.decompress(payload)
+        cols, pos = {}, 0
+        for typecode, name in _ROW_COLUMNS:
+            width = array(typecode).itemsize * nrows
+            cols[name] = _from_le(typecode, raw[pos:pos + width])
+            pos += width
+        return cols
+
+    def iter_rows(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        course: Optional[str] = None,
+        account: Optional[str] = None,
+        by: str = "due",
+    ) -> Iterator[ArchiveRow]:
+        """
+        条件に合う行を返す。by="due" は締切、by="observed" は取得時刻で [start, end) を絞る。
+        索引で対象外と分かるブロックは展開しない。
+        """
+        entries = self.index()
+        if not entries:
+            return
+        strings = self.load_strings()
+        ids = {s: i for i, s in enumerate(strings)}
+        course_id = ids.get(course) if course is not None else None
+        account_id = ids.get(account) if account is not None else None
+        if (course is not None and course_id is None) or (account is not None and account_id is None):
+            return
+        lo, hi = _epoch(start) if start else None, _epoch(end) if end else None
+
+        try:
+            f = self.dat_path.open("rb")
+        except OSError:
+            return
+        cached_offset, cols = -1, {}
+        with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for e in entries:
+                if account_id is not None and e.account_id != account_id:
+                    continue
+                if course_id is not None and not e.course_bloom & _bloom_bit(course_id):
+                    continue
+                if by == "observed":
+                    if (lo is not None and e.observed_at < lo) or (hi is not None and e.observed_at >= hi):
+                        continue
+                elif e.nrows and (lo is not None or hi is not None):
+                    if e.max_due == NO_DUE or (lo is not None and e.max_due < lo) or (hi is not None and e.min_due >= hi):
+                        continue
+                if e.offset != cached_offset:
+                    # 内容が同じ実行は同じブロックを指すので、続けて読む場合は展開し直さない
+                    cols, cached_offset = self._decode_block(mm[e.offset:e.offset + e.length], e.nrows), e.offset
+                observed = datetime.fromtimestamp(e.observed_at)
+                for i in range(e.nrows):
+                    due = cols["due"][i]
+                    if course_id is not None and cols["course"][i] != course_id:
+                        continue
+                    if by == "due" and (lo is not None or hi is not None):
+                        if due == NO_DUE or (lo is not None and due < lo) or (hi is not None and due >= hi):
+                            continue
+                    yield ArchiveRow(
+                        observed_at=observed,
+                        account=strings[e.account_id],
+                        key=strings[cols["key"][i]],
+                        course_name=strings[cols["course"][i]],
+                        title=strings[cols["title"][i]],
+                        due_date=_from_epoch(due),
+                    )
+
+    # --- 追記 ---
+
+    def append(self, assignments: Iterable[Assignment], observed_at: datetime, account: str = "") -> bool:
+        """
+        1 回分の課題一覧を追記する。前回（同じアカウント）と同じ内容なら索引レコードだけを追加する。
+        新しくブロックを書いた場合は True。
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with _file_lock(self.directory / f"{self.term}.lock"):
+            if self.str_path.exists() and self.str_path.stat().st_size and not self._ends_with_newline():
+                # 書きかけの行を閉じる（その行は使わない ID になる）
+                with self.str_path.open("ab") as f:
+                    f.write(b"\n")
+            strings = self.load_strings()
+            ids = {s: i for i, s in enumerate(strings)}
+            new_strings: list[str] = []
+
+            def intern(s: str) -> int:
+                sid = ids.get(s)
+                if sid is None:
+                    sid = ids[s] = len(strings) + len(new_strings)
+                    new_strings.append(s)
+                return sid
+
+            account_id = intern(account)
+            rows = sorted(
+                (intern(a.key), intern(a.course_name or ""), intern(a.title or ""), _epoch(a.due_date))
+                for a in assignments
+            )
+            cols = [array(tc, (r[i] for r in rows)) for i, (tc, _) in enumerate(_ROW_COLUMNS)]
+            raw = b"".join(_to_le(c) for c in cols)
+            crc = zlib.crc32(raw)
+            dues = [r[3] for r in rows if r[3] != NO_DUE]
+            bloom = 0
+            for r in rows:
+                bloom |= _bloom_bit(r[1])
+
+            if new_strings:
+                with self.str_path.open("ab") as f:
+                    f.write("".join(json.dumps(s, ensure_ascii=False) + "\n" for s in new_strings).encode("utf-8"))
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            reuse = self._same_as_last(account_id, crc, raw)
+            if reuse is not None:
+                offset, length = reuse
+            else:
+                payload = zlib.compress(raw, 9)
+                with self.dat_path.open("ab") as f:
+                    if f.tell() == 0:
+                        f.write(MAGIC)
+                    offset = f.tell()
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                length = len(payload)
+
+            record = _INDEX_RECORD.pack(
+                offset, length, len(rows), _epoch(observed_at),
+                min(dues) if dues else NO_DUE, max(dues) if dues else NO_DUE,
+                account_id, crc, bloom,
+            )
+            with self.idx_path.open("ab") as f:
+                # 書きかけのレコードがあれば切り詰めてから追記する
+                size = f.tell()
+                if size % _INDEX_RECORD.size:
+                    f.truncate(size - size % _INDEX_RECORD.size)
+                    f.seek(0, os.SEEK_END)
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+        return reuse is None
+
+    def _ends_with_newline(self) -> bool:
+        with self.str_path.open("rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _same_as_last(self, account_id: int, crc: int, raw: bytes) -> Optional[tuple[int, int]]:
+        """同じアカウントの直前のブロックと内容が同じなら、その位置と長さ。"""
+        for e in reversed(self.index()):
+            if e.account_id != account_id:
+                continue
+            if e.crc != crc:
+                return None
+            with self.dat_path.open("rb") as f:
+                f.seek(e.offset)
+                if zlib.decompress(f.read(e.length)) == raw:
+                    return e.offset, e.length
+            return None
+        return None
+
+    def size_bytes(self) -> int:
+        return sum(p.stat().st_size for p in (self.str_path, self.dat_path, self.idx_path) if p.exists())
+
+
+def terms(directory: Path) -> list[str]:
+    """アーカイブにある学期（古い順）。"""
+    try:
+        return sorted(p.stem for p in Path(directory).glob("*.idx"))
+    except OSError:
+        return []
+
+
+def record(directory: Path, assignments: list[Assignment], observed_at: Optional[datetime] = None, account: str = "") -> None:
+    """取得した課題一覧をアーカイブに追記する（失敗しても実行は続ける）。"""
+    observed_at = observed_at or datetime.now()
+    archive = TermArchive(directory, term_of(observed_at))
+    try:
+        wrote = archive.append(assignments, observed_at, account)
+    except (OSError, zlib.error) as e:
+        logger.warning("締切アーカイブに追記できませんでした: %s", e)
+        return
+    logger.info("締切アーカイブ %s に %d 件を記録しました%s", archive.term, len(assignments), "" if wrote else "（前回と同じ内容）")
+
+
+def query(
+    directory: Path,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    course: Optional[str] = None,
+    account: Optional[str] = None,
+    by: str = "due",
+    term_names: Optional[list[str]] = None,
+) -> Iterator[ArchiveRow]:
+    """複数学期にまたがって iter_rows() する。by="observed" なら範囲外の学期は開かない。"""
+    for name in term_names or terms(directory):
+        if by == "observed" and (start or end):
+            t_start, t_end = _term_bounds(name)
+            if (end and t_start >= end) or (start and t_end <= start):
+                continue
+        yield from TermArchive(directory, name).iter_rows(start, end, course, account, by)
+
+
+def _term_bounds(term: str) -> tuple[datetime, datetime]:
+    year, half = (int(x) for x in term.split("-"))
+    if half == 1:
+        return datetime(year, 4, 1), datetime(year, 10, 1)
+    return datetime(year, 10, 1), datetime(year + 1, 4, 1)
+
+
+def deadline_density(rows: Iterable[ArchiveRow]) -> Counter:
+    """(授業名, ISO 週 "YYYY-Www") ごとの締切の数。課題ごとに最後に観測した締切で数える。"""
+    latest: dict[tuple[str, str], ArchiveRow] = {}
+    for r in rows:
+        k = (r.account, r.key)
+        if k not in latest or r.observed_at >= latest[k].observed_at:
+            latest[k] = r
+    density: Counter = Counter()
+    for r in latest.values():
+        if r.due_date:
+            year, week, _ = r.due_date.isocalendar()
+            density[(r.course_name, f"{year}-W{week:02d}")] += 1
+    return density
+
+
+def due_date_changes(rows: Iterable[ArchiveRow]) -> dict[tuple[str, str], list[tuple[datetime, Optional[datetime]]]]:
+    """締切が変わった課題ごとの (観測時刻, 新しい締切) の履歴。"""
+    history: dict[tuple[str, str], list[ArchiveRow]] = defaultdict(list)
+    for r in rows:
+        history[(r.account, r.key)].append(r)
+    changes = {}
+    for k, observed in history.items():
+        observed.sort(key=lambda r: r.observed_at)
+        seq = [(observed[0].observed_at, observed[0].due_date)]
+        for r in observed[1:]:
+            if r.due_date != seq[-1][1]:
+                seq.append((r.observed_at, r.due_date))
+        if len(seq) > 1:
+            changes[k] = seq
+    return changes
+
+
+def main(argv: list[str]) -> int:
+    from config import ARCHIVE_DIR
+
+    parser = argparse.ArgumentParser(description="締切アーカイブの検索・集計")
+    parser.add_argument("--dir", type=Path, default=ARCHIVE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("terms", help="学期ごとのファイルサイズと実行数")
+    q = sub.add_parser("query", help="条件に合う課題を JSON Lines で出力")
+    s = sub.add_parser("stats", help="授業・週ごとの締切数と締切変更の回数")
+    for p in (q, s):
+        p.add_argument("--term", action="append", help="対象の学期（例: 2025-1。複数可）")
+        p.add_argument("--from", dest="start", type=datetime.fromisoformat)
+        p.add_argument("--to", dest="end", type=datetime.fromisoformat)
+        p.add_argument("--course")
+        p.add_argument("--account")
+        p.add_argument("--by", choices=("due", "observed"), default="due", help="--from/--to を締切・取得時刻のどちらで見るか")
+    args = parser.parse_args(argv)
+
+    if args.command == "terms":
+        for name in terms(args.dir):
+            archive = TermArchive(args.dir, name)
+            entries = archive.index()
+            print(f"{name}  runs={len(entries)}  rows={sum(e.nrows for e in entries)}  "
+                  f"strings={len(archive.load_strings())}  bytes={archive.size_bytes()}")
+        return 0
+
+    rows = query(args.dir, args.start, args.end, args.course, args.account, args.by, args.term)
+    if args.command == "query":
+        for r in rows:
+            print(json.dumps({
+                "observed_at": r.observed_at.isoformat(), "account": r.account, "key": r.key,
+                "course_name": r.course_name, "title": r.title,
+                "due_date": r.due_date.isoformat() if r.due_date else None,
+            }, ensure_ascii=False))
+        return 0
+
+    rows = list(rows)
+    print("授業\t週\t締切数")
+    for (course, week), n in sorted(deadline_density(rows).items(), key=lambda kv: (kv[0][1], kv[0][0])):
+        print(f"{course or '（不明）'}\t{week}\t{n}")
+    changes = due_date_changes(rows)
+    print(f"\n締切が変更された課題: {len(changes)} 件")
+    for (account, key), seq in sorted(changes.items(), key=lambda kv: -len(kv[1])):
+        hist = " -> ".join(d.strftime("%m/%d %H:%M") if d else "なし" for _, d in seq)
+        print(f"  {key}（{account or '-'}）: {len(seq) - 1} 回  {hist}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
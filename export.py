@@ -0,0 +1,145 @@
+"""
+最新の課題スナップショットを JSON Lines / CSV / ICS に書き出す。
+スナップショットを 1 件ずつ読みながら出力するため、件数が多くてもメモリを使わない。
+
+使い方:
+  python export.py --format ics -o assignments.ics
+  python export.py --format csv > assignments.csv
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import IO, Iterable, Iterator
+from urllib.parse import urlparse
+
+import snapshot
+from config import MOODLE_URL, STATE_DIR
+from models import assignment_key
+
+FORMATS = ("json", "jsonl", "csv", "ics")
+CONTENT_TYPES = {
+    "json": "application/json; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+    "ics": "text/calendar; charset=utf-8",
+}
+CSV_COLUMNS = ("title", "due_date", "course_name", "url", "description_preview")
+
+
+def iter_json(meta: dict, items: Iterable[dict]) -> Iterator[str]:
+    """{"run_id": ..., "fetched_at": ..., "assignments": [...]} を少しずつ返す。"""
+    head = {k: v for k, v in meta.items() if k != "count"}
+    yield json.dumps(head, ensure_ascii=False)[:-1] + ', "assignments": ['
+    for i, d in enumerate(items):
+        yield ("," if i else "") + json.dumps(d, ensure_ascii=False)
+    yield "]}\n"
+
+
+def iter_jsonl(meta: dict, items: Iterable[dict]) -> Iterator[str]:
+    """1 行 1 課題の JSON Lines。"""
+    for d in items:
+        yield json.dumps(d, ensure_ascii=False) + "\n"
+
+
+def iter_csv(meta: dict, items: Iterable[dict]) -> Iterator[str]:
+    """ヘッダー付き CSV。"""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\r\n")
+    writer.writerow(CSV_COLUMNS)
+    for d in items:
+        writer.writerow([d.get(c) or "" for c in CSV_COLUMNS])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        # 課題が 0 件ならヘッダーのみ
+        yield buf.getvalue()
+
+
+def _ics_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _ics_fold(line: str) -> str:
+    """RFC 5545 の行折り返し（75 オクテットごとに CRLF + 空白）。"""
+    out, cur, size = [], "", 0
+    for ch in line:
+        n = len(ch.encode("utf-8"))
+        if size + n > 75:
+            out.append(cur)
+            cur, size = " ", 1
+        cur += ch
+        size += n
+    out.append(cur)
+    return "\r\n".join(out) + "\r\n"
+
+
+def iter_ics(meta: dict, items: Iterable[dict]) -> Iterator[str]:
+    """締切のある課題を VEVENT（締切時刻の 0 分イベント）にした iCalendar。"""
+    default_host = urlparse(MOODLE_URL).netloc or "moodle"
+    # DTSTAMP は UTC（RFC 5545）。DTSTART/DTEND は締切の現地時刻（floating）のまま
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    yield "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//moodle-agent//assignments//JA\r\nCALSCALE:GREGORIAN\r\n"
+    for d in items:
+        if not d.get("due_date"):
+            continue
+        due = datetime.fromisoformat(d["due_date"]).strftime("%Y%m%dT%H%M%S")
+        host = urlparse(d.get("url") or "").netloc or default_host
+        summary = d.get("title") or ""
+        if d.get("course_name"):
+            summary += f"（{d['course_name']}）"
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:{assignment_key(d.get('url') or '')}@{host}",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{due}",
+            f"DTEND:{due}",
+            f"SUMMARY:{_ics_escape(summary)}",
+        ]
+        if d.get("url"):
+            lines.append(f"URL:{d['url']}")
+        if d.get("description_preview"):
+            lines.append(f"DESCRIPTION:{_ics_escape(d['description_preview'])}")
+        lines.append("END:VEVENT")
+        yield "".join(_ics_fold(line) for line in lines)
+    yield "END:VCALENDAR\r\n"
+
+
+_WRITERS = {"json": iter_json, "jsonl": iter_jsonl, "csv": iter_csv, "ics": iter_ics}
+
+
+def iter_export(fmt: str, meta: dict, f: IO[str]) -> Iterator[str]:
+    """open_snapshot() で開いたファイルを fmt 形式で少しずつ返す。"""
+    return _WRITERS[fmt](meta, snapshot.iter_assignment_dicts(f))
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="最新の課題スナップショットを書き出す")
+    parser.add_argument("--format", choices=FORMATS, default="jsonl")
+    parser.add_argument("-o", "--output", type=Path, help="出力先（省略時は標準出力）")
+    parser.add_argument("--state-dir", type=Path, default=STATE_DIR)
+    args = parser.parse_args(argv)
+
+    try:
+        f, meta = snapshot.open_snapshot(args.state_dir)
+    except (OSError, ValueError) as e:
+        print(f"スナップショットを読めません: {e}", file=sys.stderr)
+        return 1
+    newline = "" if args.format in ("csv", "ics") else None
+    with f:
+        out = args.output.open("w", encoding="utf-8", newline=newline) if args.output else sys.stdout
+        try:
+            for chunk in iter_export(args.format, meta, f):
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
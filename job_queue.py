@@ -0,0 +1,306 @@
+"""
+アカウントごとの「取得して通知する」ジョブのキュー（リース付き）と、全ノード共通のホスト別リクエスト枠。
+
+- コーディネーター（このファイルの CLI）: アカウントの設定ファイル（*.env）ごとにジョブを登録する
+- ワーカー（worker.py）: 複数ノードでジョブを取得（リース）し、実行中は定期的にリースを延長する
+  延長が止まった（ノードが落ちた）ジョブはリース切れ後に他のワーカーが再実行する（JOB_MAX_ATTEMPTS 回まで）
+- ホスト別の枠（reserve_slot）: 全ワーカー合計で 1 ホストへのリクエストを HOST_RATE_BUDGET_PER_MINUTE 回/分に抑える
+
+JOB_QUEUE に SQLite ファイルのパス（共有ストレージ上に置けば複数ノードで共有）か、
+queue_server.py の URL（http://host:port）を指定する。共有ストレージがファイルロックに対応していない場合はサーバーを使う。
+
+使い方:
+  python job_queue.py enqueue accounts/*.env          # アカウントごとにジョブを登録（未完了のジョブがあれば登録しない）
+  python job_queue.py enqueue --accounts-dir accounts
+  python job_queue.py status
+  python job_queue.py purge --days 7                  # 終わったジョブを削除
+"""
+import argparse
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account TEXT NOT NULL,
+    env_file TEXT NOT NULL,
+    status TEXT NOT NULL,
+    run_after REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_after);
+CREATE INDEX IF NOT EXISTS jobs_account ON jobs (account, status);
+CREATE TABLE IF NOT EXISTS host_budget (
+    host TEXT PRIMARY KEY,
+    next_slot REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class Job:
+    """キューのジョブ 1 件（1 アカウント分の取得・通知）。"""
+
+    id: int
+    account: str
+    env_file: str
+    status: str
+    run_after: float
+    lease_owner: Optional[str]
+    lease_expires: Optional[float]
+    attempts: int
+    max_attempts: int
+    last_error: Optional[str]
+    created_at: float
+    updated_at: float
+
+
+class SQLiteJobQueue:
+    """SQLite によるジョブキュー。更新は BEGIN IMMEDIATE で直列化する（複数プロセス・ノードから安全に使える）。"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._db().executescript(_SCHEMA)
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            # 共有ストレージでは WAL が使えないため、既定のジャーナルのまま使う
+            db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            self._local.db = db
+        return db
+
+    class _Tx:
+        def __init__(self, db: sqlite3.Connection) -> None:
+            self.db = db
+
+        def __enter__(self) -> sqlite3.Connection:
+            self.db.execute("BEGIN IMMEDIATE")
+            return self.db
+
+        def __exit__(self, exc_type, exc, tb) -> None:
+            self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+
+    def _tx(self) -> "_Tx":
+        return self._Tx(self._db())
+
+    @staticmethod
+    def _job(row: Optional[sqlite3.Row]) -> Optional[Job]:
+        return Job(**dict(row)) if row is not None else None
+
+    def enqueue(self, account: str, env_file: str, max_attempts: int, run_after: Optional[float] = None) -> Optional[int]:
+        """ジョブを登録する。同じアカウントの未完了（pending / running）のジョブがあれば登録せず None。"""
+        now = time.time()
+        with self._tx() as db:
+            if db.execute(
+                "SELECT 1 FROM jobs WHERE account = ? AND status IN (?, ?)", (account, PENDING, RUNNING)
+            ).fetchone():
+                return None
+            cur = db.execute(
+                "INSERT INTO jobs (account, env_file, status, run_after, max_attempts, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (account, env_file, PENDING, run_after or now, max_attempts, now, now),
+            )
+            return cur.lastrowid
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Job]:
+        """実行可能なジョブを 1 件リースする（リース切れのジョブは先に pending に戻す）。なければ None。"""
+        now = time.time()
+        with self._tx() as db:
+            db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END,"
+                " lease_owner = NULL, lease_expires = NULL, last_error = 'リース切れ（' || lease_owner || '）', updated_at = ?"
+                " WHERE status = ? AND lease_expires < ?",
+                (FAILED, PENDING, now, RUNNING, now),
+            )
+            row = db.execute(
+                "SELECT id FROM jobs WHERE status = ? AND run_after <= ? ORDER BY run_after, id LIMIT 1",
+                (PENDING, now),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ?"
+                " WHERE id = ?",
+                (RUNNING, worker_id, now + lease_seconds, now, row["id"]),
+            )
+            return self._job(db.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    def heartbeat(self, job_id: int, worker_id: str, lease_seconds: float) -> bool:
+        """リースを延長する。リースを失っていた（他のワーカーが回収した）ら False。"""
+        now = time.time()
+        with self._tx() as db:
+            cur = db.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND lease_owner = ? AND status = ?",
+                (now + lease_seconds, now, job_id, worker_id, RUNNING),
+            )
+            return cur.rowcount == 1
+
+    def complete(self, job_id: int, worker_id: str) -> bool:
+        now = time.time()
+        with self._tx() as db:
+            cur = db.execute(
+                "UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ?"
+                " WHERE id = ? AND lease_owner = ? AND status = ?",
+                (DONE, now, job_id, worker_id, RUNNING),
+            )
+            return cur.rowcount == 1
+
+    def fail(self, job_id: int, worker_id: str, error: str, retry_delay: float) -> bool:
+        """失敗を記録する。試行回数が残っていれば retry_delay × 試行回数 後に再実行、なければ failed。"""
+        now = time.time()
+        with self._tx() as db:
+            cur = db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END,"
+                " run_after = ? + ? * attempts, lease_owner = NULL, lease_expires = NULL, last_error = ?, updated_at = ?"
+                " WHERE id = ? AND lease_owner = ? AND status = ?",
+                (FAILED, PENDING, now, retry_delay, error[:500], now, job_id, worker_id, RUNNING),
+            )
+            return cur.rowcount == 1
+
+    def reserve_slot(self, host: str, interval: float, count: int = 1) -> float:
+        """
+        host へのリクエスト枠を count 個（interval 秒ごとに連続）予約し、最初の枠の時刻まで待つべき秒数を返す。
+        全ワーカーで共有するため、枠は interval 秒ごとに 1 つずつ順に割り当てられる。
+        """
+        now = time.time()
+        with self._tx() as db:
+            row = db.execute("SELECT next_slot FROM host_budget WHERE host = ?", (host,)).fetchone()
+            start = max(now, row["next_slot"] if row else now)
+            db.execute(
+                "INSERT INTO host_budget (host, next_slot) VALUES (?, ?)"
+                " ON CONFLICT (host) DO UPDATE SET next_slot = excluded.next_slot",
+                (host, start + interval * max(1, count)),
+            )
+        return start - now
+
+    def stats(self) -> dict:
+        """状態ごとのジョブ数と、未完了・失敗したジョブの一覧。"""
+        db = self._db()
+        counts = {r["status"]: r["n"] for r in db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+        active = [asdict(self._job(r)) for r in db.execute(
+            "SELECT * FROM jobs WHERE status IN (?, ?, ?) ORDER BY run_after, id LIMIT 200", (PENDING, RUNNING, FAILED)
+        )]
+        return {"counts": counts, "jobs": active}
+
+    def purge(self, older_than: float) -> int:
+        """older_than（UNIX 時刻）より前に終わったジョブ（done / failed）を削除する。"""
+        with self._tx() as db:
+            return db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (DONE, FAILED, older_than)
+            ).rowcount
+
+
+class HTTPJobQueue:
+    """queue_server.py に接続するクライアント（SQLiteJobQueue と同じメソッド）。"""
+
+    def __init__(self, base_url: str, token: str = "", timeout: float = 30) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._session = requests.Session()
+        if token:
+            self._session.headers["Authorization"] = f"Bearer {token}"
+
+    def _call(self, method: str, **kwargs):
+        r = self._session.post(f"{self.base_url}/{method}", json=kwargs, timeout=self.timeout)
+        r.raise_for_status()
+        return r.json()["result"]
+
+    def enqueue(self, account: str, env_file: str, max_attempts: int, run_after: Optional[float] = None) -> Optional[int]:
+        return self._call("enqueue", account=account, env_file=env_file, max_attempts=max_attempts, run_after=run_after)
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Job]:
+        data = self._call("claim", worker_id=worker_id, lease_seconds=lease_seconds)
+        return Job(**data) if data else None
+
+    def heartbeat(self, job_id: int, worker_id: str, lease_seconds: float) -> bool:
+        return self._call("heartbeat", job_id=job_id, worker_id=worker_id, lease_seconds=lease_seconds)
+
+    def complete(self, job_id: int, worker_id: str) -> bool:
+        return self._call("complete", job_id=job_id, worker_id=worker_id)
+
+    def fail(self, job_id: int, worker_id: str, error: str, retry_delay: float) -> bool:
+        return self._call("fail", job_id=job_id, worker_id=worker_id, error=error, retry_delay=retry_delay)
+
+    def reserve_slot(self, host: str, interval: float, count: int = 1) -> float:
+        return self._call("reserve_slot", host=host, interval=interval, count=count)
+
+    def stats(self) -> dict:
+        return self._call("stats")
+
+    def purge(self, older_than: float) -> int:
+        return self._call("purge", older_than=older_than)
+
+
+def open_queue(location: str, token: str = ""):
+    """JOB_QUEUE の値からキューを開く（http(s):// なら HTTPJobQueue、それ以外は SQLite ファイル）。"""
+    if location.startswith(("http://", "https://")):
+        return HTTPJobQueue(location, token)
+    return SQLiteJobQueue(Path(location))
+
+
+def main(argv: list[str]) -> int:
+    from config import JOB_MAX_ATTEMPTS, JOB_QUEUE, QUEUE_TOKEN
+
+    parser = argparse.ArgumentParser(description="ジョブキューの操作（コーディネーター）")
+    parser.add_argument("--queue", default=JOB_QUEUE, help="SQLite ファイルのパスまたは queue_server.py の URL")
+    sub = parser.add_subparsers(dest="command", required=True)
+    e = sub.add_parser("enqueue", help="アカウントの設定ファイルごとにジョブを登録")
+    e.add_argument("env_files", nargs="*", type=Path, help="アカウントの設定ファイル（ファイル名がアカウント名）")
+    e.add_argument("--accounts-dir", type=Path, help="このディレクトリの *.env をすべて登録")
+    e.add_argument("--max-attempts", type=int, default=JOB_MAX_ATTEMPTS)
+    sub.add_parser("status", help="ジョブの状態")
+    p = sub.add_parser("purge", help="終わったジョブを削除")
+    p.add_argument("--days", type=float, default=7)
+    args = parser.parse_args(argv)
+
+    queue = open_queue(args.queue, QUEUE_TOKEN)
+    if args.command == "enqueue":
+        files = list(args.env_files)
+        if args.accounts_dir:
+            files.extend(sorted(args.accounts_dir.glob("*.env")))
+        if not files:
+            print("登録するアカウントの設定ファイルを指定してください", file=sys.stderr)
+            return 2
+        for f in files:
+            job_id = queue.enqueue(f.stem, str(f.resolve()), args.max_attempts)
+            print(f"{f.stem}: " + (f"job {job_id} を登録しました" if job_id else "未完了のジョブがあるため登録しません"))
+        return 0
+    if args.command == "status":
+        stats = queue.stats()
+        print("  ".join(f"{k}={v}" for k, v in sorted(stats["counts"].items())) or "ジョブはありません")
+        for j in stats["jobs"]:
+            lease = f" lease={j['lease_owner']}" if j["lease_owner"] else ""
+            error = f" error={j['last_error']}" if j["last_error"] else ""
+            print(f"  #{j['id']} {j['account']} {j['status']} attempts={j['attempts']}/{j['max_attempts']}{lease}{error}")
+        return 0
+    print(f"{queue.purge(time.time() - args.days * 86400)} 件削除しました")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
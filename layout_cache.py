@@ -0,0 +1,56 @@
+"""
+ページレイアウト（ホスト＋テーマ）ごとに、課題抽出に成功した戦略を記憶する。
+次回以降はその戦略だけを試し、全レイアウトの総当たりを省く。
+保存先: STATE_DIR/layout_cache.json
+"""
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Optional
+
+from config import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = "layout_cache.json"
+
+_lock = threading.Lock()
+_cache: Optional[dict[str, dict]] = None
+
+
+def _load() -> dict[str, dict]:
+    global _cache
+    if _cache is None:
+        try:
+            with (STATE_DIR / CACHE_FILE).open(encoding="utf-8") as f:
+                data = json.load(f)
+            _cache = data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def lookup(fingerprint: str) -> Optional[str]:
+    """記憶している戦略名（なければ None）。"""
+    with _lock:
+        entry = _load().get(fingerprint)
+    return entry.get("strategy") if isinstance(entry, dict) else None
+
+
+def remember(fingerprint: str, strategy: str) -> None:
+    """fingerprint のレイアウトで strategy が成功したことを記録する。"""
+    with _lock:
+        cache = _load()
+        cache[fingerprint] = {"strategy": strategy, "updated_at": datetime.now().isoformat(timespec="seconds")}
+        path = STATE_DIR / CACHE_FILE
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("レイアウトキャッシュを書き込めませんでした: %s", e)
+            return
+    logger.info("[カレンダー] レイアウト %s の抽出戦略を記憶しました: %s", fingerprint, strategy)
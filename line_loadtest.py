@@ -0,0 +1,116 @@
+"""
+LINE 送信処理の負荷試験。line_stub_server の代替サーバーに向けて
+send_reminder（または _send_text_to_all）を合成した送信先・課題で実行し、
+送信数/秒・リクエスト数・レイテンシ（p50/p95/p99）を表示する。実際の LINE には送らない。
+
+使い方:
+  python line_loadtest.py --recipients 300 --assignments 40
+  python line_loadtest.py --recipients 300 --multicast --latency-ms 80 --error-rate 0.02
+  python line_loadtest.py --target text --iterations 20
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import line_stub_server
+
+
+def _percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="LINE 送信処理の負荷試験（代替サーバー使用）")
+    parser.add_argument("--recipients", type=int, default=100, help="合成する送信先の数")
+    parser.add_argument("--assignments", type=int, default=20, help="合成する課題の数（多いと分割送信になる）")
+    parser.add_argument("--iterations", type=int, default=1, help="送信を繰り返す回数")
+    parser.add_argument("--target", choices=("reminder", "text"), default="reminder",
+                        help="reminder: send_reminder / text: _send_text_to_all に短文を送る")
+    parser.add_argument("--multicast", action="store_true", help="LINE_USE_MULTICAST を有効にして送る")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rps-limit", type=float, default=0.0)
+    parser.add_argument("--verbose", action="store_true", help="送信失敗のログも表示する")
+    args = parser.parse_args(argv)
+
+    state = line_stub_server.StubState(args.latency_ms, args.jitter_ms, args.error_rate, args.rps_limit)
+    server = line_stub_server.start_stub(state)
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    # line_sender（config）を読み込む前に送信先を代替サーバーに向ける
+    os.environ["LINE_API_BASE"] = base
+    os.environ["LINE_USE_MULTICAST"] = "1" if args.multicast else "0"
+    os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "loadtest-token")
+    import line_sender
+    from models import Assignment
+
+    # .env で上書きされて実際の LINE に向いていたら中止する
+    if not line_sender.LINE_PUSH_URL.startswith(base) or not line_sender.LINE_CHANNEL_ACCESS_TOKEN:
+        print(f"送信先が代替サーバーになっていません（{line_sender.LINE_PUSH_URL}）。.env の LINE_API_BASE を確認してください",
+              file=sys.stderr)
+        return 1
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+
+    latencies: list[float] = []
+    original_post = line_sender._post
+
+    def timed_post(*args, **kwargs) -> bool:
+        # _post の引数（budget など）が増えてもそのまま渡す
+        t0 = time.perf_counter()
+        try:
+            return original_post(*args, **kwargs)
+        finally:
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    line_sender._post = timed_post
+
+    user_ids = [f"U{i:032x}" for i in range(args.recipients)]
+    now = datetime.now()
+    assignments = [
+        Assignment(
+            title=f"第{i + 1}回 レポート課題（負荷試験用の長めのタイトル {i:04d}）",
+            due_date=now + timedelta(hours=i),
+            course_name=f"授業科目 {i % 12:02d}",
+            url=f"https://moodle.example.ac.jp/mod/assign/view.php?id={1000 + i}",
+            description_preview="説明文のプレビュー。" * 4,
+        )
+        for i in range(args.assignments)
+    ]
+
+    ok = 0
+    started = time.perf_counter()
+    for _ in range(args.iterations):
+        if args.target == "reminder":
+            ok += line_sender.send_reminder(assignments, 1, user_ids)
+        else:
+            ok += line_sender._send_text_to_all("負荷試験メッセージ", user_ids)
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    counts = state.snapshot()
+    delivered = counts["recipients"]  # 受け付けられた（送信先 × リクエスト）の数
+    print(f"target={args.target} recipients={args.recipients} assignments={args.assignments} "
+          f"iterations={args.iterations} multicast={args.multicast}")
+    print(f"elapsed           {elapsed:.3f} s")
+    print(f"requests          {counts['requests']} (push={counts['push']} multicast={counts['multicast']} "
+          f"429={counts['status_429']} 400={counts['status_400']})")
+    print(f"messages/s        {delivered / elapsed if elapsed else 0:.1f} (delivered={delivered})")
+    print(f"requests/s        {counts['requests'] / elapsed if elapsed else 0:.1f}")
+    if latencies:
+        print(f"latency ms        p50={_percentile(latencies, 50):.1f} p95={_percentile(latencies, 95):.1f} "
+              f"p99={_percentile(latencies, 99):.1f} max={max(latencies):.1f} mean={statistics.fmean(latencies):.1f}")
+    print(f"successful sends  {ok}/{args.iterations}")
+    return 0 if ok == args.iterations else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -3,18 +3,25 @@ LINE Messaging API でプッシュメッセージを送信する。
 """
 import logging
 import re
-from typing import List
+from typing import List, Optional
 
 import requests
 
-from config import LINE_CHANNEL_ACCESS_TOKEN, LINE_USER_IDS, MOODLE_URL
+from config import LINE_API_BASE, LINE_CHANNEL_ACCESS_TOKEN, LINE_USE_MULTICAST, LINE_USER_IDS, MOODLE_URL
 from models import Assignment
+from profiler import stage
+from run_budget import RunBudget
 
 logger = logging.getLogger(__name__)
 
-LINE_PUSH_URL = "https://api.line.me/v2/bot/message/push"
+LINE_PUSH_URL = f"{LINE_API_BASE}/v2/bot/message/push"
+LINE_MULTICAST_URL = f"{LINE_API_BASE}/v2/bot/message/multicast"
+# マルチキャストの 1 リクエストあたりの最大送信先数（LINE の仕様）
+MAX_MULTICAST_RECIPIENTS = 500
 # テキストメッセージは最大 5000 文字（LINE の仕様）
 MAX_TEXT_LENGTH = 5000
+# LINE API のタイムアウト（秒）。実行の時間予算があれば残り時間に収める
+SEND_TIMEOUT = 30
 
 # LINE User ID: U + 英数字32文字（改行・スペース等の混入を防ぐ）
 LINE_USER_ID_PATTERN = re.compile(r"^U[a-zA-Z0-9]{32}$")
@@ -25,7 +32,7 @@ def _sanitize_user_id(uid: str) -> str:
     return "".join(c for c in uid if c.isalnum() or c == "_")
 
 
-def send_text(to_user_id: str, text: str) -> bool:
+def send_text(to_user_id: str, text: str, budget: Optional[RunBudget] = None) -> bool:
     """
     指定ユーザー（またはグループ）にテキストを 1 通送信する。
     Returns:
@@ -49,17 +56,37 @@ def send_text(to_user_id: str, text: str) -> bool:
         )
         return False
 
-    headers = {
-        "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
     payload = {
         "to": to_user_id,
         "messages": [{"type": "text", "text": text[:MAX_TEXT_LENGTH]}],
     }
+    return _post(LINE_PUSH_URL, payload, budget)
+
+
+def send_multicast(user_ids: List[str], text: str, budget: Optional[RunBudget] = None) -> bool:
+    """
+    複数ユーザー（最大 MAX_MULTICAST_RECIPIENTS 人、グループ不可）に同じテキストを 1 リクエストで送信する。
+    Returns:
+        成功なら True。
+    """
+    if not LINE_CHANNEL_ACCESS_TOKEN:
+        logger.error("LINE_CHANNEL_ACCESS_TOKEN が設定されていません")
+        return False
+    payload = {
+        "to": user_ids,
+        "messages": [{"type": "text", "text": text[:MAX_TEXT_LENGTH]}],
+    }
+    return _post(LINE_MULTICAST_URL, payload, budget)
+
 
+def _post(url: str, payload: dict, budget: Optional[RunBudget] = None) -> bool:
+    headers = {
+        "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}",
+        "Content-Type": "application/json",
+    }
     try:
-        r = requests.post(LINE_PUSH_URL, json=payload, headers=headers, timeout=30)
+        timeout = budget.send_timeout(SEND_TIMEOUT) if budget is not None else SEND_TIMEOUT
+        r = requests.post(url, json=payload, headers=headers, timeout=timeout)
         r.raise_for_status()
         return True
     except requests.RequestException as e:
@@ -72,44 +99,67 @@ def send_text(to_user_id: str, text: str) -> bool:
         return False
 
 
-def _send_text_to_all(text: str) -> bool:
-    """全ユーザーにテキストを送信する。1人でも失敗したら False を返す。"""
-    if not LINE_USER_IDS:
+def _send_text_to_all(text: str, user_ids: Optional[List[str]] = None, budget: Optional[RunBudget] = None) -> bool:
+    """
+    全ユーザー（user_ids 省略時は LINE_USER_ID）にテキストを送信する。1人でも失敗したら False を返す。
+    LINE_USE_MULTICAST 有効時は、ユーザー ID を最大 500 人ずつまとめて送る。
+    """
+    user_ids = LINE_USER_IDS if user_ids is None else user_ids
+    if not user_ids:
         logger.error("LINE_USER_ID が設定されていません")
         return False
-    results = [send_text(uid, text) for uid in LINE_USER_IDS]
+    if LINE_USE_MULTICAST and len(user_ids) > 1:
+        valid = [u for u in (_sanitize_user_id(uid.strip()) for uid in user_ids) if LINE_USER_ID_PATTERN.match(u)]
+        results = [len(valid) == len(user_ids)]
+        if len(valid) < len(user_ids):
+            logger.error("LINE_USER_ID の形式が不正なものがあります（%d 件中 %d 件が有効）", len(user_ids), len(valid))
+        for i in range(0, len(valid), MAX_MULTICAST_RECIPIENTS):
+            results.append(send_multicast(valid[i:i + MAX_MULTICAST_RECIPIENTS], text, budget))
+        return all(results)
+    results = [send_text(uid, text, budget) for uid in user_ids]
     return all(results)
 
 
-def format_reminder_message(assignments: List[Assignment], reminder_days: int) -> str:
-    """課題リストを LINE 用のリマインド文に整形する。"""
+def format_reminder_message(assignments: List[Assignment], reminder_days: int, note: Optional[str] = None) -> str:
+    """課題リストを LINE 用のリマインド文に整形する。note（一部のみ取得した旨など）は末尾に付ける。"""
     if not assignments:
-        return "締切が近い課題はありません。"
-
-    lines = [f"【Moodle リマインド】締切 {reminder_days} 日以内の課題", ""]
-    for a in assignments:
-        lines.append(a.format_for_line(MOODLE_URL))
-        lines.append("")
-    return "\n".join(lines).strip()
-
-
-def send_reminder(assignments: List[Assignment], reminder_days: int) -> bool:
+        return "締切が近い課題はありません。" + (f"\n\n{note}" if note else "")
+
+    with stage("format"):
+        lines = [f"【Moodle リマインド】締切 {reminder_days} 日以内の課題", ""]
+        for a in assignments:
+            lines.append(a.format_for_line(MOODLE_URL))
+            lines.append("")
+        if note:
+            lines.append(note)
+        return "\n".join(lines).strip()
+
+
+def send_reminder(
+    assignments: List[Assignment],
+    reminder_days: int,
+    user_ids: Optional[List[str]] = None,
+    note: Optional[str] = None,
+    budget: Optional[RunBudget] = None,
+) -> bool:
     """
     リマインドメッセージを LINE で送信する。
-    長い場合は複数メッセージに分割して全ユーザーに送る。
+    長い場合は複数メッセージに分割して全ユーザー（user_ids 省略時は LINE_USER_ID）に送る。
+    budget があれば各リクエストのタイムアウトを実行の残り時間に収める。
     """
-    body = format_reminder_message(assignments, reminder_days)
-    if len(body) <= MAX_TEXT_LENGTH:
-        return _send_text_to_all(body)
-    # 分割送信
-    sent = True
-    chunk = ""
-    for line in body.split("\n"):
-        if len(chunk) + len(line) + 1 > MAX_TEXT_LENGTH and chunk:
-            if not _send_text_to_all(chunk):
-                sent = False
-            chunk = ""
-        chunk += (line + "\n") if chunk else line
-    if chunk and sent:
-        sent = _send_text_to_all(chunk.strip())
-    return sent
+    body = format_reminder_message(assignments, reminder_days, note)
+    with stage("send"):
+        if len(body) <= MAX_TEXT_LENGTH:
+            return _send_text_to_all(body, user_ids, budget)
+        # 分割送信
+        sent = True
+        chunk = ""
+        for line in body.split("\n"):
+            if len(chunk) + len(line) + 1 > MAX_TEXT_LENGTH and chunk:
+                if not _send_text_to_all(chunk, user_ids, budget):
+                    sent = False
+                chunk = ""
+            chunk += (line + "\n") if chunk else line
+        if chunk and sent:
+            sent = _send_text_to_all(chunk.strip(), user_ids, budget)
+        return sent
@@ -0,0 +1,188 @@
+"""
+LINE Messaging API（push / multicast）のローカル代替サーバー。
+実際の api.line.me や送信枠を使わずに、送信処理の動作確認・負荷試験を行うために使う。
+
+- 応答までの遅延（--latency-ms / --jitter-ms）
+- 429 の注入（--error-rate の確率、または --rps-limit を超えた分）
+- 受け付けたリクエストの記録（--record FILE に JSON Lines、GET /stats で集計）
+
+使い方:
+  python line_stub_server.py --port 8081 --latency-ms 50 --error-rate 0.05
+  LINE_API_BASE=http://127.0.0.1:8081 python main.py
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+PUSH_PATH = "/v2/bot/message/push"
+MULTICAST_PATH = "/v2/bot/message/multicast"
+
+
+class StubState:
+    """代替サーバーの設定と受信記録（スレッド間で共有）。"""
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        rps_limit: float = 0.0,
+        record_path: Optional[Path] = None,
+    ) -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rps_limit = rps_limit
+        self.record_path = record_path
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "push": 0, "multicast": 0, "recipients": 0, "messages": 0, "status_429": 0, "status_400": 0}
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._record_file = record_path.open("a", encoding="utf-8") if record_path else None
+
+    def over_limit(self) -> bool:
+        """1 秒ごとの窓で rps_limit を超えたら True。"""
+        if self.rps_limit <= 0:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start, self._window_count = now, 0
+            self._window_count += 1
+            return self._window_count > self.rps_limit
+
+    def record(self, entry: dict) -> None:
+        with self.lock:
+            self.counts["requests"] += 1
+            status = entry["status"]
+            if status == 429:
+                self.counts["status_429"] += 1
+            elif status == 400:
+                self.counts["status_400"] += 1
+            else:
+                self.counts[entry["endpoint"]] += 1
+                self.counts["recipients"] += entry["recipients"]
+                self.counts["messages"] += entry["messages"]
+            if self._record_file:
+                self._record_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self._record_file.flush()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.counts)
+
+    def close(self) -> None:
+        if self._record_file:
+            self._record_file.close()
+
+
+class LineStubHandler(BaseHTTPRequestHandler):
+    server_version = "LineStub/1.0"
+    state: StubState
+
+    def _json(self, status: int, body: dict, extra_headers: Optional[dict] = None) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (extra_headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        endpoint = {PUSH_PATH: "push", MULTICAST_PATH: "multicast"}.get(self.path)
+        if endpoint is None:
+            self._json(404, {"message": "Not found"})
+            return
+        started = time.monotonic()
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b""
+        st = self.state
+
+        delay = st.latency_ms + (random.uniform(0, st.jitter_ms) if st.jitter_ms else 0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        entry = {"ts": time.time(), "endpoint": endpoint, "recipients": 0, "messages": 0}
+        try:
+            payload = json.loads(raw.decode("utf-8"))
+            to = payload.get("to")
+            recipients = to if isinstance(to, list) else [to]
+            messages = payload.get("messages") or []
+            valid = (
+                (self.headers.get("Authorization") or "").startswith("Bearer ")
+                and all(isinstance(r, str) and r for r in recipients)
+                and messages
+                and (endpoint == "multicast" or isinstance(to, str))
+            )
+        except (ValueError, AttributeError):
+            valid = False
+            recipients, messages = [], []
+
+        if not valid:
+            status = 400
+            self._json(400, {"message": "The request body has 1 error(s)"})
+        elif (st.error_rate and random.random() < st.error_rate) or st.over_limit():
+            status = 429
+            self._json(429, {"message": "The API rate limit has been exceeded. Try again later."}, {"Retry-After": "1"})
+        else:
+            status = 200
+            entry["recipients"] = len(recipients)
+            entry["messages"] = len(messages)
+            self._json(200, {"sentMessages": [{"id": str(random.getrandbits(60))} for _ in messages]})
+        entry["status"] = status
+        entry["server_ms"] = round((time.monotonic() - started) * 1000, 3)
+        st.record(entry)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._json(200, self.state.snapshot())
+            return
+        self._json(404, {"message": "Not found"})
+
+    def log_message(self, format, *args):
+        pass  # アクセスログは出さない（負荷試験の妨げになるため）
+
+
+def start_stub(state: StubState, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """代替サーバーをバックグラウンドのスレッドで起動する（port=0 で空きポート）。"""
+    handler = type("BoundLineStubHandler", (LineStubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="line-stub", daemon=True).start()
+    return server
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="LINE Messaging API（push / multicast）のローカル代替サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="応答までの固定遅延（ミリ秒）")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="遅延に加える 0〜N ミリ秒のばらつき")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="429 を返す確率（0〜1）")
+    parser.add_argument("--rps-limit", type=float, default=0.0, help="1 秒あたりの上限。超えた分は 429（0 で無制限）")
+    parser.add_argument("--record", type=Path, help="受け付けたリクエストを JSON Lines で追記するファイル")
+    args = parser.parse_args(argv)
+
+    state = StubState(args.latency_ms, args.jitter_ms, args.error_rate, args.rps_limit, args.record)
+    server = start_stub(state, args.host, args.port)
+    print(f"LINE 代替サーバー起動: http://{args.host}:{server.server_port}  (LINE_API_BASE に指定)  Ctrl+C で終了")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(f"\n終了しました。{json.dumps(state.snapshot(), ensure_ascii=False)}")
+        server.shutdown()
+        state.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
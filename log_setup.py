@@ -0,0 +1,177 @@
+"""
+ログ出力の設定。
+
+ログ呼び出しはキュー（QueueHandler）に積むだけにして、標準エラー・ファイルへの書き込みは
+バックグラウンドのスレッド（QueueListener）が行う。ファイルはサイズまたは日付でローテーションし、
+古いファイルは gzip 圧縮して LOG_BACKUP_COUNT 世代だけ残す。
+LOG_FORMAT=json では 1 行 1 JSON（run_id・stage 付き）で出力する。
+"""
+import atexit
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from profiler import current_stage
+
+# logging.handlers 等は setup_logging() で読み込む（ログを出さずに終了する実行の起動を遅くしないため）
+if TYPE_CHECKING:
+    import logging.handlers
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+# キューに積む前に例外を文字列にするためのフォーマッタ
+_EXC_FORMATTER = logging.Formatter()
+
+_listener: Optional["logging.handlers.QueueListener"] = None
+_atexit_registered = False
+
+
+def new_run_id() -> str:
+    """実行ごとの識別子（ログ・スナップショットで共通に使う）。"""
+    return os.urandom(6).hex()
+
+
+class _ContextFilter(logging.Filter):
+    """呼び出し元スレッドで run_id と処理段階（profiler.stage）をレコードに付ける。"""
+
+    def __init__(self, run_id: str) -> None:
+        super().__init__()
+        self.run_id = run_id
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run_id = self.run_id
+        record.stage = current_stage() or ""
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """1 行 1 JSON のフォーマッタ。"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "run_id": getattr(record, "run_id", ""),
+            "stage": getattr(record, "stage", ""),
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # キュー経由のレコードは _queue_handler で例外を文字列にしてある
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _queue_handler(q) -> "logging.handlers.QueueHandler":
+    """
+    例外を exc_text（文字列）にしてからキューに積む QueueHandler。
+    標準の QueueHandler.prepare() はメッセージに例外を連結して exc_info を消すため、
+    JsonFormatter が "exc" を出せなくなる（text 形式の出力は変わらない）。
+    """
+    import copy
+    import logging.handlers
+
+    class _Handler(logging.handlers.QueueHandler):
+        def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+            record = copy.copy(record)
+            record.message = record.getMessage()
+            record.msg = record.message
+            record.args = None
+            if record.exc_info:
+                record.exc_text = record.exc_text or _EXC_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+            return record
+
+    return _Handler(q)
+
+
+def _gzip_namer(name: str) -> str:
+    return name + ".gz"
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    import gzip
+    import shutil
+
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def _file_handler(log_file: Path, rotate: str, max_bytes: int, backup_count: int) -> logging.Handler:
+    import logging.handlers
+
+    if rotate == "time":
+        handler: logging.handlers.BaseRotatingHandler = logging.handlers.TimedRotatingFileHandler(
+            log_file, when="midnight", backupCount=backup_count, encoding="utf-8"
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+    handler.namer = _gzip_namer
+    handler.rotator = _gzip_rotator
+    return handler
+
+
+def setup_logging(
+    log_dir: Optional[Path],
+    run_id: str,
+    level: str = "INFO",
+    fmt: str = "text",
+    rotate: str = "size",
+    max_bytes: int = 5 * 1024 * 1024,
+    backup_count: int = 7,
+) -> None:
+    """
+    ルートロガーをキュー経由の出力に設定する。
+    log_dir が None または書き込めない場合（Railway 等）は標準エラーのみ。
+    設定済み（shutdown_logging() 前）なら何もしない（リスナー・終了時の処理を重複させない）。
+    """
+    import logging.handlers
+    import queue
+
+    global _listener, _atexit_registered
+    if _listener is not None:
+        return
+    formatter: logging.Formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers: list[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+    if log_dir is not None:
+        try:
+            Path(log_dir).mkdir(parents=True, exist_ok=True)
+            handlers.append(_file_handler(Path(log_dir) / "moodle_reminder.log", rotate, max_bytes, backup_count))
+        except OSError:
+            pass  # ファイルに書けない環境では stderr のみ
+    for h in handlers:
+        h.setFormatter(formatter)
+
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _queue_handler(q)
+    queue_handler.addFilter(_ContextFilter(run_id))
+
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+
+    _listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    _listener.start()
+    if not _atexit_registered:
+        atexit.register(shutdown_logging)
+        _atexit_registered = True
+
+
+def shutdown_logging() -> None:
+    """キューに残ったログを書き出してバックグラウンドスレッドを止める。"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for h in _listener.handlers:
+            h.close()
+        _listener = None
@@ -1,67 +1,260 @@
 """
 Moodle の課題を取得し、締切が N 日以内のものを LINE に送信する。
 タスクスケジューラから毎日実行する想定。
+
+オプション:
+  --profile        cProfile + tracemalloc で実行し、結果を PROFILE_DIR に保存
+  --record DIR     Moodle の応答を DIR に記録する
+  --replay DIR     記録済みの応答で実行する（Moodle にアクセスしない）
+  --dry-run        LINE に送信せず、送信内容を標準出力に表示する
+  --if-due         次回チェック時刻（STATE_DIR/next_run.json）前なら何もせず終了
+
+起動を速くするため、requests / bs4 / pyotp を使うモジュール（moodle_scraper・line_sender など）は
+それが必要な処理の中で読み込む（--if-due で終了する実行では読み込まない）。
+起動時間は python -m benchmarks.startup で確認できる。
 """
+import argparse
 import logging
 import sys
+import time
 import traceback
+from datetime import timedelta
 from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
 try:
-    from config import MOODLE_URL, PROJECT_ROOT, REMINDER_DAYS, _ENV_LOADED_FROM
-    from line_sender import send_reminder
-    from moodle_scraper import fetch_assignments
+    import log_setup
+    from config import settings
 except Exception as e:
     print(f"インポートエラー: {e}", file=sys.stderr)
     traceback.print_exc()
     sys.exit(1)
 
-# ログを標準エラー＋ファイルに出力（プロジェクトルート基準の絶対パス）
-# Railway 等ではファイル書き込みができない場合があるため、ファイルはオプション
-handlers = [logging.StreamHandler(sys.stderr)]
-try:
-    LOG_DIR = PROJECT_ROOT / "logs"
-    LOG_DIR.mkdir(exist_ok=True)
-    LOG_FILE = LOG_DIR / "moodle_reminder.log"
-    handlers.append(logging.FileHandler(LOG_FILE, encoding="utf-8"))
-except OSError:
-    pass  # ファイルに書けない環境（Railway 等）では stderr のみ
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    handlers=handlers,
-)
+if TYPE_CHECKING:
+    import run_lock
+    from models import Assignment
+    from run_budget import RunBudget
+
+RUN_ID = log_setup.new_run_id()
 logger = logging.getLogger(__name__)
 
 
-def main() -> int:
+def _setup_logging() -> None:
+    """
+    ログを標準エラー＋ファイル（LOG_DIR、デフォルトはプロジェクトルートの logs）に出力
+    書き込みはバックグラウンドスレッドが行い、ファイルはローテーション・圧縮される
+    Railway 等ではファイル書き込みができない場合があるため、ファイルはオプション
+    """
+    cfg = settings()
+    log_setup.setup_logging(
+        cfg.LOG_DIR,
+        RUN_ID,
+        level=cfg.LOG_LEVEL,
+        fmt=cfg.LOG_FORMAT,
+        rotate=cfg.LOG_ROTATE,
+        max_bytes=cfg.LOG_MAX_BYTES,
+        backup_count=cfg.LOG_BACKUP_COUNT,
+    )
+
+
+def _fetch(budget: "RunBudget") -> Optional[list["Assignment"]]:
+    """
+    Moodle から課題を取得する。ログイン・2FA 再認証に失敗したら、またはホストが障害中なら None（課題 0 件として保存・通知しない）。
+    時間予算を途中で使い切ったら、それまでに取得できた分を返す（1 つも取得できなければ None）。
+    """
+    from circuit_breaker import CircuitOpenError
+    from moodle_scraper import LoginError, ReauthError, fetch_assignments
+    from run_budget import BudgetExceeded
+
+    try:
+        return fetch_assignments(budget)
+    except LoginError as e:
+        logger.error("%s（次回チェック時刻は変更しません）", e)
+        return None
+    except CircuitOpenError as e:
+        logger.error("課題を取得できませんでした（次回チェック時刻は変更しません）: %s", e)
+        return None
+    except ReauthError as e:
+        logger.error("2FA 再認証に失敗したため課題を取得できませんでした: %s", e)
+        return None
+    except BudgetExceeded as e:
+        logger.error("課題を 1 件も取得できないまま時間予算を使い切りました: %s", e)
+        return None
+
+
+def _fetch_single_flight(lock: "run_lock.RunLock", budget: "RunBudget") -> Optional[list["Assignment"]]:
+    """
+    ロックを取得できたら Moodle から取得してスナップショットを保存する。
+    別の実行が取得中なら終了を待ち、その実行のスナップショットを再利用する（ログインしない）。
+    待ち切れなければ None。
+    ログイン・再認証に失敗した実行（_fetch が None）は何も保存しない（前回のスナップショットを空で置き換えない）。
+    一部の取得元だけの結果（時間切れ）はスナップショット・アーカイブに保存しない（待っていた実行は自分で取得し直す）。
+    """
+    import snapshot
+
+    cfg = settings()
+    deadline = time.monotonic() + cfg.RUN_LOCK_WAIT_SECONDS
+    while True:
+        if lock.try_acquire():
+            assignments = _fetch(budget)
+            if assignments is None:
+                return None
+            if budget.partial:
+                logger.warning("一部の取得元のみの結果のため、スナップショット・アーカイブには保存しません")
+                return assignments
+            snapshot.save_snapshot(cfg.STATE_DIR, RUN_ID, assignments)
+            if cfg.ARCHIVE_ENABLED:
+                import deadline_archive
+
+                deadline_archive.record(cfg.ARCHIVE_DIR, assignments, account=cfg.MOODLE_USER)
+            return assignments
+        holder_id = (lock.holder() or {}).get("run_id")
+        logger.info("別の実行 (run_id=%s) が取得中のため、終了を待って結果を再利用します", holder_id)
+        wait = max(0.0, deadline - time.monotonic())
+        left = budget.remaining()
+        if left is not None:
+            wait = min(wait, max(0.0, left))
+        if not lock.wait_for_release(wait):
+            logger.error("別の実行 (run_id=%s) が %d 秒以内に終わりませんでした", holder_id, cfg.RUN_LOCK_WAIT_SECONDS)
+            return None
+        snap = snapshot.load_snapshot(cfg.STATE_DIR)
+        if snap is not None and holder_id and snap.run_id == holder_id:
+            logger.info("run_id=%s の取得結果を再利用します（%s 取得）", holder_id, snap.fetched_at.isoformat(timespec="seconds"))
+            return snap.assignments
+        # 待っていた実行が取得前に異常終了した場合は、自分でロックを取って取得する
+
+
+def main(dry_run: bool = False, budget: Optional["RunBudget"] = None) -> int:
     """0: 成功, 1: エラー"""
-    logger.info("Moodle リマインドを開始（REMINDER_DAYS=%d 日以内の課題）", REMINDER_DAYS)
-    if _ENV_LOADED_FROM:
-        logger.info(".env 読み込み元: %s", _ENV_LOADED_FROM)
+    import recorded_pages
+    import run_lock
+    import scheduler
+    from run_budget import RunBudget
 
-    if not MOODLE_URL or MOODLE_URL == "https://moodle.example.ac.jp":
+    cfg = settings()
+    budget = budget or RunBudget(0)
+    logger.info("Moodle リマインドを開始（REMINDER_DAYS=%d 日以内の課題, run_id=%s）", cfg.REMINDER_DAYS, RUN_ID)
+    if cfg.ENV_LOADED_FROM:
+        logger.info(".env 読み込み元: %s", cfg.ENV_LOADED_FROM)
+    if budget.enabled:
+        logger.info("実行の時間予算: %.0f 秒（うち送信用 %.0f 秒）", budget.seconds, budget.send_reserve)
+
+    if not cfg.MOODLE_URL or cfg.MOODLE_URL == "https://moodle.example.ac.jp":
         logger.error(".env の MOODLE_URL を設定してください")
         return 1
 
-    assignments = fetch_assignments()
-    logger.info("取得した課題数: %d", len(assignments))
+    if recorded_pages.is_replaying():
+        # 記録済みページの再生は実サーバーにアクセスしないため、ロック・状態の保存は不要
+        assignments = _fetch(budget)
+        if assignments is None:
+            return 1
+        logger.info("取得した課題数: %d", len(assignments))
+        due_soon = [a for a in assignments if a.is_due_within_days(cfg.REMINDER_DAYS)]
+        return _deliver(due_soon, dry_run=dry_run, budget=budget)
+
+    # 送信が終わるまでロックを持ち続け、待っていた実行の重複送信を防ぐ
+    with run_lock.RunLock(cfg.STATE_DIR, RUN_ID, cfg.RUN_LOCK_LEASE_SECONDS) as lock:
+        assignments = _fetch_single_flight(lock, budget)
+        if assignments is None:
+            return 1
+        logger.info("取得した課題数: %d", len(assignments))
+        scheduler.schedule_next(
+            cfg.STATE_DIR,
+            assignments,
+            cfg.REMINDER_DAYS,
+            min_interval=timedelta(minutes=cfg.POLL_MIN_INTERVAL_MINUTES),
+            max_interval=timedelta(hours=cfg.POLL_MAX_INTERVAL_HOURS),
+            window_entry_hour=cfg.POLL_WINDOW_ENTRY_HOUR,
+        )
+        due_soon = [a for a in assignments if a.is_due_within_days(cfg.REMINDER_DAYS)]
+        return _deliver(due_soon, dry_run=dry_run, budget=budget)
+
+
+def _deliver(due_soon: list["Assignment"], dry_run: bool, budget: "RunBudget") -> int:
+    """
+    締切が近い課題を LINE に送信する。
+    同じ内容を SEND_DEDUP_MINUTES 以内に送っていれば、または同じ課題の組を今日すでに送っていれば省略する。
+    時間切れで一部の取得元だけの結果なら、その旨をメッセージに注記する。
+    """
+    import run_lock
+    from line_sender import format_reminder_message, send_reminder
 
-    due_soon = [a for a in assignments if a.is_due_within_days(REMINDER_DAYS)]
-    logger.info("締切 %d 日以内の課題数: %d", REMINDER_DAYS, len(due_soon))
-    if not send_reminder(due_soon, REMINDER_DAYS):
+    cfg = settings()
+    logger.info("締切 %d 日以内の課題数: %d", cfg.REMINDER_DAYS, len(due_soon))
+    note = budget.partial_note()
+    if dry_run:
+        print(format_reminder_message(due_soon, cfg.REMINDER_DAYS, note))
+        logger.info("--dry-run のため LINE には送信しません")
+        return 0
+
+    body = format_reminder_message(due_soon, cfg.REMINDER_DAYS, note)
+    if cfg.SEND_DEDUP_MINUTES and run_lock.already_sent(cfg.STATE_DIR, body, timedelta(minutes=cfg.SEND_DEDUP_MINUTES)):
+        logger.info("同じ内容を %d 分以内に送信済みのため、LINE には送信しません", cfg.SEND_DEDUP_MINUTES)
+        return 0
+    signature = run_lock.reminder_signature(due_soon)
+    if run_lock.already_reminded(cfg.STATE_DIR, signature):
+        logger.info("締切が近い課題が今日送信したときから変わっていないため、LINE には送信しません")
+        return 0
+    if not send_reminder(due_soon, cfg.REMINDER_DAYS, note=note, budget=budget):
         logger.error("LINE 送信に失敗しました")
         return 1
+    run_lock.mark_sent(cfg.STATE_DIR, body, RUN_ID, signature)
 
     logger.info("LINE 送信完了")
     return 0
 
 
+def _parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Moodle の課題を取得して LINE にリマインドを送る")
+    parser.add_argument("--profile", action="store_true", help="cProfile + tracemalloc で実行し結果を保存する")
+    parser.add_argument("--profile-dir", type=Path, help="プロファイル結果の保存先（デフォルトは PROFILE_DIR）")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--record", type=Path, metavar="DIR", help="Moodle の応答を DIR に記録する")
+    group.add_argument("--replay", type=Path, metavar="DIR", help="記録済みの応答で実行する")
+    parser.add_argument("--dry-run", action="store_true", help="LINE に送信せず内容を表示する")
+    parser.add_argument("--if-due", action="store_true", help="次回チェック時刻前なら何もせず終了する")
+    return parser.parse_args(argv)
+
+
+def run(argv: list[str]) -> int:
+    """コマンドライン引数に従って main() を実行する（必要ならプロファイル付き）。"""
+    args = _parse_args(argv)
+    cfg = settings()
+    # 時間予算は起動直後から数える（ロック待ち・ログイン・取得・送信のすべてを含む）
+    started = time.monotonic()
+    if args.if_due:
+        import scheduler
+
+        if not scheduler.is_due(cfg.STATE_DIR):
+            # 何もしない実行ではログファイルを開かない（標準出力に 1 行だけ出す）
+            print(f"次回チェック時刻前のためスキップします ({scheduler.load_state(cfg.STATE_DIR).get('next_run')})")
+            return 0
+
+    _setup_logging()
+    import profiler
+    import recorded_pages
+    from run_budget import RunBudget
+
+    budget = RunBudget(cfg.RUN_BUDGET_SECONDS, cfg.RUN_BUDGET_SEND_RESERVE_SECONDS, started=started)
+    recorded_pages.configure(record_dir=args.record, replay_dir=args.replay)
+
+    def target() -> int:
+        return main(dry_run=args.dry_run, budget=budget)
+
+    profile_dir = args.profile_dir or cfg.PROFILE_DIR
+    if args.profile:
+        return profiler.run_profiled(target, profile_dir, cfg.PROFILE_TOP_N)
+    if profiler.should_sample(cfg.PROFILE_SAMPLE_RATE):
+        # サンプリング時は tracemalloc を使わない軽量モード
+        logger.info("この実行をサンプリングしてプロファイルします (PROFILE_SAMPLE_RATE=%s)", cfg.PROFILE_SAMPLE_RATE)
+        return profiler.run_profiled(target, profile_dir, cfg.PROFILE_TOP_N, trace_memory=False)
+    return target()
+
+
 if __name__ == "__main__":
     print("Moodle リマインドを起動しています...", flush=True)
     try:
-        sys.exit(main())
+        sys.exit(run(sys.argv[1:]))
     except Exception as e:
         print(f"エラー: {e}", file=sys.stderr)
         traceback.print_exc()
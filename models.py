@@ -1,9 +1,35 @@
 """
 課題（Assignment）のデータ構造。
 """
+import re
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# 活動ページ（mod/<種別>/view.php?id=<コースモジュールID>）の URL
+_MOD_VIEW_PATTERN = re.compile(r"/mod/([a-z0-9_]+)/view\.php$", re.I)
+
+
+def assignment_key(url: str) -> str:
+    """
+    課題の同一性キー。Moodle のコースモジュール ID（mod/<種別>/view.php?id=N）があれば "<種別>:N"、
+    なければクエリ順・大文字小文字・フラグメントを正規化した URL 全体を使う。
+    """
+    parts = urlsplit(url.strip())
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    m = _MOD_VIEW_PATTERN.search(parts.path)
+    if m:
+        cmid = next((v for k, v in query if k == "id" and v.isdigit()), None)
+        if cmid:
+            return f"{m.group(1).lower()}:{cmid}"
+    return urlunsplit((
+        parts.scheme.lower(),
+        parts.netloc.lower(),
+        parts.path.rstrip("/") or "/",
+        urlencode(sorted(query)),
+        "",
+    ))
 
 
 @dataclass
@@ -16,6 +42,33 @@ class Assignment:
     url: str
     description_preview: str = ""
 
+    def to_dict(self) -> dict:
+        """JSON 保存用の dict（締切は ISO 8601 文字列）。"""
+        return {
+            "title": self.title,
+            "due_date": self.due_date.isoformat() if self.due_date else None,
+            "course_name": self.course_name,
+            "url": self.url,
+            "description_preview": self.description_preview,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Assignment":
+        """to_dict() の逆変換。"""
+        due = d.get("due_date")
+        return cls(
+            title=d.get("title") or "",
+            due_date=datetime.fromisoformat(due) if due else None,
+            course_name=d.get("course_name") or "",
+            url=d.get("url") or "",
+            description_preview=d.get("description_preview") or "",
+        )
+
+    @property
+    def key(self) -> str:
+        """同一課題の判定に使うキー（assignment_key 参照）。"""
+        return assignment_key(self.url)
+
     def is_due_within_days(self, days: int) -> bool:
         """締切が今日から days 日以内なら True。"""
         if self.due_date is None:
@@ -3,17 +3,43 @@ Moodle にログインし、カレンダー／ダッシュボードから課題
 """
 import logging
 import re
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Optional
 from urllib.parse import urljoin, urlparse
 
-import pyotp
 import requests
+import soupsieve as sv
 from bs4 import BeautifulSoup
 
-from config import ACCESS_INTERVAL, MOODLE_PASSWORD, MOODLE_URL, MOODLE_USER, PROJECT_ROOT, REQUEST_TIMEOUT, TOTP_SECRET
-from models import Assignment
+import layout_cache
+import parse_pool
+import recorded_pages
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from config import (
+    ACCESS_INTERVAL,
+    BASE_STATE_DIR,
+    CIRCUIT_COOLDOWN_SECONDS,
+    CIRCUIT_FAILURE_THRESHOLD,
+    HARVEST_CONCURRENCY,
+    HARVEST_COURSES,
+    HARVEST_MAX_COURSES,
+    HOST_RATE_BUDGET_PER_MINUTE,
+    JOB_QUEUE,
+    MOODLE_PASSWORD,
+    MOODLE_URL,
+    MOODLE_USER,
+    PROJECT_ROOT,
+    QUEUE_TOKEN,
+    REQUEST_TIMEOUT,
+    TOTP_SECRET,
+)
+from models import Assignment, assignment_key
+from profiler import stage
+from run_budget import BudgetExceeded, RunBudget
 
 logger = logging.getLogger(__name__)
 
@@ -22,20 +48,244 @@ logger = logging.getLogger(__name__)
 
 def _wait_between_requests() -> None:
     """学校サーバーへの負荷軽減・バグ時の連打防止のため、アクセス間に待機する"""
-    if ACCESS_INTERVAL > 0:
+    if ACCESS_INTERVAL > 0 and not recorded_pages.is_replaying():
         time.sleep(ACCESS_INTERVAL)
 
 
-def _session() -> requests.Session:
-    s = requests.Session()
+class _RateLimiter:
+    """複数スレッドから呼ばれても、リクエストの開始間隔を全体で interval 秒以上あける。"""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def acquire(self) -> None:
+        if self.interval <= 0 or recorded_pages.is_replaying():
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+_rate_limiter = _RateLimiter(ACCESS_INTERVAL)
+
+# ジョブキューで一度に予約するホスト別リクエスト枠の数
+_SLOT_BATCH = 5
+
+
+class _HostBudget:
+    """
+    全ワーカー（複数ノード）合計でのホスト別リクエスト枠（HOST_RATE_BUDGET_PER_MINUTE）。
+    ジョブキューで枠を予約し、割り当てられた時刻まで待つ。キューに届かないときは待たずに続ける
+    （ACCESS_INTERVAL による間隔はそのまま効く）。
+    リクエストごとにキュー（SQLite の書き込み・サーバーへの往復）を使わないよう、枠は _SLOT_BATCH 個ずつまとめて予約し、
+    プロセス内で順に使う。使わずに過ぎた枠は捨てる（まとめて送らない）。
+    """
+
+    def __init__(self, per_minute: float, queue_location: str) -> None:
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self.queue_location = queue_location
+        self._queue = None
+        self._lock = threading.Lock()
+        self._warned = False
+        # ホスト -> 予約済みで未使用の枠の時刻（UNIX 時刻、古い順）
+        self._slots: dict[str, deque[float]] = {}
+
+    def _take_slot(self, host: str) -> float:
+        """予約済みの枠を 1 つ取り出し、その時刻まで待つ秒数を返す。なければまとめて予約する。self._lock を持って呼ぶ。"""
+        slots = self._slots.setdefault(host, deque())
+        now = time.time()
+        while slots and slots[0] < now - self.interval:
+            slots.popleft()
+        if not slots:
+            if self._queue is None:
+                import job_queue  # sqlite3 を使うため、枠を使う設定のときだけ読み込む
+
+                self._queue = job_queue.open_queue(self.queue_location, QUEUE_TOKEN)
+            # 待ち時間はキュー側の時刻で計算されるため、ノード間の時計のずれの影響を受けない
+            start = time.time() + self._queue.reserve_slot(host, self.interval, _SLOT_BATCH)
+            slots.extend(start + i * self.interval for i in range(_SLOT_BATCH))
+        return slots.popleft() - now
+
+    def wait(self, host: str, budget: Optional[RunBudget] = None) -> None:
+        if self.interval <= 0 or recorded_pages.is_replaying():
+            return
+        try:
+            with self._lock:
+                delay = self._take_slot(host)
+        except Exception as e:
+            if not self._warned:
+                logger.warning("[リクエスト枠] ジョブキューで枠を予約できないため、枠なしで続けます: %s", e)
+                self._warned = True
+            return
+        if delay > 0:
+            if budget is not None and not budget.sleep_allowed(delay):
+                raise BudgetExceeded(f"{host} のリクエスト枠が {delay:.0f} 秒後のため、実行の時間予算内に送れません")
+            logger.debug("[リクエスト枠] %s: %.1f 秒待ちます", host, delay)
+            time.sleep(delay)
+
+
+_host_budget = _HostBudget(HOST_RATE_BUDGET_PER_MINUTE, JOB_QUEUE)
+
+
+_breaker: Optional[CircuitBreaker] = None
+
+
+def _get_breaker() -> CircuitBreaker:
+    """
+    プロセス内で共有するサーキットブレーカー。
+    障害はアカウントではなくホストのものなので、状態はアカウント別の STATE_DIR ではなく
+    全アカウント共通の BASE_STATE_DIR に保存する。
+    """
+    global _breaker
+    if _breaker is None:
+        _breaker = CircuitBreaker(BASE_STATE_DIR, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_COOLDOWN_SECONDS)
+        for host, state in _breaker.states().items():
+            logger.warning("[ブレーカー] %s は %s です", host, state)
+    return _breaker
+
+
+class ReauthError(RuntimeError):
+    """2FA 再認証（SMAuthenticator）を完了できなかった（このまま抽出しても課題は 0 件になる）。"""
+
+
+class LoginError(RuntimeError):
+    """Moodle にログインできなかった（課題 0 件とは区別する。理由はログイン処理のログを参照）。"""
+
+
+class SSOState:
+    """
+    セッション内の SSO・2FA 再認証の状態。
+    再認証は同時に 1 つだけ行い、一度使った TOTP コード（時間ステップ）は再利用しない。
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.RLock()
+        self.last_totp_step: Optional[int] = None
+        self.reauth_count = 0
+        self.reauth_failures = 0
+        self.reauthed_at: Optional[datetime] = None
+        # 再認証で発行された Cookie の (ドメイン, 名前)
+        self.sso_cookies: set[tuple[str, str]] = set()
+
+
+def _timeout_part(timeout, i: int):
+    """requests の timeout の接続（i=0）・読み込み（i=1）側の値。"""
+    return timeout[i] if isinstance(timeout, tuple) else timeout
+
+
+class MoodleSession(requests.Session):
+    """
+    リダイレクトを含む各リクエストをホスト単位のサーキットブレーカーに通すセッション。
+    障害中のホストには送らず CircuitOpenError（requests.ConnectionError）を送出する。
+    budget があれば各リクエストのタイムアウトを実行の残り時間に収め、使い切ったら BudgetExceeded を送出する。
+    """
+
+    def __init__(self, breaker: Optional[CircuitBreaker] = None, budget: Optional[RunBudget] = None) -> None:
+        super().__init__()
+        self.breaker = breaker
+        self.budget = budget
+        self.sso_state = SSOState()
+
+    def send(self, request, **kwargs):
+        host = urlparse(request.url).netloc.lower()
+        # 障害中のホストには、リクエスト枠を予約したり待ったりせずにすぐ失敗する
+        probing = self.breaker.before_request(host) if self.breaker is not None else False
+        try:
+            _host_budget.wait(host, self.budget)
+            timeout = kwargs.get("timeout")
+            if self.budget is not None:
+                kwargs["timeout"] = self.budget.clamp_timeout(timeout)
+            return self._send_recorded(request, host, timeout, **kwargs)
+        finally:
+            # 結果を記録しない例外（時間切れの BudgetExceeded・TooManyRedirects など）で終わっても試行枠を返す
+            if probing:
+                self.breaker.release_probe(host)
+
+    def _budget_timed_out(self, e: requests.Timeout, requested, used) -> bool:
+        """
+        タイムアウト e が時間予算切れによるものか。残り時間に合わせて短くした側（接続・読み込み）のタイムアウトが
+        切れた場合と、残り時間がない場合だけ True（短くしていない側で切れたのはホストの障害として数える）。
+        """
+        if self.budget is None:
+            return False
+        if self.budget.expired():
+            return True
+        i = 0 if isinstance(e, requests.ConnectTimeout) else 1
+        return _timeout_part(used, i) != _timeout_part(requested, i)
+
+    def _send_recorded(self, request, host: str, requested_timeout, **kwargs):
+        """送信し、結果（接続エラー・タイムアウト・5xx は失敗）をブレーカーに記録する。"""
+        try:
+            r = super().send(request, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if isinstance(e, requests.Timeout) and self._budget_timed_out(e, requested_timeout, kwargs.get("timeout")):
+                raise BudgetExceeded(f"実行の時間予算の残りで {host} から応答がありませんでした") from e
+            if self.breaker is not None:
+                self.breaker.record_failure(host, f"{type(e).__name__}: {e}")
+            raise
+        if self.breaker is None:
+            return r
+        if r.status_code >= 500:
+            self.breaker.record_failure(host, f"HTTP {r.status_code}")
+        else:
+            self.breaker.record_success(host)
+        return r
+
+
+def _session(budget: Optional[RunBudget] = None) -> requests.Session:
+    # 記録済みページの再生では実サーバーの障害状態を変えないようブレーカーを使わない
+    s = MoodleSession(None if recorded_pages.is_replaying() else _get_breaker(), budget)
     s.headers.update({
         "User-Agent": "MoodleReminder/1.0 (Python; Windows)",
         "Accept": "text/html,application/xhtml+xml",
         "Accept-Language": "ja,en;q=0.9",
     })
+    recorded_pages.mount(s)
     return s
 
 
+def _sso_state(session: requests.Session) -> SSOState:
+    state = getattr(session, "sso_state", None)
+    if state is None:
+        state = session.sso_state = SSOState()
+    return state
+
+
+def _next_totp_code(session: requests.Session) -> str:
+    """
+    まだこのセッションで使っていない TOTP コードを返す。
+    直前に使ったコードと同じ時間ステップ（30 秒）なら、次のステップまで待つ（必要なときだけ待つ）。
+    """
+    import pyotp  # 2FA のあるログイン・再認証でだけ使う
+
+    totp = pyotp.TOTP(TOTP_SECRET)
+    state = _sso_state(session)
+    with state.lock:
+        step = int(time.time()) // totp.interval
+        if state.last_totp_step is not None and step <= state.last_totp_step:
+            wait = (state.last_totp_step + 1) * totp.interval - time.time() + 0.5
+            budget = getattr(session, "budget", None)
+            if wait > 0 and not recorded_pages.is_replaying():
+                if budget is not None and not budget.sleep_allowed(wait):
+                    raise BudgetExceeded(f"次の TOTP コードまで {wait:.0f} 秒待つ時間が実行の時間予算に残っていません")
+                logger.info("[TOTP] 現在のコードは使用済みのため、次のコードまで %.0f 秒待ちます", wait)
+                time.sleep(wait)
+            step = max(int(time.time()) // totp.interval, state.last_totp_step + 1)
+        state.last_totp_step = step
+        return totp.at(step * totp.interval)
+
+
+def _soup(html: str) -> BeautifulSoup:
+    """HTML をパースする（プロファイルでは parse 段階として計測）。"""
+    with stage("parse"):
+        return BeautifulSoup(html, "html.parser")
+
+
 def _find_login_link(soup: BeautifulSoup, current_url: str) -> Optional[str]:
     """ページ内の「ログイン」リンクを探す。右上・ヘッダーを優先し、テキスト・href・aria-label・img alt を判定。"""
     def link_text_and_attrs(elem):
@@ -88,12 +338,14 @@ def _login_direct(session: requests.Session) -> bool:
         r = session.get(base + "/", timeout=REQUEST_TIMEOUT)
         r.raise_for_status()
         _wait_between_requests()
+    except CircuitOpenError:
+        raise  # 障害中のホスト。ログイン失敗ではなく実行の失敗として扱う
     except requests.RequestException as e:
         logger.exception("[段階1] トップページに到達できませんでした: %s", e)
         return False
     logger.info("[段階1] トップページに到達しました (URL=%s)", r.url)
 
-    soup = BeautifulSoup(r.text, "html.parser")
+    soup = _soup(r.text)
     current_url = r.url
     login_page_url = current_url
 
@@ -154,7 +406,7 @@ def _login_direct(session: requests.Session) -> bool:
                 r = session.get(login_link, timeout=REQUEST_TIMEOUT)
                 r.raise_for_status()
                 _wait_between_requests()
-                soup = BeautifulSoup(r.text, "html.parser")
+                soup = _soup(r.text)
                 login_page_url = r.url
                 form = _get_form(soup)
                 if not form:
@@ -170,7 +422,7 @@ def _login_direct(session: requests.Session) -> bool:
                 r = session.get(f"{base}/login/index.php", timeout=REQUEST_TIMEOUT)
                 r.raise_for_status()
                 _wait_between_requests()
-                soup = BeautifulSoup(r.text, "html.parser")
+                soup = _soup(r.text)
                 login_page_url = r.url
                 form = _get_form(soup)
             except requests.RequestException as e:
@@ -197,7 +449,7 @@ def _login_direct(session: requests.Session) -> bool:
             r = session.post(post_url, data=gateway_payload, timeout=REQUEST_TIMEOUT, allow_redirects=True)
             r.raise_for_status()
             _wait_between_requests()
-            soup = BeautifulSoup(r.text, "html.parser")
+            soup = _soup(r.text)
             login_page_url = r.url
             form = _get_form(soup)
         except requests.RequestException as e:
@@ -273,11 +525,11 @@ def _login_direct(session: requests.Session) -> bool:
                 return name
         return None
 
-    if _is_2fa_page(r2.url, BeautifulSoup(r2.text, "html.parser")) and TOTP_SECRET:
-        soup2 = BeautifulSoup(r2.text, "html.parser")
+    if _is_2fa_page(r2.url, _soup(r2.text)) and TOTP_SECRET:
+        soup2 = _soup(r2.text)
         totp_field = _find_totp_field(soup2)
         if totp_field:
-            code = pyotp.TOTP(TOTP_SECRET).now()
+            code = _next_totp_code(session)
             logger.info("2FA コードを送信します")
             form2 = soup2.find("form")
             if form2:
@@ -293,7 +545,7 @@ def _login_direct(session: requests.Session) -> bool:
                 r3 = session.post(post_url2, data=payload2, timeout=REQUEST_TIMEOUT, allow_redirects=True)
                 r3.raise_for_status()
                 _wait_between_requests()
-                if _is_2fa_page(r3.url, BeautifulSoup(r3.text, "html.parser")):
+                if _is_2fa_page(r3.url, _soup(r3.text)):
                     logger.error("[段階4] 2FA 送信後も認証ページのまま。TOTP_SECRET を確認してください")
                     return False
                 logger.info("[段階4] ログインに成功しました（2FA 完了）")
@@ -312,7 +564,8 @@ def _login_direct(session: requests.Session) -> bool:
 
 def login(session: requests.Session) -> bool:
     """Moodle に直接ログイン（2FA 対応）。"""
-    return _login_direct(session)
+    with stage("login"):
+        return _login_direct(session)
 
 
 def _is_sso_gateway_page(soup: BeautifulSoup) -> bool:
@@ -356,44 +609,26 @@ def _follow_sso_gateways(session: requests.Session, html: str, current_url: str)
     """
     SSO ゲートウェイ・2FA 再認証が続く限り POST して遷移し、最終 HTML と URL を返す。
     """
-    soup = BeautifulSoup(html, "html.parser")
+    with stage("sso"), _sso_state(session).lock:
+        return _follow_sso_gateways_inner(session, html, current_url)
+
+
+def _follow_sso_gateways_inner(session: requests.Session, html: str, current_url: str) -> tuple[str, str]:
+    soup = _soup(html)
     for loop in range(8):
         is_2fa = _is_2fa_reauth_page(soup)
         is_gateway = _is_sso_gateway_page(soup)
         is_saml = _is_saml_redirect_page(soup)
         logger.info("[SSO判定] loop=%d url=%s is_2fa=%s is_gateway=%s is_saml=%s TOTP=%s", loop, current_url[:80], is_2fa, is_gateway, is_saml, bool(TOTP_SECRET))
         # 1) OMU 2FA 再認証を先に判定（smreload と totp が両方ある場合、totp を送る必要がある）
-        if _is_2fa_reauth_page(soup) and TOTP_SECRET:
+        if is_2fa and TOTP_SECRET:
             form = soup.find("form", action=re.compile(r"SMAuthenticator", re.I))
             if not form:
                 return html, current_url
-            action = form.get("action") or ""
-            post_url = urljoin(current_url, action) if action else current_url
-            payload = {}
-            for inp in form.find_all("input"):
-                n = inp.get("name")
-                if not n or inp.get("type") == "submit":
-                    continue
-                if n == "SM_UID":
-                    payload[n] = MOODLE_USER
-                elif n == "SM_PWD":
-                    payload[n] = pyotp.TOTP(TOTP_SECRET).now()
-                else:
-                    payload[n] = inp.get("value", "")
-            logger.info("[再認証] 2FA フォームを送信します")
-            try:
-                r = session.post(post_url, data=payload, timeout=REQUEST_TIMEOUT, allow_redirects=True)
-                r.raise_for_status()
-                _wait_between_requests()
-                html = r.text
-                current_url = r.url
-                soup = BeautifulSoup(html, "html.parser")
-            except requests.RequestException as e:
-                logger.warning("[再認証] 2FA 送信に失敗: %s", e)
-                return html, current_url
+            html, current_url, soup = _submit_reauth(session, form, current_url)
             continue
         # 2) 認証完了後の SAML リダイレクト（GET で Moodle へ戻る）
-        elif _is_saml_redirect_page(soup):
+        elif is_saml:
             form = soup.find("form", action=re.compile(r"AuthnRequestReceiver|SamlIdP", re.I))
             if not form:
                 return html, current_url
@@ -407,19 +642,20 @@ def _follow_sso_gateways(session: requests.Session, html: str, current_url: str)
                 _wait_between_requests()
                 html = r.text
                 current_url = r.url
-                soup = BeautifulSoup(html, "html.parser")
+                soup = _soup(html)
             except requests.RequestException as e:
                 logger.warning("[SSO判定] SAML リダイレクト送信に失敗: %s", e)
                 return html, current_url
             continue
         # 3) hidden のみのゲートウェイ
-        elif _is_sso_gateway_page(soup):
+        elif is_gateway:
             form = soup.find("form", action=re.compile(r"auth|AuthServer|MultiAuth", re.I))
             if not form:
                 return html, current_url
         else:
             if is_2fa and not TOTP_SECRET:
-                logger.warning("[SSO判定] 2FAページを検出しましたが TOTP_SECRET が未設定です。.env に TOTP_SECRET を追加してください")
+                # このまま抽出すると 0 件になり「課題なし」と誤って通知してしまうため中断する
+                raise ReauthError("2FA 再認証ページを検出しましたが TOTP_SECRET が未設定です。.env に TOTP_SECRET を追加してください")
             else:
                 logger.info("[SSO判定] ゲートウェイ/2FA 以外のページのため終了")
             return html, current_url
@@ -434,99 +670,209 @@ def _follow_sso_gateways(session: requests.Session, html: str, current_url: str)
             _wait_between_requests()
             html = r.text
             current_url = r.url
-            soup = BeautifulSoup(html, "html.parser")
+            soup = _soup(html)
         except requests.RequestException:
             return html, current_url
+    if _is_2fa_reauth_page(soup):
+        raise ReauthError("2FA 再認証が完了しないまま SSO の遷移回数の上限に達しました")
     return html, current_url
 
 
+# 再認証 1 回あたりの TOTP 送信の上限（拒否されたら次のコードで再試行する）
+_REAUTH_MAX_ATTEMPTS = 3
+
+
+def _submit_reauth(session: requests.Session, form, current_url: str) -> tuple[str, str, BeautifulSoup]:
+    """
+    OMU 2FA 再認証フォームに未使用の TOTP コードを送信する。
+    拒否された（再び再認証ページが返った）場合は次のコードで再試行し、上限を超えたら ReauthError。
+    """
+    state = _sso_state(session)
+    action = form.get("action") or ""
+    post_url = urljoin(current_url, action) if action else current_url
+    payload = {}
+    totp_field = None
+    for inp in form.find_all("input"):
+        n = inp.get("name")
+        if not n or inp.get("type") == "submit":
+            continue
+        if n == "SM_UID":
+            payload[n] = MOODLE_USER
+        elif n == "SM_PWD":
+            totp_field = n
+        else:
+            payload[n] = inp.get("value", "")
+    if state.reauth_count:
+        logger.warning(
+            "[再認証] この実行で %d 回目の再認証です（%s に発行された SSO Cookie: %s）",
+            state.reauth_count + 1,
+            state.reauthed_at.isoformat(timespec="seconds") if state.reauthed_at else "-",
+            ", ".join(sorted(name for _, name in state.sso_cookies)) or "なし",
+        )
+    before = {(c.domain, c.name) for c in session.cookies}
+    payload[totp_field or "SM_PWD"] = _next_totp_code(session)
+    logger.info("[再認証] 2FA フォームを送信します")
+    try:
+        r = session.post(post_url, data=payload, timeout=REQUEST_TIMEOUT, allow_redirects=True)
+        r.raise_for_status()
+        _wait_between_requests()
+    except requests.RequestException as e:
+        raise ReauthError(f"2FA 再認証の送信に失敗しました: {e}") from e
+    soup = _soup(r.text)
+    if _is_2fa_reauth_page(soup):
+        state.reauth_failures += 1
+        logger.warning("[再認証] TOTP コードが受け付けられませんでした（%d/%d 回目）", state.reauth_failures, _REAUTH_MAX_ATTEMPTS)
+        if state.reauth_failures >= _REAUTH_MAX_ATTEMPTS:
+            raise ReauthError(f"2FA 再認証に {_REAUTH_MAX_ATTEMPTS} 回失敗しました。TOTP_SECRET と PC の時刻を確認してください")
+        return r.text, r.url, soup
+    state.reauth_failures = 0
+    state.reauth_count += 1
+    state.reauthed_at = datetime.now()
+    state.sso_cookies |= {(c.domain, c.name) for c in session.cookies} - before
+    logger.info("[再認証] 完了しました（発行された Cookie: %d 個）", len(state.sso_cookies))
+    return r.text, r.url, soup
+
+
+_DATE_FORMATS = (
+    "%Y年%m月%d日 %H:%M",
+    "%Y年%m月%d日",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "%d %B %Y, %I:%M %p",
+    "%d %b %Y, %I:%M %p",
+    "%d/%m/%Y %H:%M",
+    "%d/%m/%Y",
+)
+# Moodle の表示形式（"2025年 02月 15日(土曜日) 23:59" / "Saturday, 15 February 2025, 11:59 PM"）の正規化用
+_WEEKDAY_PAREN_RE = re.compile(r"\s*[(（][^)）]*[)）]")
+_WEEKDAY_EN_RE = re.compile(r"^(?:Mon|Tue|Tues|Wed|Wednes|Thu|Thurs|Fri|Sat|Satur|Sun)(?:day)?,\s*", re.I)
+_JA_DATE_RE = re.compile(r"(\d{4})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日\s*")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def _normalize_date_text(text: str) -> str:
+    text = _WEEKDAY_PAREN_RE.sub("", text)
+    text = _WEEKDAY_EN_RE.sub("", text)
+    text = _JA_DATE_RE.sub(r"\1年\2月\3日 ", text)
+    return _SPACES_RE.sub(" ", text).strip()
+
+
 def _parse_date(text: str) -> Optional[datetime]:
     """よくある日付文字列を datetime に変換。"""
     if not text or not text.strip():
         return None
     text = text.strip()
     # 例: "2025年2月15日 23:59", "15 February 2025, 11:59 PM", "2025-02-15 23:59"
-    for fmt in (
-        "%Y年%m月%d日 %H:%M",
-        "%Y年%m月%d日",
-        "%Y-%m-%d %H:%M",
-        "%Y-%m-%d",
-        "%d %B %Y, %I:%M %p",
-        "%d %b %Y, %I:%M %p",
-        "%d/%m/%Y %H:%M",
-        "%d/%m/%Y",
-    ):
+    for fmt in _DATE_FORMATS:
         try:
             return datetime.strptime(text, fmt)
         except ValueError:
             continue
+    # 曜日・余分な空白を除いて再試行（課題一覧ページ等の表示形式）
+    normalized = _normalize_date_text(text)
+    if normalized != text:
+        for fmt in _DATE_FORMATS:
+            try:
+                return datetime.strptime(normalized, fmt)
+            except ValueError:
+                continue
     return None
 
 
-def _extract_assignments_from_calendar(session: requests.Session, base_url: str) -> List[Assignment]:
-    """カレンダー「今後の予定」ページからイベント（課題含む）を抽出。"""
+def _extract_assignments_from_calendar(
+    session: requests.Session, base_url: str, courses: Optional[dict[str, str]] = None
+) -> List[Assignment]:
+    """カレンダー「今後の予定」ページからイベント（課題含む）を抽出。courses を渡すと見つけた授業を追加する。"""
     base = base_url.rstrip("/")
     # 今後の予定ビュー（Moodle のバージョンでパスが少し違う場合あり）
     calendar_url = f"{base}/calendar/view.php?view=upcoming"
     try:
-        r = session.get(calendar_url, timeout=REQUEST_TIMEOUT)
-        r.raise_for_status()
-        _wait_between_requests()
+        with stage("fetch"):
+            r = session.get(calendar_url, timeout=REQUEST_TIMEOUT)
+            r.raise_for_status()
+            _wait_between_requests()
+    except CircuitOpenError:
+        raise  # 障害中は「課題 0 件」にせず実行を失敗させる
     except requests.RequestException as e:
         logger.exception("カレンダーページの取得に失敗: %s", e)
         return []
 
     html, _ = _follow_sso_gateways(session, r.text, r.url)
-    soup = BeautifulSoup(html, "html.parser")
-    assignments: List[Assignment] = []
+    with stage("extract"):
+        return parse_pool.parse("calendar", html, base, courses=courses)
+
+
+# カレンダーのレイアウト別の抽出戦略で使うセレクタ・正規表現（事前コンパイル）
+_CAL_SELECTORS = {
+    # .event など class に event を含む要素（Boost 系テーマの「今後の予定」）
+    "event_class": sv.compile('[class*="event" i]'),
+    # data-type="assign" / "assignment" の div
+    "data_type": sv.compile('div[data-type*="assign" i]'),
+    # テーブル形式のカレンダー
+    "table_rows": sv.compile('tr[class*="event" i], tr[class*="calendar" i]'),
+}
+_CAL_STRATEGY_ORDER = ("event_class", "data_type", "table_rows")
+_COURSE_SELECT_RE = re.compile(r"cal_courses_flt|calendar.*filter", re.I)
+_EVENT_ASSIGN_HREF_RE = re.compile(r"mod/assign|assign/view\.php")
+_ROW_LINK_HREF_RE = re.compile(r"mod/assign|assign/view|course/view")
+_ROW_DUE_TEXT_RE = re.compile(r"\d{4}[-/年]\d|due|締切|期限", re.I)
+_DATE_CLASS_RE = re.compile(r"date|time|due")
+_DATE_PART_RE = re.compile(r"[\d年/\-月日:\s]+")
+_THEME_PATH_RE = re.compile(r"/theme/(?:styles|image|yui_combo|javascript)\.php/([A-Za-z0-9_]+)/")
+_THEME_CLASS_RE = re.compile(r"^theme_([A-Za-z0-9_]+)$")
+_COURSE_VIEW_HREF_RE = re.compile(r"course/view\.php\?(?:[^\"'#]*&)?id=(\d+)")
 
-    # 授業一覧マップ
+
+def _course_map(soup: BeautifulSoup) -> dict[str, str]:
+    """カレンダーの授業絞り込み（select）から course_id -> 授業名 のマップを作る。"""
     course_map: dict[str, str] = {}
-    course_select = soup.find("select", class_=re.compile(r"cal_courses_flt|calendar.*filter", re.I))
+    course_select = soup.find("select", class_=_COURSE_SELECT_RE)
     if course_select:
         for opt in course_select.find_all("option", value=True):
             cid = opt.get("value", "").strip()
             cname = opt.get_text(strip=True)
             if cid and cid != "1" and cname and cname != "すべての授業科目":
                 course_map[cid] = cname
+    return course_map
 
-    # Moodle のカレンダーは .event や [data-type="assign"] などでイベントを表示
-    # 汎用的に「予定」らしいブロック」を探す
-    event_containers = soup.find_all(class_=re.compile(r"event", re.I))
-    if not event_containers:
-        event_containers = soup.find_all("div", attrs={"data-type": re.compile(r"assign|assignment", re.I)})
-    if not event_containers:
-        # テーブル形式のカレンダー
-        rows = soup.find_all("tr", class_=re.compile(r"event|calendar", re.I))
-        for row in rows:
-            cells = row.find_all(["td", "th"])
-            if len(cells) < 2:
-                continue
-            link = row.find("a", href=re.compile(r"mod/assign|assign/view|course/view"))
-            if not link:
-                continue
-            title = link.get("title") or link.get_text(strip=True) or "（無題）"
-            href = link.get("href", "")
-            if not href.startswith("http"):
-                href = urljoin(base + "/", href)
-            due_text = ""
-            for c in cells:
-                t = c.get_text(strip=True)
-                if re.search(r"\d{4}[-/年]\d|due|締切|期限", t, re.I):
-                    due_text = t
-                    break
-            due = _parse_date(due_text)
-            assignments.append(Assignment(
-                title=title,
-                due_date=due,
-                course_name="",
-                url=href,
-                description_preview="",
-            ))
-        return assignments
-
-    for container in event_containers:
-        link = container.find("a", href=re.compile(r"mod/assign|assign/view\.php"))
+
+def _discover_courses(soup: BeautifulSoup, course_map: dict[str, str], courses: dict[str, str]) -> None:
+    """授業絞り込みの一覧と course/view.php?id=N のリンクから、履修中の授業を courses に追加する。"""
+    for cid, name in course_map.items():
+        courses.setdefault(cid, name)
+    for a in soup.find_all("a", href=_COURSE_VIEW_HREF_RE):
+        m = _COURSE_VIEW_HREF_RE.search(a.get("href", ""))
+        if m and m.group(1) != "1":
+            name = a.get_text(strip=True)
+            if not courses.get(m.group(1)) and name:
+                courses[m.group(1)] = name
+            else:
+                courses.setdefault(m.group(1), "")
+
+
+def _layout_fingerprint(soup: BeautifulSoup, base: str) -> str:
+    """ホスト名とテーマ名（CSS の URL や body の class から推定）でページレイアウトを識別する。"""
+    host = urlparse(base).netloc.lower()
+    theme = ""
+    for tag in soup.find_all(["link", "script"], limit=40):
+        m = _THEME_PATH_RE.search(tag.get("href") or tag.get("src") or "")
+        if m:
+            theme = m.group(1)
+            break
+    if not theme and soup.body:
+        for cls in soup.body.get("class") or []:
+            m = _THEME_CLASS_RE.match(cls)
+            if m:
+                theme = m.group(1)
+                break
+    return f"{host}|{theme or 'unknown'}"
+
+
+def _calendar_from_events(containers: list, base: str, course_map: dict[str, str]) -> List[Assignment]:
+    """イベント要素（.event / data-type=assign）から課題を抽出する。"""
+    assignments: List[Assignment] = []
+    for container in containers:
+        link = container.find("a", href=_EVENT_ASSIGN_HREF_RE)
         if not link:
             continue
         title = link.get("title") or link.get_text(strip=True) or "（無題）"
@@ -537,7 +883,7 @@ def _extract_assignments_from_calendar(session: requests.Session, base_url: str)
         if "mod/assign" not in href:
             continue
         due = None
-        date_elem = container.find(class_=re.compile(r"date|time|due"))
+        date_elem = container.find(class_=_DATE_CLASS_RE)
         if date_elem:
             due = _parse_date(date_elem.get_text())
         if not due:
@@ -551,7 +897,7 @@ def _extract_assignments_from_calendar(session: requests.Session, base_url: str)
                         pass
         if not due:
             full_text = container.get_text()
-            for part in re.findall(r"[\d年/\-月日:\s]+", full_text):
+            for part in _DATE_PART_RE.findall(full_text):
                 due = _parse_date(part)
                 if due:
                     break
@@ -568,45 +914,123 @@ def _extract_assignments_from_calendar(session: requests.Session, base_url: str)
             url=href,
             description_preview="",
         ))
+    return assignments
+
 
+def _calendar_from_rows(rows: list, base: str, course_map: dict[str, str]) -> List[Assignment]:
+    """テーブル形式のカレンダーの行から課題を抽出する。"""
+    assignments: List[Assignment] = []
+    for row in rows:
+        cells = row.find_all(["td", "th"])
+        if len(cells) < 2:
+            continue
+        link = row.find("a", href=_ROW_LINK_HREF_RE)
+        if not link:
+            continue
+        title = link.get("title") or link.get_text(strip=True) or "（無題）"
+        href = link.get("href", "")
+        if not href.startswith("http"):
+            href = urljoin(base + "/", href)
+        due_text = ""
+        for c in cells:
+            t = c.get_text(strip=True)
+            if _ROW_DUE_TEXT_RE.search(t):
+                due_text = t
+                break
+        due = _parse_date(due_text)
+        assignments.append(Assignment(
+            title=title,
+            due_date=due,
+            course_name="",
+            url=href,
+            description_preview="",
+        ))
     return assignments
 
 
-def _extract_assignments_from_my(session: requests.Session, base_url: str) -> List[Assignment]:
-    """ダッシュボード（/my/）の「今後の課題」ブロックなどから抽出。"""
+def _run_calendar_strategy(name: str, soup: BeautifulSoup, base: str, course_map: dict[str, str]) -> Optional[List[Assignment]]:
+    """戦略 name で抽出する。対象の要素が 1 つもなければ None（このレイアウトではない）。"""
+    elements = _CAL_SELECTORS[name].select(soup)
+    if not elements:
+        return None
+    if name == "table_rows":
+        return _calendar_from_rows(elements, base, course_map)
+    return _calendar_from_events(elements, base, course_map)
+
+
+def _parse_calendar_html(html: str, base: str, courses: Optional[dict[str, str]] = None) -> List[Assignment]:
+    """
+    カレンダーページの HTML から課題を抽出する。
+    レイアウト（ホスト＋テーマ）ごとに前回成功した戦略を覚えておき、まずそれだけを試す。
+    要素が見つからなかったときだけ全戦略を順に試し直す。
+    """
+    soup = _soup(html)
+    course_map = _course_map(soup)
+    if courses is not None:
+        _discover_courses(soup, course_map, courses)
+    fingerprint = _layout_fingerprint(soup, base)
+
+    cached = layout_cache.lookup(fingerprint)
+    if cached in _CAL_SELECTORS:
+        result = _run_calendar_strategy(cached, soup, base, course_map)
+        if result is not None:
+            return result
+        logger.info("[カレンダー] 記憶したレイアウト %s で要素が見つからないため再判定します (%s)", cached, fingerprint)
+
+    for name in _CAL_STRATEGY_ORDER:
+        if name == cached:
+            continue
+        result = _run_calendar_strategy(name, soup, base, course_map)
+        if result is not None:
+            layout_cache.remember(fingerprint, name)
+            return result
+    return []
+
+
+def _extract_assignments_from_my(
+    session: requests.Session, base_url: str, courses: Optional[dict[str, str]] = None
+) -> List[Assignment]:
+    """ダッシュボード（/my/）の「今後の課題」ブロックなどから抽出。courses を渡すと見つけた授業を追加する。"""
     base = base_url.rstrip("/")
     my_url = f"{base}/my/"
     try:
-        r = session.get(my_url, timeout=REQUEST_TIMEOUT)
-        r.raise_for_status()
-        _wait_between_requests()
+        with stage("fetch"):
+            r = session.get(my_url, timeout=REQUEST_TIMEOUT)
+            r.raise_for_status()
+            _wait_between_requests()
+    except CircuitOpenError:
+        raise  # 障害中は「課題 0 件」にせず実行を失敗させる
     except requests.RequestException as e:
         logger.exception("マイページの取得に失敗: %s", e)
         return []
 
     html, _ = _follow_sso_gateways(session, r.text, r.url)
-    soup = BeautifulSoup(html, "html.parser")
+    with stage("extract"):
+        return parse_pool.parse("my", html, base, courses=courses)
+
+
+def _parse_my_html(html: str, base: str, courses: Optional[dict[str, str]] = None) -> List[Assignment]:
+    """ダッシュボードの HTML から課題を抽出する。"""
+    soup = _soup(html)
     assignments: List[Assignment] = []
 
     # カレンダーの授業一覧から course_id -> 授業名 のマップを構築
-    course_map: dict[str, str] = {}
-    course_select = soup.find("select", class_=re.compile(r"cal_courses_flt|calendar.*filter", re.I))
-    if course_select:
-        for opt in course_select.find_all("option", value=True):
-            cid = opt.get("value", "").strip()
-            cname = opt.get_text(strip=True)
-            if cid and cid != "1" and cname and cname != "すべての授業科目":
-                course_map[cid] = cname
+    course_map = _course_map(soup)
+    if courses is not None:
+        _discover_courses(soup, course_map, courses)
 
     # 課題へのリンク（mod/assign/view.php を含む）
+    seen_keys: set[str] = set()
     for link in soup.find_all("a", href=re.compile(r"mod/assign/view\.php")):
         href = link.get("href", "")
         if not href.startswith("http"):
             href = urljoin(base + "/", href)
         title = link.get("title") or link.get_text(strip=True) or "（無題）"
-        # 重複を避ける（同じ href は 1 回だけ）
-        if any(a.url == href for a in assignments):
+        # 重複を避ける（同じ課題は 1 回だけ）
+        key = assignment_key(href)
+        if key in seen_keys:
             continue
+        seen_keys.add(key)
         # 親要素から日付・授業を探す
         due = None
         course_name = ""
@@ -656,26 +1080,159 @@ def _extract_assignments_from_my(session: requests.Session, base_url: str) -> Li
     return assignments
 
 
-def fetch_assignments() -> List[Assignment]:
+# 授業ごとの課題一覧ページ（mod/assign/index.php）
+_INDEX_ASSIGN_HREF_RE = re.compile(r"(?:^|/)view\.php\?(?:[^\"'#]*&)?id=\d+")
+_INDEX_DUE_HEADER_RE = re.compile(r"due|期限|締切|終了", re.I)
+_SSO_FORM_HINT_RE = re.compile(r"<form[^>]+action=[\"'][^\"']*(?:auth|sso|SamlIdP|AuthnRequestReceiver|SMAuthenticator)", re.I)
+
+
+def _parse_assign_index_html(html: str, page_url: str, course_name: str) -> List[Assignment]:
+    """
+    課題一覧ページ（mod/assign/index.php?id=<授業ID>）の表から課題を抽出する。
+    見出しに「期限」「締切」「Due」等を含む列を締切として読む。
+    """
+    soup = _soup(html)
+    table = soup.find("table", class_=re.compile(r"generaltable")) or soup.find("table")
+    if not table:
+        return []
+    due_col: Optional[int] = None
+    for row in table.find_all("tr"):
+        headers = row.find_all("th")
+        if headers and not row.find("td"):
+            for i, th in enumerate(headers):
+                if _INDEX_DUE_HEADER_RE.search(th.get_text(" ", strip=True)):
+                    due_col = i
+                    break
+            break
+
+    assignments: List[Assignment] = []
+    for row in table.find_all("tr"):
+        link = row.find("a", href=_INDEX_ASSIGN_HREF_RE)
+        if not link:
+            continue
+        cells = row.find_all(["td", "th"])
+        due = None
+        if due_col is not None and due_col < len(cells):
+            due = _parse_date(cells[due_col].get_text(" ", strip=True))
+        assignments.append(Assignment(
+            title=link.get("title") or link.get_text(strip=True) or "（無題）",
+            due_date=due,
+            course_name=course_name,
+            url=urljoin(page_url, link.get("href", "")),
+            description_preview="",
+        ))
+    return assignments
+
+
+def _fetch_course_index(session: requests.Session, base: str, course_id: str, course_name: str) -> List[Assignment]:
+    """1 授業分の課題一覧ページを取得して抽出する。実行の時間予算を使い切っていたら取得しない。"""
+    url = f"{base}/mod/assign/index.php?id={course_id}"
+    budget: Optional[RunBudget] = getattr(session, "budget", None)
+    try:
+        if budget is not None:
+            budget.check(f"授業 {course_id} の課題一覧")
+        _rate_limiter.acquire()
+        with stage("fetch"):
+            r = session.get(url, timeout=REQUEST_TIMEOUT)
+            r.raise_for_status()
+        html, page_url = r.text, r.url
+        if _SSO_FORM_HINT_RE.search(html):
+            html, page_url = _follow_sso_gateways(session, html, page_url)
+    except BudgetExceeded:
+        budget.skip("授業ごとの課題一覧（一部）")
+        return []
+    except requests.RequestException as e:
+        logger.warning("[一括取得] 授業 %s の課題一覧を取得できませんでした: %s", course_id, e)
+        return []
+    with stage("extract"):
+        return parse_pool.parse("assign_index", html, page_url, course_name)
+
+
+def _harvest_course_assignments(session: requests.Session, base: str, courses: dict[str, str]) -> List[Assignment]:
+    """
+    履修中の各授業の課題一覧ページ（mod/assign/index.php）から課題を一括取得する。
+    HARVEST_CONCURRENCY 並列で取得するが、リクエストの開始間隔は全体で ACCESS_INTERVAL 秒以上あける。
+    """
+    # 授業一覧には過去の学期の授業も含まれるため、新しい（ID の大きい）授業から HARVEST_MAX_COURSES 件を取得する
+    course_ids = sorted(courses, key=lambda c: int(c) if c.isdigit() else 0, reverse=True)[:HARVEST_MAX_COURSES]
+    if not course_ids:
+        return []
+    logger.info("[一括取得] %d 授業の課題一覧を取得します（並列数 %d）", len(course_ids), HARVEST_CONCURRENCY)
+    with ThreadPoolExecutor(max_workers=HARVEST_CONCURRENCY, thread_name_prefix="harvest") as ex:
+        results = list(ex.map(lambda cid: _fetch_course_index(session, base, cid, courses[cid]), course_ids))
+    harvested = [a for r in results for a in r]
+    logger.info("[一括取得] %d 件の課題を取得しました", len(harvested))
+    return harvested
+
+
+def _merge_assignments(*sources: List[Assignment]) -> List[Assignment]:
+    """
+    複数の取得元の課題を同一性キー（コースモジュール ID）で統合する。
+    先に渡した取得元を優先しつつ、空の項目（締切・授業名・タイトル・説明）は後の取得元で補う。
+    """
+    merged: dict[str, Assignment] = {}
+    for source in sources:
+        for a in source:
+            cur = merged.get(a.key)
+            if cur is None:
+                merged[a.key] = Assignment(
+                    title=a.title,
+                    due_date=a.due_date,
+                    course_name=a.course_name,
+                    url=a.url,
+                    description_preview=a.description_preview,
+                )
+                continue
+            if cur.due_date is None and a.due_date is not None:
+                cur.due_date = a.due_date
+            if not cur.course_name and a.course_name:
+                cur.course_name = a.course_name
+            if cur.title == "（無題）" and a.title != "（無題）":
+                cur.title = a.title
+            if not cur.description_preview and a.description_preview:
+                cur.description_preview = a.description_preview
+    return list(merged.values())
+
+
+def fetch_assignments(budget: Optional[RunBudget] = None) -> List[Assignment]:
     """
     ログインして課題一覧を取得する。
-    カレンダーとダッシュボードの両方から取得し、重複を除いて返す。
+    カレンダーとダッシュボード（HARVEST_COURSES 有効時は授業ごとの課題一覧も）から取得し、
+    同じ課題は 1 件に統合して返す。
+    budget の時間予算を途中で使い切ったら、残りの取得元を budget.skipped に記録し、それまでの結果を返す
+    （1 つも取得できなければ BudgetExceeded）。ログインできなければ LoginError、
+    Moodle・認証サーバーが障害中（ブレーカーが open）なら CircuitOpenError。
     """
-    session = _session()
+    session = _session(budget)
     if not login(session):
-        return []
+        raise LoginError("Moodle にログインできませんでした")
 
     base = MOODLE_URL.rstrip("/")
-    seen_urls: set[str] = set()
-    result: List[Assignment] = []
-
-    for assign in _extract_assignments_from_calendar(session, base) + _extract_assignments_from_my(session, base):
-        # 同一 URL は 1 件だけ
-        norm_url = assign.url.split("?")[0]
-        if norm_url in seen_urls:
-            continue
-        seen_urls.add(norm_url)
-        result.append(assign)
+    # 授業の一覧はページ全体を走査して作るため、授業ごとの一括取得（HARVEST_COURSES）を使うときだけ集める
+    courses: Optional[dict[str, str]] = {} if HARVEST_COURSES else None
+    # 締切の載っている課題が多い順に取得する（時間切れのときに価値の高い取得元を残すため）。
+    # 保護されたページは 1 ページずつ取得する。最初のページで 2FA 再認証を済ませ、
+    # 発行された SSO Cookie で残りのページ（並列の一括取得を含む）を再認証なしで取得する
+    sources = [
+        ("カレンダー", lambda: _extract_assignments_from_calendar(session, base, courses)),
+        ("ダッシュボード", lambda: _extract_assignments_from_my(session, base, courses)),
+    ]
+    if HARVEST_COURSES:
+        sources.append(("授業ごとの課題一覧", lambda: _harvest_course_assignments(session, base, courses)))
+    fetched: list[List[Assignment]] = []
+    for i, (name, fetch) in enumerate(sources):
+        try:
+            if budget is not None:
+                budget.check(name)
+            fetched.append(fetch())
+        except BudgetExceeded as e:
+            if not fetched:
+                raise
+            logger.info("[時間予算] %s", e)
+            for skipped, _ in sources[i:]:
+                budget.skip(skipped)
+            break
+    result = _merge_assignments(*fetched)
 
     # 締切日でソート（None は後ろ）
     result.sort(key=lambda a: (a.due_date is None, a.due_date or datetime.max))
@@ -0,0 +1,168 @@
+"""
+ページの解析・課題抽出（BeautifulSoup、純 Python で CPU を使う）を別プロセスで行うプロセスプール。
+複数アカウント・多数のページを 1 プロセスで処理するとき、抽出処理が GIL を握って
+通信待ちのスレッドを止めないようにする。
+
+- PARSE_WORKERS=0（デフォルト）: 使わない（これまでどおり同じプロセスで解析）
+- PARSE_WORKERS=auto: 使えるコア数のプロセスで解析
+- PARSE_WORKERS=N: N プロセスで解析
+PARSE_POOL_MIN_BYTES 未満の小さいページはプロセス間の受け渡しの方が高くつくため、その場で解析する。
+
+ワーカーには HTML のバイト列を渡し、Assignment のリストと見つけた授業（course_id -> 授業名）を受け取る。
+Windows と同じく spawn でワーカーを起動する（スレッドを持つ親プロセスを fork しない）。
+ワーカーは .env を読み直すため、レイアウトキャッシュの保存先（STATE_DIR）は親プロセスの値を明示的に渡す。
+"""
+import atexit
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, List, Optional
+
+import config
+from config import PARSE_POOL_MIN_BYTES, PARSE_WORKERS
+from models import Assignment
+
+# multiprocessing・concurrent.futures.process はプールを起動するときに読み込む（PARSE_WORKERS=0 では使わない）
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 解析の種類 -> moodle_scraper の解析関数名
+KINDS = {
+    "calendar": "_parse_calendar_html",
+    "my": "_parse_my_html",
+    "assign_index": "_parse_assign_index_html",
+}
+
+
+def available_cores() -> int:
+    """このプロセスが使えるコア数（CPU アフィニティを考慮）。"""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+def resolve_workers(setting: str) -> int:
+    """PARSE_WORKERS の値をプロセス数にする（0 は使わない）。"""
+    setting = (setting or "").strip().lower()
+    if setting == "auto":
+        return available_cores()
+    try:
+        return max(0, int(setting or "0"))
+    except ValueError:
+        logger.warning("PARSE_WORKERS=%r を解釈できないため、プロセスプールを使いません", setting)
+        return 0
+
+
+def _init_worker(state_dir: str) -> None:
+    """ワーカーの STATE_DIR を親プロセスと同じにする（moodle_scraper・layout_cache を読み込む前に呼ばれる）。"""
+    from pathlib import Path
+
+    config.settings().STATE_DIR = Path(state_dir)
+
+
+def _parse_in_worker(kind: str, data: bytes, args: tuple, courses: Optional[dict[str, str]]) -> tuple[List[Assignment], Optional[dict[str, str]]]:
+    """ワーカープロセス側の処理。moodle_scraper の解析関数を呼び、結果と授業一覧を返す。"""
+    import moodle_scraper
+
+    parse = getattr(moodle_scraper, KINDS[kind])
+    html = data.decode("utf-8")
+    if kind == "assign_index":
+        return parse(html, *args), None
+    return parse(html, *args, courses), courses
+
+
+def _parse_inline(kind: str, html: str, args: tuple, courses: Optional[dict[str, str]]) -> List[Assignment]:
+    import moodle_scraper
+
+    parse = getattr(moodle_scraper, KINDS[kind])
+    if kind == "assign_index":
+        return parse(html, *args)
+    return parse(html, *args, courses)
+
+
+class ParsePool:
+    """解析用のプロセスプール。最初に大きいページを解析するときにワーカーを起動する。"""
+
+    def __init__(self, workers: int, min_bytes: int = 0) -> None:
+        self.workers = workers
+        self.min_bytes = min_bytes
+        self._lock = threading.Lock()
+        self._executor: Optional["ProcessPoolExecutor"] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _get_executor(self) -> "ProcessPoolExecutor":
+        with self._lock:
+            if self._executor is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(str(config.settings().STATE_DIR),),
+                )
+                logger.info("[解析プール] %d プロセスで起動しました", self.workers)
+            return self._executor
+
+    def warm_up(self) -> None:
+        """ワーカーを起動し、bs4 などの読み込みを済ませておく（ベンチマーク用）。"""
+        if not self.enabled:
+            return
+        ex = self._get_executor()
+        futures = [ex.submit(_parse_in_worker, "my", b"<html></html>", ("",), None) for _ in range(self.workers)]
+        for f in futures:
+            f.result()
+
+    def parse(self, kind: str, html: str, *args, courses: Optional[dict[str, str]] = None) -> List[Assignment]:
+        """
+        moodle_scraper の解析関数（KINDS）で html を解析する。プールが有効で html が大きければワーカーで行う。
+        courses を渡すと、ページ内で見つけた授業をそこに追加する（同じプロセスで解析した場合と同じ）。
+        """
+        data = html.encode("utf-8")
+        if not self.enabled or len(data) < self.min_bytes:
+            return _parse_inline(kind, html, args, courses)
+        from concurrent.futures.process import BrokenProcessPool
+
+        try:
+            result, found = self._get_executor().submit(
+                _parse_in_worker, kind, data, args, dict(courses) if courses is not None else None
+            ).result()
+        except BrokenProcessPool as e:
+            logger.warning("[解析プール] ワーカーが異常終了したため、このページはその場で解析します: %s", e)
+            self.shutdown()
+            return _parse_inline(kind, html, args, courses)
+        if courses is not None and found:
+            for cid, name in found.items():
+                courses.setdefault(cid, name)
+        return result
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+_pool: Optional[ParsePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ParsePool:
+    """設定（PARSE_WORKERS / PARSE_POOL_MIN_BYTES）に従った共有プール。"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ParsePool(resolve_workers(PARSE_WORKERS), PARSE_POOL_MIN_BYTES)
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def parse(kind: str, html: str, *args, courses: Optional[dict[str, str]] = None) -> List[Assignment]:
+    """共有プールで解析する（ParsePool.parse を参照）。"""
+    return get_pool().parse(kind, html, *args, courses=courses)
@@ -0,0 +1,186 @@
+"""
+実行プロファイリング（cProfile / tracemalloc / 段階別の所要時間）。
+
+遅い・メモリを食う実行で、どこにコストがあるかを調べるために使う。
+main.py の --profile で有効化するほか、PROFILE_SAMPLE_RATE を設定すると
+その確率で本番実行をサンプリングして記録する。
+"""
+import contextlib
+import contextvars
+import io
+import logging
+import random
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator, Optional
+
+# cProfile / pstats / tracemalloc はプロファイルする実行でだけ読み込む（起動を遅くしないため）
+if TYPE_CHECKING:
+    import cProfile
+    import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+# 現在実行中の段階名（ログ等から参照する）
+_current_stage: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("stage", default=None)
+
+
+class _StageRecorder:
+    """段階ごとの呼び出し回数・経過時間（自身のみ／子を含む）・メモリ増分を集計する。"""
+
+    def __init__(self, trace_memory: bool) -> None:
+        self.trace_memory = trace_memory
+        self.totals: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def enter(self, name: str) -> None:
+        mem = _traced_memory() if self.trace_memory else 0
+        # [段階名, 開始時刻, 子段階の合計時間, 開始時メモリ]
+        self._stack().append([name, time.perf_counter(), 0.0, mem])
+
+    def exit(self) -> None:
+        stack = self._stack()
+        name, start, child, mem_start = stack.pop()
+        elapsed = time.perf_counter() - start
+        if stack:
+            stack[-1][2] += elapsed
+        mem_delta = (_traced_memory() - mem_start) if self.trace_memory else 0
+        with self._lock:
+            t = self.totals.setdefault(name, {"calls": 0, "total": 0.0, "self": 0.0, "mem": 0})
+            t["calls"] += 1
+            t["total"] += elapsed
+            t["self"] += elapsed - child
+            t["mem"] += mem_delta
+
+    def format_summary(self) -> str:
+        lines = [f"{'stage':<10} {'calls':>6} {'self(s)':>9} {'total(s)':>9} {'mem(KiB)':>10}"]
+        for name, t in sorted(self.totals.items(), key=lambda kv: kv[1]["self"], reverse=True):
+            mem = f"{t['mem'] / 1024:>10.1f}" if self.trace_memory else f"{'-':>10}"
+            lines.append(f"{name:<10} {int(t['calls']):>6} {t['self']:>9.3f} {t['total']:>9.3f} {mem}")
+        return "\n".join(lines)
+
+
+def _traced_memory() -> int:
+    import tracemalloc
+
+    return tracemalloc.get_traced_memory()[0]
+
+
+_recorder: Optional[_StageRecorder] = None
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """処理の段階（login / sso / fetch / parse / extract / format / send）を区切る。プロファイル無効時はほぼ無コスト。"""
+    token = _current_stage.set(name)
+    rec = _recorder
+    if rec is None:
+        try:
+            yield
+        finally:
+            _current_stage.reset(token)
+        return
+    rec.enter(name)
+    try:
+        yield
+    finally:
+        rec.exit()
+        _current_stage.reset(token)
+
+
+def current_stage() -> Optional[str]:
+    """現在の段階名（段階外なら None）。"""
+    return _current_stage.get()
+
+
+def should_sample(rate: float) -> bool:
+    """サンプリング率 rate（0〜1）でこの実行をプロファイルするか決める。"""
+    return rate > 0 and random.random() < rate
+
+
+def run_profiled(
+    func: Callable[[], int],
+    out_dir: Path,
+    top_n: int = 25,
+    trace_memory: bool = True,
+) -> int:
+    """
+    func を cProfile（と tracemalloc）の下で実行し、結果を out_dir に書き出す。
+    出力: <prefix>.pstats / <prefix>-alloc.txt / <prefix>-stages.txt
+    trace_memory=False はサンプリング用の軽量モード（tracemalloc なし）。
+    """
+    import cProfile
+    import tracemalloc
+
+    global _recorder
+    out_dir = Path(out_dir)
+    prefix = "profile-" + datetime.now().strftime("%Y%m%d-%H%M%S")
+    recorder = _StageRecorder(trace_memory)
+    profile = cProfile.Profile()
+    started_tracing = False
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        started_tracing = True
+
+    _recorder = recorder
+    wall_start = time.perf_counter()
+    try:
+        profile.enable()
+        try:
+            return func()
+        finally:
+            profile.disable()
+    finally:
+        wall = time.perf_counter() - wall_start
+        _recorder = None
+        snapshot = tracemalloc.take_snapshot() if trace_memory else None
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+        if started_tracing:
+            tracemalloc.stop()
+        try:
+            _write_reports(out_dir, prefix, profile, snapshot, peak, recorder, wall, top_n)
+        except OSError as e:
+            logger.warning("プロファイル結果を書き込めませんでした: %s", e)
+
+
+def _write_reports(
+    out_dir: Path,
+    prefix: str,
+    profile: "cProfile.Profile",
+    snapshot: "Optional[tracemalloc.Snapshot]",
+    peak: int,
+    recorder: _StageRecorder,
+    wall: float,
+    top_n: int,
+) -> None:
+    import pstats
+    import tracemalloc
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    pstats_path = out_dir / f"{prefix}.pstats"
+    profile.dump_stats(str(pstats_path))
+
+    if snapshot is not None:
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        lines = [f"peak={peak / 1024:.1f} KiB", f"top {top_n} allocations (lineno):"]
+        for stat in snapshot.statistics("lineno")[:top_n]:
+            lines.append(str(stat))
+        (out_dir / f"{prefix}-alloc.txt").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    summary = f"wall={wall:.3f}s\n{recorder.format_summary()}\n"
+    buf = io.StringIO()
+    pstats.Stats(profile, stream=buf).sort_stats("cumulative").print_stats(top_n)
+    (out_dir / f"{prefix}-stages.txt").write_text(summary + "\n" + buf.getvalue(), encoding="utf-8")
+    logger.info("プロファイル結果を保存しました: %s\n%s", pstats_path, summary.rstrip())
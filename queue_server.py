@@ -0,0 +1,88 @@
+"""
+ジョブキューの小さな HTTP サーバー。SQLite ファイルをこのサーバーのローカルディスクに置き、
+他のノードのワーカーは JOB_QUEUE=http://<host>:<port> で接続する（共有ストレージのファイルロックに頼らない）。
+
+エンドポイント: POST /<メソッド名>（enqueue / claim / heartbeat / complete / fail / reserve_slot / stats / purge）
+本文は引数の JSON、応答は {"result": ...}。QUEUE_TOKEN を設定すると Authorization: Bearer <token> を要求する。
+
+使い方:
+  python queue_server.py --host 0.0.0.0 --port 8766 --db state/jobs.sqlite3
+"""
+import argparse
+import hmac
+import json
+import sys
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import job_queue
+from config import JOB_QUEUE, QUEUE_TOKEN
+
+# HTTP で呼び出せるメソッド
+METHODS = ("enqueue", "claim", "heartbeat", "complete", "fail", "reserve_slot", "stats", "purge")
+
+
+class QueueHandler(BaseHTTPRequestHandler):
+    server_version = "MoodleJobQueue/1.0"
+    queue: job_queue.SQLiteJobQueue
+    token: str = ""
+
+    def _json(self, status: int, body: dict) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        method = self.path.strip("/")
+        if method not in METHODS:
+            self._json(404, {"error": f"unknown method: {method}"})
+            return
+        if self.token and not hmac.compare_digest(self.headers.get("Authorization") or "", f"Bearer {self.token}"):
+            self._json(401, {"error": "unauthorized"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            kwargs = json.loads(self.rfile.read(length) or b"{}")
+            result = getattr(self.queue, method)(**kwargs)
+        except (TypeError, ValueError) as e:
+            self._json(400, {"error": str(e)})
+            return
+        if isinstance(result, job_queue.Job):
+            result = asdict(result)
+        self._json(200, {"result": result})
+
+    def log_message(self, format, *args):
+        pass  # アクセスログは出さない（ハートビート・枠の予約で大量になるため）
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="ジョブキューの HTTP サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--db", type=Path, default=None if JOB_QUEUE.startswith("http") else Path(JOB_QUEUE),
+                        help="SQLite ファイル（デフォルトは JOB_QUEUE）")
+    args = parser.parse_args(argv)
+    if args.db is None:
+        print("--db を指定してください（JOB_QUEUE が URL のため）", file=sys.stderr)
+        return 2
+
+    handler = type("BoundQueueHandler", (QueueHandler,), {"queue": job_queue.SQLiteJobQueue(args.db), "token": QUEUE_TOKEN})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"ジョブキューサーバー起動: http://{args.host}:{args.port}  (DB={args.db})  Ctrl+C で終了")
+    if not QUEUE_TOKEN and args.host not in ("127.0.0.1", "localhost"):
+        print("注意: QUEUE_TOKEN が未設定のため、誰でもジョブを操作できます", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n終了しました。")
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,158 @@
+"""
+Moodle への HTTP 応答を記録・再生する。
+プロファイルやベンチマークを、実サーバーに負荷をかけずに記録済みページで行うために使う。
+
+記録形式（ディレクトリ）:
+  index.jsonl  1 行 1 応答（method, url, status, headers, body ファイル名）
+  NNNN.html    応答本文
+リクエスト本文（パスワード・TOTP を含む）や Set-Cookie は保存しない。
+記録したページには個人情報が含まれるため Git にコミットしないこと。
+"""
+import json
+import logging
+import threading
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.jsonl"
+# 再生に必要な応答ヘッダーのみ保存する
+_KEPT_HEADERS = ("Location", "Content-Type")
+
+_record_dir: Optional[Path] = None
+_replay_dir: Optional[Path] = None
+
+
+def configure(record_dir: Optional[Path] = None, replay_dir: Optional[Path] = None) -> None:
+    """以降に作成するセッションの記録先／再生元を設定する（どちらも None なら通常通り通信）。"""
+    global _record_dir, _replay_dir
+    if record_dir and replay_dir:
+        raise ValueError("記録と再生は同時に指定できません")
+    _record_dir = Path(record_dir) if record_dir else None
+    _replay_dir = Path(replay_dir) if replay_dir else None
+
+
+def is_replaying() -> bool:
+    """記録済みページを再生中なら True（アクセス間隔の待機は不要）。"""
+    return _replay_dir is not None
+
+
+def mount(session: requests.Session) -> None:
+    """configure() の設定に従い、セッションに記録用／再生用アダプタを取り付ける。"""
+    if _replay_dir is not None:
+        adapter: BaseAdapter = ReplayAdapter(_replay_dir)
+    elif _record_dir is not None:
+        adapter = RecordingAdapter(_record_dir)
+    else:
+        return
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """通常通り通信しつつ、応答を順番にディレクトリへ保存する。"""
+
+    def __init__(self, directory: Path) -> None:
+        super().__init__()
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        index = self.directory / INDEX_FILE
+        self._seq = sum(1 for _ in index.open(encoding="utf-8")) if index.is_file() else 0
+
+    def send(self, request, **kwargs):
+        resp = super().send(request, **kwargs)
+        try:
+            self._save(request, resp)
+        except OSError as e:
+            logger.warning("応答の記録に失敗しました: %s", e)
+        return resp
+
+    def _save(self, request, resp: requests.Response) -> None:
+        with self._lock:
+            self._seq += 1
+            body_name = f"{self._seq:04d}.html"
+            (self.directory / body_name).write_bytes(resp.content)
+            entry = {
+                "method": request.method,
+                "url": request.url,
+                "status": resp.status_code,
+                "reason": resp.reason,
+                "headers": {k: resp.headers[k] for k in _KEPT_HEADERS if k in resp.headers},
+                "encoding": resp.encoding,
+                "body": body_name,
+            }
+            with (self.directory / INDEX_FILE).open("a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class ReplayAdapter(BaseAdapter):
+    """記録済みの応答を返す。同じ method+URL は記録順に返し、なければクエリを除いたパスで探す。"""
+
+    def __init__(self, directory: Path) -> None:
+        super().__init__()
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+        self._by_url: dict[tuple[str, str], deque] = defaultdict(deque)
+        self._by_path: dict[tuple[str, str], dict] = {}
+        with (self.directory / INDEX_FILE).open(encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self._by_url[(entry["method"], entry["url"])].append(entry)
+                self._by_path[(entry["method"], _path_key(entry["url"]))] = entry
+
+    def _take(self, method: str, url: str) -> Optional[dict]:
+        with self._lock:
+            queue = self._by_url.get((method, url))
+            if not queue:
+                # クエリ（SAMLRequest 等）が記録時と異なる場合は同じパスの最後の応答を使う
+                return self._by_path.get((method, _path_key(url)))
+            # 最後の 1 件は使い回す（同じページを何度取得しても同じ応答）
+            return queue.popleft() if len(queue) > 1 else queue[0]
+
+    def send(self, request, **kwargs):
+        entry = self._take(request.method, request.url)
+        resp = requests.Response()
+        resp.request = request
+        resp.url = request.url
+        if entry is None:
+            logger.warning("記録にない URL です: %s %s", request.method, request.url)
+            resp.status_code = 404
+            resp.reason = "Not Recorded"
+            resp._content = b""
+            return resp
+        resp.status_code = entry["status"]
+        resp.reason = entry.get("reason") or ""
+        resp.headers = CaseInsensitiveDict(entry.get("headers") or {})
+        resp.encoding = entry.get("encoding")
+        resp._content = (self.directory / entry["body"]).read_bytes()
+        return resp
+
+    def close(self) -> None:
+        pass
+
+
+def iter_recorded(directory: Path) -> Iterator[tuple[dict, str]]:
+    """記録済みの応答（index.jsonl の 1 行と、デコードした本文）を記録順に返す。ベンチマーク用。"""
+    directory = Path(directory)
+    with (directory / INDEX_FILE).open(encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            body = (directory / entry["body"]).read_bytes()
+            yield entry, body.decode(entry.get("encoding") or "utf-8", errors="replace")
+
+
+def _path_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path}"
@@ -0,0 +1,98 @@
+"""
+1 回の実行全体の時間予算（RUN_BUDGET_SECONDS）。cron 等の実行時間の上限で強制終了される前に、
+取得できた分だけでも送信するために使う。
+
+- 取得（ログイン・SSO・各ページ）のリクエストは、残り時間から送信用の予約分（RUN_BUDGET_SEND_RESERVE_SECONDS）を
+  引いた時間に収まるようタイムアウトを短くする。残りがなければ BudgetExceeded を送出する
+- 送信（LINE）は予約分を含めた残り時間を使う
+- 時間切れで取得しなかった取得元は skipped に記録し、送信するメッセージに「一部のみ」と注記する
+"""
+import logging
+import threading
+import time
+from typing import Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# これより短いタイムアウトではリクエストを送らない（秒）
+MIN_REQUEST_TIMEOUT = 1.0
+
+Timeout = Union[None, float, tuple]
+
+
+class BudgetExceeded(Exception):
+    """実行の時間予算を使い切った（RequestException ではないため、取得元ごとの通常のエラー処理では握りつぶされない）。"""
+
+
+class RunBudget:
+    """実行開始（started、省略時は作成時の time.monotonic()）からの経過時間で残り時間を計算する。seconds が 0 以下なら無制限。"""
+
+    def __init__(self, seconds: float, send_reserve: float = 0.0, started: Optional[float] = None) -> None:
+        self.seconds = seconds
+        self.send_reserve = max(0.0, send_reserve) if seconds > 0 else 0.0
+        self.started = time.monotonic() if started is None else started
+        self.deadline = self.started + seconds if seconds > 0 else None
+        self._lock = threading.Lock()
+        # 時間切れで取得しなかった取得元（表示名）
+        self.skipped: list[str] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.deadline is not None
+
+    def remaining(self, for_send: bool = False) -> Optional[float]:
+        """残り時間（秒）。取得用は送信の予約分を除く。無制限なら None。"""
+        if self.deadline is None:
+            return None
+        left = self.deadline - time.monotonic()
+        return left if for_send else left - self.send_reserve
+
+    def expired(self) -> bool:
+        left = self.remaining()
+        return left is not None and left < MIN_REQUEST_TIMEOUT
+
+    def check(self, what: str) -> None:
+        """取得用の残り時間がなければ BudgetExceeded。"""
+        if self.expired():
+            raise BudgetExceeded(f"実行の時間予算（{self.seconds:.0f} 秒）を使い切ったため {what} を中止しました")
+
+    def clamp_timeout(self, timeout: Timeout) -> Timeout:
+        """requests の timeout（秒 または (接続, 読み込み)）を取得用の残り時間に収める。"""
+        left = self.remaining()
+        if left is None:
+            return timeout
+        self.check("リクエスト")
+        if timeout is None:
+            return left
+        if isinstance(timeout, tuple):
+            return tuple(left if t is None else min(t, left) for t in timeout)
+        return min(timeout, left)
+
+    def send_timeout(self, timeout: float) -> float:
+        """送信用のタイムアウト。時間切れでも MIN_REQUEST_TIMEOUT は試す（送信がこの実行の目的のため）。"""
+        left = self.remaining(for_send=True)
+        if left is None:
+            return timeout
+        return max(MIN_REQUEST_TIMEOUT, min(timeout, left))
+
+    def sleep_allowed(self, seconds: float) -> bool:
+        """seconds 待ってもまだ取得を続けられるか。"""
+        left = self.remaining()
+        return left is None or seconds + MIN_REQUEST_TIMEOUT <= left
+
+    def skip(self, source: str) -> None:
+        with self._lock:
+            if source in self.skipped:
+                return
+            self.skipped.append(source)
+        logger.warning("[時間予算] 残り時間がないため %s を取得しませんでした", source)
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.skipped)
+
+    def partial_note(self) -> Optional[str]:
+        """送信メッセージに付ける注記（一部のみ取得した場合）。"""
+        if not self.skipped:
+            return None
+        return f"※ 実行時間の上限（{self.seconds:.0f} 秒）に達したため、{'・'.join(self.skipped)} を取得できていません（一部の課題のみ）。"
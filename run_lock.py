@@ -0,0 +1,240 @@
+"""
+同時実行の防止（シングルフライト）と重複送信の抑止。
+
+タスクスケジューラ・Railway Cron・手動実行が重なると、両方がログインして
+互いのセッションや TOTP を無効にし、LINE にも同じ内容が 2 回届く。
+ロックファイル（STATE_DIR/run.lock）を O_EXCL で作成した実行だけが Moodle にアクセスし、
+後から来た実行はその終了を待ってスナップショットを再利用する。
+
+ロックにはリース（有効期限）があり、保持中は定期的に延長する。
+プロセスが強制終了されて延長が止まったロックは、期限切れ後に他の実行が回収する。
+"""
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Optional
+
+if TYPE_CHECKING:
+    from models import Assignment
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILE = "run.lock"
+SENT_FILE = "last_sent.json"
+
+# ロック解放待ちのポーリング間隔（秒）
+_POLL_INTERVAL = 2.0
+
+
+class RunLock:
+    """リース付きのファイルロック。"""
+
+    def __init__(self, state_dir: Path, run_id: str, lease_seconds: int) -> None:
+        self.path = Path(state_dir) / LOCK_FILE
+        self.run_id = run_id
+        self.lease_seconds = lease_seconds
+        self._held = False
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def _content(self) -> dict:
+        now = time.time()
+        return {
+            "run_id": self.run_id,
+            "pid": os.getpid(),
+            "host": socket.gethostname(),
+            "acquired_at": now,
+            "lease_until": now + self.lease_seconds,
+        }
+
+    def holder(self) -> Optional[dict]:
+        """現在ロックを持っている実行の情報（なければ None）。"""
+        try:
+            with self.path.open(encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _is_stale(self, info: dict) -> bool:
+        if info.get("lease_until", 0) < time.time():
+            return True
+        # 同じホストでプロセスが既に終了していれば期限前でも回収する
+        # （Windows の os.kill(pid, 0) は Ctrl+C 送信になるため POSIX のみ）
+        if os.name == "posix" and info.get("host") == socket.gethostname():
+            try:
+                os.kill(int(info.get("pid", 0)), 0)
+            except ProcessLookupError:
+                return True
+            except (PermissionError, ValueError, OSError):
+                pass
+        return False
+
+    def _is_abandoned_empty(self) -> bool:
+        try:
+            return time.time() - self.path.stat().st_mtime > self.lease_seconds
+        except OSError:
+            return False
+
+    def try_acquire(self) -> bool:
+        """ロックを取得できれば True。期限切れのロックは回収してから取得を試みる。"""
+        for _ in range(2):
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                info = self.holder()
+                if info is None:
+                    # 作成直後で書き込み途中のロック。作成したまま異常終了して空のまま残ったものだけ回収する
+                    if not self._is_abandoned_empty():
+                        return False
+                    info = {}
+                elif not self._is_stale(info):
+                    return False
+                self._reclaim(info)
+                continue
+            except OSError as e:
+                # 状態ディレクトリに書けない環境（読み取り専用など）ではロックなしで実行する
+                logger.warning("ロックファイルを作成できないため、ロックなしで実行します: %s", e)
+                return True
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._content(), f)
+            self._held = True
+            self._start_heartbeat()
+            return True
+        return False
+
+    def _reclaim(self, stale: dict) -> None:
+        """期限切れのロックを退避する。退避した直後に別の実行の新しいロックだったと分かれば戻す。"""
+        aside = self.path.with_name(f"{self.path.name}.{uuid.uuid4().hex[:8]}.stale")
+        try:
+            os.rename(self.path, aside)
+        except OSError:
+            return  # 他の実行が先に回収した
+        try:
+            with aside.open(encoding="utf-8") as f:
+                moved = json.load(f)
+        except (OSError, ValueError):
+            moved = {}
+        if moved.get("run_id") != stale.get("run_id"):
+            try:
+                os.replace(aside, self.path)
+            except OSError:
+                pass
+            return
+        logger.warning(
+            "期限切れのロックを回収しました (run_id=%s pid=%s host=%s)",
+            stale.get("run_id"), stale.get("pid"), stale.get("host"),
+        )
+        try:
+            aside.unlink()
+        except OSError:
+            pass
+
+    def _start_heartbeat(self) -> None:
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._renew_loop, name="run-lock-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def _renew_loop(self) -> None:
+        interval = max(1.0, self.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            info = self.holder()
+            if not info or info.get("run_id") != self.run_id:
+                logger.warning("ロックが他の実行に回収されました (run_id=%s)", self.run_id)
+                return
+            info["lease_until"] = time.time() + self.lease_seconds
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            try:
+                tmp.write_text(json.dumps(info), encoding="utf-8")
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logger.warning("ロックの延長に失敗: %s", e)
+
+    def release(self) -> None:
+        """保持しているロックを解放する。"""
+        if not self._held:
+            return
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join(timeout=5)
+        info = self.holder()
+        if info and info.get("run_id") == self.run_id:
+            try:
+                self.path.unlink()
+            except OSError as e:
+                logger.warning("ロックの削除に失敗: %s", e)
+        self._held = False
+
+    def wait_for_release(self, timeout: float) -> bool:
+        """ロックが解放される（または期限切れになる）まで待つ。timeout 秒以内に解放されれば True。"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            info = self.holder()
+            if info is None or self._is_stale(info):
+                return True
+            time.sleep(_POLL_INTERVAL)
+        return False
+
+    def __enter__(self) -> "RunLock":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+def _message_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def already_sent(state_dir: Path, text: str, window: timedelta) -> bool:
+    """同じ内容を window 以内に送信済みなら True。"""
+    try:
+        with (Path(state_dir) / SENT_FILE).open(encoding="utf-8") as f:
+            last = json.load(f)
+        sent_at = datetime.fromisoformat(last["sent_at"])
+    except (OSError, ValueError, KeyError):
+        return False
+    return last.get("hash") == _message_hash(text) and datetime.now() - sent_at < window
+
+
+def reminder_signature(assignments: Iterable["Assignment"]) -> str:
+    """締切が近い課題の組（課題と締切）のハッシュ。メッセージの文面（残り時間の表示など）が変わっても同じになる。"""
+    items = sorted(f"{a.key}|{a.due_date.isoformat() if a.due_date else ''}" for a in assignments)
+    return _message_hash("\n".join(items))
+
+
+def already_reminded(state_dir: Path, signature: str, now: Optional[datetime] = None) -> bool:
+    """
+    同じ課題の組（reminder_signature）を今日すでに送信済みなら True。
+    --if-due で 30 分ごとに起動しても、締切が近い課題が増減・変更されない限り 1 日 1 回しか送らない。
+    """
+    now = now or datetime.now()
+    try:
+        with (Path(state_dir) / SENT_FILE).open(encoding="utf-8") as f:
+            last = json.load(f)
+        sent_at = datetime.fromisoformat(last["sent_at"])
+    except (OSError, ValueError, KeyError):
+        return False
+    return last.get("signature") == signature and sent_at.date() == now.date()
+
+
+def mark_sent(state_dir: Path, text: str, run_id: str, signature: Optional[str] = None) -> None:
+    """送信した内容（ハッシュ）・課題の組と時刻を記録する。"""
+    path = Path(state_dir) / SENT_FILE
+    entry = {"hash": _message_hash(text), "sent_at": datetime.now().isoformat(timespec="seconds"), "run_id": run_id}
+    if signature:
+        entry["signature"] = signature
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(entry), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("送信記録を書き込めませんでした: %s", e)
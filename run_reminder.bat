@@ -1,9 +1,10 @@
 @echo off
 REM Moodle リマインドを実行（タスクスケジューラから呼ぶ想定）
+REM 引数はそのまま main.py に渡す（例: run_reminder.bat --if-due）
 cd /d "%~dp0"
 if exist "venv\Scripts\activate.bat" (
   call venv\Scripts\activate.bat
-  python main.py
+  python main.py %*
 ) else (
-  python main.py
+  python main.py %*
 )
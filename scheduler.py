@@ -0,0 +1,124 @@
+"""
+締切に応じた次回チェック時刻の決定（適応ポーリング）。
+
+締切が近づくほど短い間隔で、何日も締切がないときは長い間隔でチェックする。
+計算した次回時刻は STATE_DIR/next_run.json に書き出し、
+main.py --if-due で起動したときはその時刻前なら Moodle にアクセスせず終了する。
+"""
+import json
+import logging
+import os
+from datetime import datetime, time, timedelta
+from pathlib import Path
+from typing import Iterable, Optional
+
+from models import Assignment
+
+logger = logging.getLogger(__name__)
+
+NEXT_RUN_FILE = "next_run.json"
+
+# 締切までの残り時間のこの割合ごとにチェックする（残り 8 時間なら 2 時間ごと）
+_APPROACH_DIVISOR = 4
+# 実行の揺れ（起動が数分早い等）で 1 回分スキップしないための許容幅
+_DUE_TOLERANCE = timedelta(minutes=5)
+
+
+def next_check_time(
+    deadlines: Iterable[datetime],
+    now: datetime,
+    reminder_days: int,
+    min_interval: timedelta,
+    max_interval: timedelta,
+    window_entry_hour: int = 17,
+) -> tuple[datetime, str]:
+    """
+    次回チェック時刻とその理由を返す。
+    - 最も近い締切までの残り時間の 1/_APPROACH_DIVISOR 後（min_interval〜max_interval に収める）
+    - 締切がリマインド対象（reminder_days 日以内）に入る日の window_entry_hour 時
+    のうち早い方（ただし対象に入る日の 0 時〜window_entry_hour 時には実行しない）。締切がなければ max_interval 後。
+    リマインド対象が変わった実行で送信するため、window_entry_hour は送信してよい時刻（毎日実行していた時刻）にする。
+    """
+    upcoming = sorted(d for d in deadlines if d > now)
+    if not upcoming:
+        return now + max_interval, "締切なし"
+
+    nearest = upcoming[0]
+    interval = min(max(min_interval, (nearest - now) / _APPROACH_DIVISOR), max_interval)
+    candidate, reason = now + interval, f"最も近い締切 {nearest:%Y-%m-%d %H:%M}"
+
+    # まだリマインド対象外の締切は、対象になる日の window_entry_hour 時にチェックする（深夜に送信しない）
+    today = now.date()
+    for d in upcoming:
+        window_start = d.date() - timedelta(days=reminder_days)
+        if window_start <= today:
+            continue
+        entry = max(datetime.combine(window_start, time(hour=window_entry_hour)), now + min_interval)
+        # 対象に入る日の window_entry_hour 時より前の実行も送信してしまうため、その日の間隔どおりの実行は entry まで遅らせる
+        if entry < candidate or candidate >= datetime.combine(window_start, time.min):
+            candidate, reason = entry, f"{d:%Y-%m-%d %H:%M} の締切がリマインド対象に入る"
+        break
+    return candidate, reason
+
+
+def _state_path(state_dir: Path) -> Path:
+    return Path(state_dir) / NEXT_RUN_FILE
+
+
+def load_state(state_dir: Path) -> dict:
+    """next_run.json を読み込む（なければ空の dict）。"""
+    try:
+        with _state_path(state_dir).open(encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def is_due(state_dir: Path, now: Optional[datetime] = None) -> bool:
+    """次回チェック時刻を過ぎていれば True（記録がなければ常に True）。"""
+    now = now or datetime.now()
+    next_run = load_state(state_dir).get("next_run")
+    if not next_run:
+        return True
+    try:
+        return now + _DUE_TOLERANCE >= datetime.fromisoformat(next_run)
+    except ValueError:
+        return True
+
+
+def schedule_next(
+    state_dir: Path,
+    assignments: list[Assignment],
+    reminder_days: int,
+    min_interval: timedelta,
+    max_interval: timedelta,
+    now: Optional[datetime] = None,
+    window_entry_hour: int = 17,
+) -> datetime:
+    """
+    取得した課題から次回チェック時刻を決め、next_run.json に書き出す。
+    締切は今回取得した課題のものだけを使う（提出済み・削除された課題や変更前の締切は残さない）。
+    """
+    now = now or datetime.now()
+    deadlines = {a.key: a.due_date for a in assignments if a.due_date and a.due_date > now}
+
+    next_run, reason = next_check_time(
+        deadlines.values(), now, reminder_days, min_interval, max_interval, window_entry_hour
+    )
+    state = {
+        "next_run": next_run.isoformat(timespec="seconds"),
+        "reason": reason,
+        "computed_at": now.isoformat(timespec="seconds"),
+        # 課題（assignment_key）ごとの締切（確認用）
+        "deadlines": {k: d.isoformat(timespec="seconds") for k, d in sorted(deadlines.items(), key=lambda kv: kv[1])},
+    }
+    path = _state_path(state_dir)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("次回チェック時刻を書き込めませんでした: %s", e)
+    logger.info("次回チェック: %s（%s）", state["next_run"], reason)
+    return next_run
@@ -0,0 +1,88 @@
+"""
+最新の課題一覧（スナップショット）の保存と読み込み。
+
+1 行目がメタ情報（run_id・取得時刻・件数）、2 行目以降が課題 1 件ずつの JSON Lines。
+一時ファイルに書いてから置き換えるので、読み込み側が書きかけのファイルを見ることはない。
+保存先: STATE_DIR/assignments.jsonl
+"""
+import json
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Iterator, Optional
+
+from models import Assignment
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = "assignments.jsonl"
+
+
+@dataclass
+class Snapshot:
+    """保存済みスナップショット。"""
+
+    run_id: str
+    fetched_at: datetime
+    assignments: list[Assignment]
+
+
+def snapshot_path(state_dir: Path) -> Path:
+    return Path(state_dir) / SNAPSHOT_FILE
+
+
+def save_snapshot(state_dir: Path, run_id: str, assignments: list[Assignment], fetched_at: Optional[datetime] = None) -> None:
+    """スナップショットをアトミックに書き出す。"""
+    fetched_at = fetched_at or datetime.now()
+    path = snapshot_path(state_dir)
+    meta = {"run_id": run_id, "fetched_at": fetched_at.isoformat(timespec="seconds"), "count": len(assignments)}
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            f.write(json.dumps(meta, ensure_ascii=False) + "\n")
+            for a in assignments:
+                f.write(json.dumps(a.to_dict(), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("スナップショットを書き込めませんでした: %s", e)
+
+
+def open_snapshot(state_dir: Path) -> tuple[IO[str], dict]:
+    """
+    スナップショットを開いてメタ情報を読む。続きは iter_assignment_dicts(f) で 1 件ずつ読める。
+    置き換えが起きても開いたファイルの内容は変わらないので、読み終えるまで一貫した内容になる。
+    """
+    f = snapshot_path(state_dir).open(encoding="utf-8")
+    try:
+        meta = json.loads(f.readline())
+    except ValueError:
+        f.close()
+        raise
+    return f, meta
+
+
+def iter_assignment_dicts(f: IO[str]) -> Iterator[dict]:
+    """open_snapshot() で開いたファイルから課題を 1 件ずつ dict で返す（全件をメモリに載せない）。"""
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def load_snapshot(state_dir: Path) -> Optional[Snapshot]:
+    """スナップショットを読み込む（なければ・壊れていれば None）。"""
+    try:
+        f, meta = open_snapshot(state_dir)
+        with f:
+            assignments = [Assignment.from_dict(d) for d in iter_assignment_dicts(f)]
+        return Snapshot(
+            run_id=meta.get("run_id", ""),
+            fetched_at=datetime.fromisoformat(meta["fetched_at"]),
+            assignments=assignments,
+        )
+    except (OSError, ValueError, KeyError):
+        return None
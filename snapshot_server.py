@@ -0,0 +1,107 @@
+"""
+最新の課題スナップショットを返すローカル HTTP API（読み取り専用）。
+ダッシュボードやカレンダー同期など他のツールが、Moodle にアクセスせずに課題一覧を取得するために使う。
+
+エンドポイント:
+  GET /assignments.json   {"run_id", "fetched_at", "assignments": [...]}
+  GET /assignments.jsonl  1 行 1 課題
+  GET /assignments.csv
+  GET /assignments.ics    締切を予定にした iCalendar（カレンダーアプリで購読可）
+ETag を返し、If-None-Match が一致すれば 304 を返す。
+
+使い方:
+  python snapshot_server.py                    # http://127.0.0.1:8765/assignments.json
+  python snapshot_server.py --host 0.0.0.0 --port 8080
+"""
+import argparse
+import os
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+import export
+import snapshot
+from config import SNAPSHOT_API_PORT, STATE_DIR
+
+
+class SnapshotHandler(BaseHTTPRequestHandler):
+    state_dir: Path = STATE_DIR
+
+    def _route(self) -> Optional[str]:
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path in ("", "/assignments"):
+            return "json"
+        if path.startswith("/assignments."):
+            fmt = path[len("/assignments."):]
+            return fmt if fmt in export.FORMATS else None
+        return None
+
+    def _serve(self, with_body: bool) -> None:
+        fmt = self._route()
+        if fmt is None:
+            self._send_plain(404, "Not Found. GET /assignments.{json,jsonl,csv,ics}")
+            return
+        try:
+            f, meta = snapshot.open_snapshot(self.state_dir)
+        except (OSError, ValueError):
+            self._send_plain(503, "スナップショットがまだありません。main.py を実行してください")
+            return
+        with f:
+            # 開いたファイルの更新時刻・サイズから ETag を作る（置き換えられても開いた内容と一致する）
+            st = os.fstat(f.fileno())
+            etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}-{fmt}"'
+            if etag in [t.strip() for t in (self.headers.get("If-None-Match") or "").split(",")]:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", export.CONTENT_TYPES[fmt])
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Last-Modified", self.date_time_string(int(st.st_mtime)))
+            self.end_headers()
+            if not with_body:
+                return
+            for chunk in export.iter_export(fmt, meta, f):
+                self.wfile.write(chunk.encode("utf-8"))
+
+    def _send_plain(self, status: int, text: str) -> None:
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._serve(with_body=True)
+
+    def do_HEAD(self):
+        self._serve(with_body=False)
+
+    def log_message(self, format, *args):
+        pass  # アクセスログは出さない
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="最新の課題スナップショットを返すローカル HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=SNAPSHOT_API_PORT)
+    parser.add_argument("--state-dir", type=Path, default=STATE_DIR)
+    args = parser.parse_args(argv)
+
+    SnapshotHandler.state_dir = args.state_dir
+    server = ThreadingHTTPServer((args.host, args.port), SnapshotHandler)
+    print(f"スナップショット API 起動: http://{args.host}:{args.port}/assignments.json  Ctrl+C で終了")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n終了しました。")
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
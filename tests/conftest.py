@@ -0,0 +1,27 @@
+"""
+テスト共通の設定。リポジトリのルートのモジュールを読み込めるようにし、
+状態・ログの保存先をテストごとの一時ディレクトリに向ける（本番の state / logs に書かない）。
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+@pytest.fixture
+def cfg(tmp_path, monkeypatch):
+    """一時ディレクトリを使う設定（config.settings()）。.env の値は上書きする。"""
+    import config
+
+    settings = config.settings()
+    monkeypatch.setattr(settings, "STATE_DIR", tmp_path / "state")
+    monkeypatch.setattr(settings, "BASE_STATE_DIR", tmp_path / "state")
+    monkeypatch.setattr(settings, "ARCHIVE_DIR", tmp_path / "state" / "archive")
+    monkeypatch.setattr(settings, "LOG_DIR", tmp_path / "logs")
+    monkeypatch.setattr(settings, "MOODLE_URL", "https://moodle.test")
+    monkeypatch.setattr(settings, "RUN_LOCK_WAIT_SECONDS", 0)
+    return settings
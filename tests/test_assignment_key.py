@@ -0,0 +1,58 @@
+"""
+課題の同一性キー（models.assignment_key）と取得元の統合（moodle_scraper._merge_assignments）。
+"""
+from datetime import datetime
+
+from models import Assignment, assignment_key
+from moodle_scraper import _merge_assignments
+
+BASE = "https://moodle.test"
+
+
+def test_different_ids_stay_separate():
+    assert assignment_key(f"{BASE}/mod/assign/view.php?id=101") == "assign:101"
+    assert assignment_key(f"{BASE}/mod/assign/view.php?id=102") == "assign:102"
+
+
+def test_same_module_with_extra_query_and_fragment():
+    assert assignment_key(f"{BASE}/mod/assign/view.php?action=view&id=101#top") == "assign:101"
+    assert assignment_key(f"{BASE.upper()}/mod/ASSIGN/view.php?id=101") == "assign:101"
+
+
+def test_module_type_is_part_of_the_key():
+    assert assignment_key(f"{BASE}/mod/quiz/view.php?id=101") != assignment_key(f"{BASE}/mod/assign/view.php?id=101")
+
+
+def test_other_urls_are_normalized():
+    a = assignment_key(f"{BASE}/calendar/view.php?view=day&course=5#x")
+    b = assignment_key(f"{BASE.upper()}/calendar/view.php/?course=5&view=day")
+    assert a == b
+
+
+def test_merge_keeps_different_ids_separate():
+    merged = _merge_assignments(
+        [Assignment("第1回", None, "授業", f"{BASE}/mod/assign/view.php?id=1")],
+        [Assignment("第2回", None, "授業", f"{BASE}/mod/assign/view.php?id=2")],
+    )
+    assert sorted(a.key for a in merged) == ["assign:1", "assign:2"]
+
+
+def test_merge_fills_missing_fields_from_later_sources():
+    due = datetime(2030, 1, 15, 23, 59)
+    calendar = [Assignment("レポート", None, "", f"{BASE}/mod/assign/view.php?id=7")]
+    dashboard = [Assignment("（無題）", due, "情報科学", f"{BASE}/mod/assign/view.php?action=view&id=7", "説明")]
+
+    [merged] = _merge_assignments(calendar, dashboard)
+    assert merged.title == "レポート"
+    assert merged.due_date == due
+    assert merged.course_name == "情報科学"
+    assert merged.description_preview == "説明"
+
+
+def test_merge_prefers_earlier_source_and_does_not_mutate_inputs():
+    first = Assignment("レポート", datetime(2030, 1, 15), "授業 A", f"{BASE}/mod/assign/view.php?id=7")
+    second = Assignment("レポート（再掲）", datetime(2030, 1, 20), "授業 B", f"{BASE}/mod/assign/view.php?id=7")
+
+    [merged] = _merge_assignments([first], [second])
+    assert (merged.title, merged.due_date, merged.course_name) == ("レポート", datetime(2030, 1, 15), "授業 A")
+    assert merged is not first
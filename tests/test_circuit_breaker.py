@@ -0,0 +1,77 @@
+"""
+サーキットブレーカー（circuit_breaker.CircuitBreaker）の状態遷移。
+"""
+import time
+
+import pytest
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+HOST = "moodle.test"
+
+
+def _open(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.failure_threshold):
+        breaker.before_request(HOST)
+        breaker.record_failure(HOST, "ConnectTimeout")
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(None, 3, 60)
+    breaker.record_failure(HOST, "HTTP 503")
+    breaker.record_failure(HOST, "HTTP 503")
+    assert breaker.state(HOST) == CLOSED
+    breaker.record_failure(HOST, "HTTP 503")
+    assert breaker.state(HOST) == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(HOST)
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(None, 2, 60)
+    breaker.record_failure(HOST, "HTTP 503")
+    breaker.record_success(HOST)
+    breaker.record_failure(HOST, "HTTP 503")
+    assert breaker.state(HOST) == CLOSED
+
+
+def test_half_open_allows_a_single_probe(monkeypatch):
+    breaker = CircuitBreaker(None, 1, 60)
+    _open(breaker)
+    monkeypatch.setattr(time, "time", lambda real=time.time: real() + 61)
+
+    assert breaker.before_request(HOST) is True
+    assert breaker.state(HOST) == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(HOST)
+
+    breaker.record_success(HOST)
+    assert breaker.state(HOST) == CLOSED
+    assert breaker.before_request(HOST) is False
+
+
+def test_failed_probe_reopens(monkeypatch):
+    breaker = CircuitBreaker(None, 3, 60)
+    _open(breaker)
+    monkeypatch.setattr(time, "time", lambda real=time.time: real() + 61)
+    breaker.before_request(HOST)
+    breaker.record_failure(HOST, "ConnectTimeout")
+    assert breaker.state(HOST) == OPEN
+
+
+def test_released_probe_can_be_retried(monkeypatch):
+    breaker = CircuitBreaker(None, 1, 60)
+    _open(breaker)
+    monkeypatch.setattr(time, "time", lambda real=time.time: real() + 61)
+    assert breaker.before_request(HOST)
+    breaker.release_probe(HOST)
+    assert breaker.before_request(HOST)
+
+
+def test_state_is_shared_through_the_file(tmp_path):
+    a = CircuitBreaker(tmp_path, 1, 60)
+    b = CircuitBreaker(tmp_path, 1, 60)
+    a.record_failure("sso.test", "ConnectTimeout")
+    b.record_failure(HOST, "ConnectTimeout")
+
+    assert CircuitBreaker(tmp_path, 1, 60).states() == {"sso.test": OPEN, HOST: OPEN}
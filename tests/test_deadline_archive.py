@@ -0,0 +1,72 @@
+"""
+締切アーカイブ（deadline_archive.TermArchive）の追記と読み出し。
+"""
+from datetime import datetime
+
+import pytest
+
+import deadline_archive
+from deadline_archive import TermArchive
+from models import Assignment
+
+URL = "https://moodle.test/mod/assign/view.php?id={}"
+
+
+def _a(cmid: int, due, course: str = "情報科学", title: str = "") -> Assignment:
+    return Assignment(title or f"課題 {cmid}", due, course, URL.format(cmid))
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return TermArchive(tmp_path, "2026-2")
+
+
+def test_round_trip(archive):
+    observed = datetime(2026, 10, 19, 17, 0)
+    archive.append([_a(1, datetime(2026, 10, 25, 23, 59)), _a(2, None, course="")], observed, account="alice")
+
+    rows = sorted(archive.iter_rows(), key=lambda r: r.key)
+    assert [(r.key, r.course_name, r.title, r.due_date, r.account, r.observed_at) for r in rows] == [
+        ("assign:1", "情報科学", "課題 1", datetime(2026, 10, 25, 23, 59), "alice", observed),
+        ("assign:2", "", "課題 2", None, "alice", observed),
+    ]
+
+
+def test_unchanged_run_reuses_the_block(archive):
+    items = [_a(1, datetime(2026, 10, 25, 23, 59))]
+    assert archive.append(items, datetime(2026, 10, 19, 17, 0), account="alice")
+    size = archive.dat_path.stat().st_size
+    assert not archive.append(items, datetime(2026, 10, 20, 17, 0), account="alice")
+    assert archive.dat_path.stat().st_size == size
+    assert len(archive.index()) == 2
+    assert [r.observed_at.day for r in archive.iter_rows()] == [19, 20]
+
+
+def test_filters(archive):
+    archive.append([_a(1, datetime(2026, 10, 25)), _a(2, datetime(2026, 11, 5), course="統計学")],
+                   datetime(2026, 10, 19), account="alice")
+    archive.append([_a(3, datetime(2026, 10, 26))], datetime(2026, 10, 19), account="bob")
+
+    assert {r.key for r in archive.iter_rows(start=datetime(2026, 11, 1))} == {"assign:2"}
+    assert {r.key for r in archive.iter_rows(end=datetime(2026, 10, 26))} == {"assign:1"}
+    assert {r.key for r in archive.iter_rows(course="統計学")} == {"assign:2"}
+    assert {r.key for r in archive.iter_rows(account="bob")} == {"assign:3"}
+    assert list(archive.iter_rows(course="存在しない授業")) == []
+    assert list(archive.iter_rows(by="observed", start=datetime(2026, 10, 20))) == []
+
+
+def test_due_date_changes(archive):
+    archive.append([_a(1, datetime(2026, 10, 25))], datetime(2026, 10, 19), account="alice")
+    archive.append([_a(1, datetime(2026, 10, 27))], datetime(2026, 10, 20), account="alice")
+
+    changes = deadline_archive.due_date_changes(archive.iter_rows())
+    assert changes == {("alice", "assign:1"): [
+        (datetime(2026, 10, 19), datetime(2026, 10, 25)),
+        (datetime(2026, 10, 20), datetime(2026, 10, 27)),
+    ]}
+
+
+def test_term_of():
+    assert deadline_archive.term_of(datetime(2026, 4, 1)) == "2026-1"
+    assert deadline_archive.term_of(datetime(2026, 10, 1)) == "2026-2"
+    assert deadline_archive.term_of(datetime(2027, 3, 31)) == "2026-2"
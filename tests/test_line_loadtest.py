@@ -0,0 +1,30 @@
+"""
+line_loadtest.py のスモークテスト（line_sender の関数の引数が変わっても負荷試験が動くことを確認する）。
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _run(*args: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONIOENCODING="utf-8")
+    env.pop("ENV_FILE", None)
+    return subprocess.run(
+        [sys.executable, str(ROOT / "line_loadtest.py"), "--latency-ms", "0", "--jitter-ms", "0", *args],
+        cwd=str(ROOT), env=env, capture_output=True, text=True, encoding="utf-8", timeout=120,
+    )
+
+
+def test_reminder_push():
+    proc = _run("--recipients", "5", "--assignments", "3")
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    assert "successful sends  1/1" in proc.stdout
+
+
+def test_text_multicast():
+    proc = _run("--recipients", "5", "--target", "text", "--multicast")
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    assert "multicast=1" in proc.stdout
@@ -0,0 +1,54 @@
+"""
+main.py の取得失敗時の扱い。ログインできなかった実行は課題 0 件として扱わず、
+前回のスナップショット・締切アーカイブ・次回チェック時刻を変えない。
+"""
+import json
+from datetime import datetime
+
+import pytest
+
+import main
+import moodle_scraper
+import snapshot
+from circuit_breaker import CircuitBreaker
+from models import Assignment
+
+
+@pytest.fixture
+def failing_login(monkeypatch):
+    monkeypatch.setattr(moodle_scraper, "login", lambda session: False)
+    monkeypatch.setattr(moodle_scraper, "_breaker", CircuitBreaker(None, 3, 60))
+
+
+def test_login_failure_keeps_previous_state(cfg, failing_login):
+    previous = [Assignment("レポート", datetime(2030, 1, 15, 23, 59), "授業", "https://moodle.test/mod/assign/view.php?id=1")]
+    snapshot.save_snapshot(cfg.STATE_DIR, "previous-run", previous)
+    next_run = cfg.STATE_DIR / "next_run.json"
+    next_run.write_text(json.dumps({"next_run": "2030-01-15T18:00:00"}), encoding="utf-8")
+
+    assert main.main(dry_run=True) == 1
+
+    snap = snapshot.load_snapshot(cfg.STATE_DIR)
+    assert snap is not None and snap.run_id == "previous-run"
+    assert [a.key for a in snap.assignments] == ["assign:1"]
+    assert json.loads(next_run.read_text(encoding="utf-8"))["next_run"] == "2030-01-15T18:00:00"
+    assert not cfg.ARCHIVE_DIR.exists()
+
+
+def test_login_failure_sends_nothing(cfg, failing_login, capsys):
+    assert main.main(dry_run=True) == 1
+    assert capsys.readouterr().out == ""
+
+
+def test_open_circuit_fails_the_run_without_reserving_slots(cfg, monkeypatch, capsys):
+    breaker = CircuitBreaker(None, 1, 3600)
+    breaker.record_failure("moodle.test", "ConnectTimeout")
+    waited = []
+    monkeypatch.setattr(moodle_scraper, "MOODLE_URL", "https://moodle.test")
+    monkeypatch.setattr(moodle_scraper, "_breaker", breaker)
+    monkeypatch.setattr(moodle_scraper._host_budget, "wait", lambda host, budget=None: waited.append(host))
+
+    assert main.main(dry_run=True) == 1
+    assert capsys.readouterr().out == ""
+    assert waited == []
+    assert not (cfg.STATE_DIR / "next_run.json").exists()
@@ -0,0 +1,51 @@
+"""
+MoodleSession.send の時間予算・サーキットブレーカーの扱い（実際には送信しない）。
+"""
+import pytest
+import requests
+
+import moodle_scraper
+from circuit_breaker import CircuitBreaker
+from run_budget import BudgetExceeded, RunBudget
+
+URL = "https://moodle.test/my/"
+
+
+@pytest.fixture
+def raise_on_send(monkeypatch):
+    def install(exc: Exception) -> None:
+        def send(self, request, **kwargs):
+            raise exc
+
+        monkeypatch.setattr(requests.Session, "send", send)
+
+    monkeypatch.setattr(moodle_scraper._host_budget, "wait", lambda host, budget=None: None)
+    return install
+
+
+def test_connect_timeout_at_unclamped_limit_is_a_host_failure(raise_on_send):
+    # 読み込み側だけ残り時間に合わせて短くしたが、切れたのは短くしていない接続側
+    breaker = CircuitBreaker(None, 3, 60)
+    session = moodle_scraper.MoodleSession(breaker, RunBudget(20))
+    raise_on_send(requests.ConnectTimeout("connect timed out"))
+    with pytest.raises(requests.ConnectTimeout):
+        session.get(URL, timeout=(10, 30))
+    assert breaker._hosts["moodle.test"]["failures"] == 1
+
+
+def test_read_timeout_on_clamped_limit_is_budget_exceeded(raise_on_send):
+    breaker = CircuitBreaker(None, 3, 60)
+    session = moodle_scraper.MoodleSession(breaker, RunBudget(20))
+    raise_on_send(requests.ReadTimeout("read timed out"))
+    with pytest.raises(BudgetExceeded):
+        session.get(URL, timeout=(10, 30))
+    assert "moodle.test" not in breaker._hosts
+
+
+def test_read_timeout_without_clamping_is_a_host_failure(raise_on_send):
+    breaker = CircuitBreaker(None, 3, 60)
+    session = moodle_scraper.MoodleSession(breaker, RunBudget(600))
+    raise_on_send(requests.ReadTimeout("read timed out"))
+    with pytest.raises(requests.ReadTimeout):
+        session.get(URL, timeout=(10, 30))
+    assert breaker._hosts["moodle.test"]["failures"] == 1
@@ -0,0 +1,62 @@
+"""
+実行の時間予算（run_budget.RunBudget）。
+"""
+import time
+
+import pytest
+
+from run_budget import MIN_REQUEST_TIMEOUT, BudgetExceeded, RunBudget
+
+
+def _budget(seconds: float, elapsed: float = 0.0, send_reserve: float = 0.0) -> RunBudget:
+    return RunBudget(seconds, send_reserve, started=time.monotonic() - elapsed)
+
+
+def test_unlimited_budget_leaves_timeouts_alone():
+    budget = RunBudget(0, send_reserve=30)
+    assert not budget.enabled
+    assert budget.remaining() is None
+    assert budget.clamp_timeout((10, 30)) == (10, 30)
+    assert budget.clamp_timeout(None) is None
+    assert budget.send_timeout(10) == 10
+    assert budget.send_reserve == 0
+
+
+def test_clamp_timeout_keeps_shorter_parts():
+    budget = _budget(100, elapsed=80, send_reserve=5)  # 取得に使える残りは約 15 秒
+    connect, read = budget.clamp_timeout((10, 30))
+    assert connect == 10
+    assert 14 < read <= 15
+    assert 14 < budget.clamp_timeout(30) <= 15
+    assert budget.clamp_timeout(5) == 5
+    assert 14 < budget.clamp_timeout(None) <= 15
+    connect, read = budget.clamp_timeout((10, None))
+    assert connect == 10 and 14 < read <= 15
+
+
+def test_clamp_timeout_raises_when_fetch_budget_is_used_up():
+    budget = _budget(100, elapsed=96, send_reserve=5)
+    assert budget.expired()
+    with pytest.raises(BudgetExceeded):
+        budget.clamp_timeout((10, 30))
+
+
+def test_send_timeout_uses_the_reserve_and_never_drops_below_minimum():
+    budget = _budget(100, elapsed=96, send_reserve=5)
+    assert 3 < budget.send_timeout(10) <= 4
+    assert _budget(100, elapsed=200).send_timeout(10) == MIN_REQUEST_TIMEOUT
+
+
+def test_sleep_allowed():
+    budget = _budget(100, elapsed=80)
+    assert budget.sleep_allowed(5)
+    assert not budget.sleep_allowed(19.5)
+
+
+def test_skip_and_partial_note():
+    budget = _budget(100)
+    assert not budget.partial and budget.partial_note() is None
+    budget.skip("ダッシュボード")
+    budget.skip("ダッシュボード")
+    assert budget.skipped == ["ダッシュボード"]
+    assert "ダッシュボード" in budget.partial_note()
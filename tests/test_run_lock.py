@@ -0,0 +1,36 @@
+"""
+重複送信の抑止（run_lock.reminder_signature / already_reminded / already_sent）。
+"""
+from datetime import datetime, timedelta
+
+import run_lock
+from models import Assignment
+
+
+def _a(cmid: int, due: datetime) -> Assignment:
+    return Assignment(f"課題 {cmid}", due, "授業", f"https://moodle.test/mod/assign/view.php?id={cmid}")
+
+
+def test_signature_ignores_order_and_tracks_deadlines():
+    due = datetime(2026, 10, 20, 23, 59)
+    assert run_lock.reminder_signature([_a(1, due), _a(2, due)]) == run_lock.reminder_signature([_a(2, due), _a(1, due)])
+    assert run_lock.reminder_signature([_a(1, due)]) != run_lock.reminder_signature([_a(1, due + timedelta(days=1))])
+    assert run_lock.reminder_signature([_a(1, due)]) != run_lock.reminder_signature([_a(1, due), _a(2, due)])
+
+
+def test_same_set_is_sent_once_a_day(tmp_path):
+    signature = run_lock.reminder_signature([_a(1, datetime(2026, 10, 20, 23, 59))])
+    assert not run_lock.already_reminded(tmp_path, signature)
+
+    run_lock.mark_sent(tmp_path, "本文", "run-1", signature)
+    now = datetime.now()
+    assert run_lock.already_reminded(tmp_path, signature, now)
+    assert not run_lock.already_reminded(tmp_path, run_lock.reminder_signature([]), now)
+    assert not run_lock.already_reminded(tmp_path, signature, now + timedelta(days=1))
+
+
+def test_already_sent_window(tmp_path):
+    run_lock.mark_sent(tmp_path, "本文", "run-1")
+    assert run_lock.already_sent(tmp_path, "本文", timedelta(minutes=30))
+    assert not run_lock.already_sent(tmp_path, "別の本文", timedelta(minutes=30))
+    assert not run_lock.already_sent(tmp_path, "本文", timedelta(0))
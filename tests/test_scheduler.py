@@ -0,0 +1,66 @@
+"""
+適応ポーリングの次回チェック時刻（scheduler.next_check_time / schedule_next）。
+"""
+import json
+from datetime import datetime, timedelta
+
+import scheduler
+from models import Assignment
+
+MIN = timedelta(minutes=30)
+MAX = timedelta(hours=24)
+
+
+def _next(deadlines, now, reminder_days=1, entry_hour=17):
+    return scheduler.next_check_time(deadlines, now, reminder_days, MIN, MAX, entry_hour)
+
+
+def test_no_deadlines_waits_max_interval():
+    now = datetime(2026, 10, 19, 17, 0)
+    assert _next([], now) == (now + MAX, "締切なし")
+    assert _next([now - timedelta(hours=1)], now)[0] == now + MAX
+
+
+def test_interval_shrinks_as_deadline_approaches():
+    now = datetime(2026, 10, 19, 12, 0)
+    assert _next([now + timedelta(hours=8)], now)[0] == now + timedelta(hours=2)
+    assert _next([now + timedelta(minutes=40)], now)[0] == now + MIN
+    assert _next([now + timedelta(days=30)], now, reminder_days=0)[0] == now + MAX
+
+
+def test_window_entry_is_at_entry_hour_not_midnight():
+    now = datetime(2026, 10, 19, 17, 0)
+    next_run, reason = _next([datetime(2026, 10, 21, 23, 59)], now)
+    assert next_run == datetime(2026, 10, 20, 17, 0)
+    assert "リマインド対象に入る" in reason
+
+
+def test_window_entry_hour_is_configurable():
+    now = datetime(2026, 10, 19, 17, 0)
+    assert _next([datetime(2026, 10, 21, 23, 59)], now, entry_hour=8)[0] == datetime(2026, 10, 20, 8, 0)
+
+
+def test_deadline_already_in_window_uses_interval():
+    now = datetime(2026, 10, 19, 22, 0)
+    next_run, reason = _next([datetime(2026, 10, 20, 10, 0)], now)
+    assert next_run == now + timedelta(hours=3)
+    assert reason.startswith("最も近い締切")
+
+
+def test_schedule_next_keeps_only_current_deadlines(tmp_path):
+    now = datetime(2026, 10, 19, 17, 0)
+    a = Assignment("A", datetime(2026, 10, 25, 12, 0), "授業", "https://moodle.test/mod/assign/view.php?id=1")
+    b = Assignment("B", datetime(2026, 10, 26, 12, 0), "授業", "https://moodle.test/mod/assign/view.php?id=2")
+    scheduler.schedule_next(tmp_path, [a, b], 1, MIN, MAX, now=now)
+    scheduler.schedule_next(tmp_path, [a], 1, MIN, MAX, now=now)
+
+    state = json.loads((tmp_path / scheduler.NEXT_RUN_FILE).read_text(encoding="utf-8"))
+    assert state["deadlines"] == {"assign:1": "2026-10-25T12:00:00"}
+
+
+def test_is_due(tmp_path):
+    now = datetime(2026, 10, 19, 17, 0)
+    assert scheduler.is_due(tmp_path, now)
+    (tmp_path / scheduler.NEXT_RUN_FILE).write_text(json.dumps({"next_run": "2026-10-19T18:00:00"}), encoding="utf-8")
+    assert not scheduler.is_due(tmp_path, now)
+    assert scheduler.is_due(tmp_path, datetime(2026, 10, 19, 17, 56))
@@ -0,0 +1,170 @@
+"""
+ジョブキュー（job_queue.py）のワーカー。複数ノードで起動すると、アカウントごとのジョブを分担して実行する。
+
+各ジョブは main.py を別プロセスで実行する（ENV_FILE=アカウントの設定ファイル、ACCOUNT_NAME=アカウント名）。
+アカウントごとに state/accounts/<アカウント名> を使うため、ロック・スナップショットは混ざらない。
+実行中は JOB_LEASE_SECONDS の 1/3 ごとにリースを延長し、リースを失ったら（他のワーカーが回収したら）実行を止める。
+失敗したジョブは JOB_RETRY_DELAY_SECONDS × 試行回数 後に再実行される（JOB_MAX_ATTEMPTS 回まで）。
+
+使い方:
+  python worker.py                          # ジョブを待ち続ける
+  python worker.py --concurrency 4 --drain  # 4 並列で、実行可能なジョブがなくなったら終了
+  python worker.py --main-arg=--if-due      # main.py に引数を渡す
+"""
+import argparse
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Optional
+
+import job_queue
+from config import (
+    JOB_LEASE_SECONDS,
+    JOB_QUEUE,
+    JOB_RETRY_DELAY_SECONDS,
+    PROJECT_ROOT,
+    QUEUE_TOKEN,
+)
+
+logger = logging.getLogger("worker")
+
+# 実行可能なジョブがないときの待機（秒）
+_IDLE_POLL_SECONDS = 15.0
+
+
+class Worker:
+    def __init__(self, queue, queue_location: str, worker_id: str, main_args: list[str], job_timeout: float) -> None:
+        self.queue = queue
+        self.queue_location = queue_location
+        self.worker_id = worker_id
+        self.main_args = main_args
+        self.job_timeout = job_timeout
+        self.stop = threading.Event()
+
+    def _child_env(self, job: job_queue.Job) -> dict[str, str]:
+        env = dict(os.environ)
+        env.update({
+            "ENV_FILE": job.env_file,
+            "ACCOUNT_NAME": job.account,
+            # ホスト別の枠を同じキューで予約させる
+            "JOB_QUEUE": self.queue_location,
+            "PYTHONIOENCODING": "utf-8",
+        })
+        # 時間予算の指定がなければ、ジョブのタイムアウトで強制終了される前に送信まで終わらせる
+        env.setdefault("RUN_BUDGET_SECONDS", str(max(60, int(self.job_timeout * 0.9))))
+        return env
+
+    def run_job(self, job: job_queue.Job) -> None:
+        logger.info("job #%d (%s) を実行します（%d/%d 回目）", job.id, job.account, job.attempts, job.max_attempts)
+        lost = threading.Event()
+        done = threading.Event()
+        proc: Optional[subprocess.Popen] = None
+
+        def heartbeat() -> None:
+            while not done.wait(JOB_LEASE_SECONDS / 3):
+                try:
+                    if not self.queue.heartbeat(job.id, self.worker_id, JOB_LEASE_SECONDS):
+                        logger.error("job #%d のリースを失いました。実行を中止します", job.id)
+                        lost.set()
+                        if proc is not None:
+                            proc.terminate()
+                        return
+                except Exception as e:  # キューに一時的に届かなくてもリース切れまでは続ける
+                    logger.warning("job #%d のリース延長に失敗しました: %s", job.id, e)
+
+        hb = threading.Thread(target=heartbeat, name=f"heartbeat-{job.id}", daemon=True)
+        hb.start()
+        try:
+            proc = subprocess.Popen(
+                [sys.executable, str(PROJECT_ROOT / "main.py"), *self.main_args],
+                cwd=str(PROJECT_ROOT),
+                env=self._child_env(job),
+            )
+            try:
+                code: Optional[int] = proc.wait(timeout=self.job_timeout)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+                code = None
+        finally:
+            # 起動・待機のどこで例外になっても、リースの延長は必ず止める（子プロセスが残っていれば止める）
+            done.set()
+            hb.join()
+            if proc is not None and proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+        if lost.is_set():
+            return
+        if code == 0:
+            self.queue.complete(job.id, self.worker_id)
+            logger.info("job #%d (%s) が完了しました", job.id, job.account)
+            return
+        error = f"main.py が {self.job_timeout:.0f} 秒で終わりませんでした" if code is None else f"main.py の終了コード {code}"
+        self.queue.fail(job.id, self.worker_id, error, JOB_RETRY_DELAY_SECONDS)
+        logger.warning("job #%d (%s) が失敗しました: %s", job.id, job.account, error)
+
+    def loop(self, drain: bool) -> None:
+        while not self.stop.is_set():
+            try:
+                job = self.queue.claim(self.worker_id, JOB_LEASE_SECONDS)
+            except Exception as e:
+                logger.warning("ジョブキューに接続できません: %s", e)
+                job = None
+                if drain:
+                    return
+            if job is None:
+                if drain:
+                    return
+                self.stop.wait(_IDLE_POLL_SECONDS)
+                continue
+            try:
+                self.run_job(job)
+            except Exception as e:
+                # 1 つのジョブの例外（子プロセスを起動できない、完了をキューに記録できない等）でワーカーを止めない
+                logger.exception("job #%d (%s) の実行中にエラーが発生しました", job.id, job.account)
+                try:
+                    self.queue.fail(job.id, self.worker_id, f"ワーカーのエラー: {e}", JOB_RETRY_DELAY_SECONDS)
+                except Exception as e2:  # 記録できなくてもリース切れ後に再実行される
+                    logger.warning("job #%d の失敗をジョブキューに記録できませんでした: %s", job.id, e2)
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="ジョブキューのワーカー")
+    parser.add_argument("--queue", default=JOB_QUEUE, help="SQLite ファイルのパスまたは queue_server.py の URL")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}")
+    parser.add_argument("--concurrency", type=int, default=1, help="同時に実行するジョブ数")
+    parser.add_argument("--drain", action="store_true", help="実行可能なジョブがなくなったら終了する")
+    parser.add_argument("--job-timeout", type=float, default=1800, help="1 ジョブの最大実行時間（秒）")
+    parser.add_argument("--main-arg", action="append", default=[], help="main.py に渡す引数（複数可）")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    queue = job_queue.open_queue(args.queue, QUEUE_TOKEN)
+    workers = [
+        Worker(queue, args.queue, f"{args.worker_id}/{i}" if args.concurrency > 1 else args.worker_id, args.main_arg, args.job_timeout)
+        for i in range(max(1, args.concurrency))
+    ]
+    threads = [threading.Thread(target=w.loop, args=(args.drain,), name=f"worker-{i}") for i, w in enumerate(workers)]
+    logger.info("ワーカー %s を起動しました（並列数 %d、キュー %s）", args.worker_id, len(workers), args.queue)
+    for t in threads:
+        t.start()
+    try:
+        while any(t.is_alive() for t in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info("停止します（実行中のジョブが終わるまで待ちます）")
+        for w in workers:
+            w.stop.set()
+        for t in threads:
+            t.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))